@@ -6,6 +6,7 @@ from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Header, F
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Literal
 import uvicorn
@@ -17,6 +18,7 @@ from pathlib import Path
 import sys
 import time
 import logging
+import asyncio
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -30,6 +32,8 @@ except ImportError:
     # Fallback vers l'ancien pipeline si predict.py n'existe pas encore
     from inference.pipeline import WeightEstimationPipeline
 
+from inference.batching import DetectionBatcher
+
 # Charger la configuration
 with open("config/api_config.yaml", 'r') as f:
     api_config = yaml.safe_load(f)
@@ -52,30 +56,50 @@ app.add_middleware(
 # Initialiser le pipeline (chargé une seule fois)
 pipeline = None
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialise le pipeline au démarrage"""
-    global pipeline
-    print("Initialisation du pipeline d'IA...")
+# État du chargement exposé par /api/health: loading -> ready | failed
+pipeline_status = "loading"
+pipeline_error = None
+
+# Micro-batching des détections entre requêtes concurrentes
+detection_batcher = None
+
+def initialize_pipeline():
+    """Charge le pipeline (exécuté hors de la boucle d'événements)"""
+    global pipeline, detection_batcher, pipeline_status, pipeline_error
     try:
-        pipeline = WeightEstimationPipeline()
+        loaded = WeightEstimationPipeline()
+        
+        batching_config = api_config['api'].get('batching', {})
+        if batching_config.get('enabled', False) and hasattr(loaded, 'detect_many'):
+            detection_batcher = DetectionBatcher(
+                loaded.detect_many,
+                max_batch_size=batching_config.get('max_batch_size', 8),
+                window_ms=batching_config.get('window_ms', 10)
+            )
+        
+        pipeline = loaded
+        pipeline_status = "ready"
         print("✅ Pipeline initialisé avec succès!")
         
-        # Synchroniser les animaux depuis le backend si configuré
-        if pipeline.backend_sync and api_config.get('backend', {}).get('sync_on_startup', True):
-            try:
-                projet_id = api_config.get('backend', {}).get('default_projet_id')
-                user_id = api_config.get('backend', {}).get('default_user_id')
-                if pipeline.reid:
-                    count = pipeline.backend_sync.sync_animals_to_reid(
-                        pipeline.reid, projet_id, user_id
-                    )
-                    print(f"✅ {count} animaux synchronisés depuis le backend")
-            except Exception as e:
-                print(f"⚠️  Erreur lors de la synchronisation initiale: {e}")
+        # Synchroniser les animaux depuis le backend si configuré (en tâche de fond)
+        if pipeline.backend_sync and pipeline.reid and api_config.get('backend', {}).get('sync_on_startup', True):
+            projet_id = api_config.get('backend', {}).get('default_projet_id')
+            user_id = api_config.get('backend', {}).get('default_user_id')
+            if hasattr(pipeline, 'sync_animals_in_background'):
+                pipeline.sync_animals_in_background(projet_id, user_id)
+            else:
+                pipeline.backend_sync.sync_animals_to_reid(pipeline.reid, projet_id, user_id)
     except Exception as e:
+        pipeline_status = "failed"
+        pipeline_error = str(e)
         print(f"❌ Erreur lors de l'initialisation: {e}")
-        raise
+
+@app.on_event("startup")
+async def startup_event():
+    """Lance le chargement du pipeline sans bloquer le démarrage du serveur"""
+    print("Initialisation du pipeline d'IA...")
+    # Le serveur répond tout de suite: /api/health indique "loading" jusqu'à la fin du chargement
+    app.state.pipeline_loader = asyncio.get_running_loop().run_in_executor(None, initialize_pipeline)
 
 # Modèles Pydantic pour validation
 class PredictRequest(BaseModel):
@@ -142,13 +166,45 @@ async def health_check():
         pass
     
     return {
-        "status": "healthy" if models_loaded else "degraded",
+        "status": "healthy" if models_loaded else ("loading" if pipeline_status == "loading" else "degraded"),
         "models_loaded": models_loaded,
         "gpu_available": gpu_available,
         "version": "3.0.1",
-        "uptime_seconds": int(time.time())  # À améliorer avec un vrai compteur
+        "uptime_seconds": int(time.time()),  # À améliorer avec un vrai compteur
+        "startup": getattr(pipeline, 'startup_report', None),  # Temps de chargement par composant
+        "error": pipeline_error
     }
 
+def auto_register_pig(image: np.ndarray, pig_id: str, detections):
+    """
+    Enregistre le porc identifié par la requête (exécuté dans le threadpool)
+    
+    Returns:
+        Les détections (calculées ici si le batcher n'en a pas fourni)
+    """
+    try:
+        # Récupérer les métadonnées de l'animal depuis le backend
+        if pipeline.backend_sync:
+            animal_data = pipeline.backend_sync.get_animal_by_id(pig_id)
+            if animal_data:
+                metadata = pipeline.backend_sync.format_animal_metadata(animal_data)
+                # Détecter d'abord pour obtenir la bbox
+                if detections is None:
+                    detections = pipeline.detector.detect(image)
+                if detections:
+                    # Utiliser la meilleure détection
+                    best_detection = detections[detections.best_index()]
+                    # Enregistrer le porc
+                    pipeline.auto_register.register_detected_pig(
+                        image, 
+                        best_detection['bbox'],
+                        pig_id,
+                        metadata
+                    )
+    except Exception as e:
+        logger.warning(f"Erreur lors de l'enregistrement automatique: {e}")
+    return detections
+
 @app.post("/api/predict")
 async def predict_weight(request: PredictRequest):
     """
@@ -172,37 +228,24 @@ async def predict_weight(request: PredictRequest):
         # Décoder l'image
         image = decode_base64_image(request.image)
         
+        # Détection regroupée avec les requêtes concurrentes
+        detections = await detection_batcher.detect(image) if detection_batcher else None
+        
         # Si pig_id est fourni, enregistrer automatiquement le porc pour identification future
+        # (appel backend et verrou Re-ID : hors de la boucle d'événements)
         if request.pig_id and request.auto_register and pipeline.auto_register:
-            try:
-                # Récupérer les métadonnées de l'animal depuis le backend
-                if pipeline.backend_sync:
-                    animal_data = pipeline.backend_sync.get_animal_by_id(request.pig_id)
-                    if animal_data:
-                        metadata = pipeline.backend_sync.format_animal_metadata(animal_data)
-                        # Détecter d'abord pour obtenir la bbox
-                        detections = pipeline.detector.detect(image)
-                        if detections:
-                            # Utiliser la première détection (ou la meilleure)
-                            best_detection = max(detections, key=lambda d: d['confidence'])
-                            # Enregistrer le porc
-                            pipeline.auto_register.register_detected_pig(
-                                image, 
-                                best_detection['bbox'],
-                                request.pig_id,
-                                metadata
-                            )
-            except Exception as e:
-                logger.warning(f"Erreur lors de l'enregistrement automatique: {e}")
+            detections = await run_in_threadpool(auto_register_pig, image, request.pig_id, detections)
         
-        # Traiter
-        result = pipeline.predict(
+        # Traiter (hors de la boucle d'événements pour ne pas bloquer le batching)
+        result = await run_in_threadpool(
+            pipeline.predict,
             image=image,
             metadata=request.metadata,
             mode='individual' if request.pig_id else 'group',
             expected_pigs=[request.pig_id] if request.pig_id else None,
             projet_id=request.projet_id,
-            user_id=request.user_id
+            user_id=request.user_id,
+            detections=detections
         )
         
         if not result.get('success'):
@@ -278,14 +321,19 @@ async def batch_predict_weight(request: BatchPredictRequest):
         # Décoder l'image
         image = decode_base64_image(request.image)
         
-        # Traiter
-        result = pipeline.predict(
+        # Détection regroupée avec les requêtes concurrentes
+        detections = await detection_batcher.detect(image) if detection_batcher else None
+        
+        # Traiter (hors de la boucle d'événements pour ne pas bloquer le batching)
+        result = await run_in_threadpool(
+            pipeline.predict,
             image=image,
             metadata=request.metadata,
             mode='group',
             expected_pigs=request.expected_pigs,
             projet_id=request.projet_id,
-            user_id=request.user_id
+            user_id=request.user_id,
+            detections=detections
         )
         
         if not result.get('success'):
@@ -377,8 +425,9 @@ async def predict_weight_video(
             if return_annotated:
                 annotated_path = tmp_path.replace('.mp4', '_annotated.mp4')
             
-            # Traiter la vidéo
-            result = pipeline.predict_video(
+            # Traiter la vidéo (hors de la boucle d'événements : plusieurs secondes de calcul)
+            result = await run_in_threadpool(
+                pipeline.predict_video,
                 video_path=tmp_path,
                 projet_id=projet_id,
                 user_id=user_id,
@@ -440,6 +489,7 @@ async def get_models_info():
     return {
         "detection": {
             "model": pipeline.detector.model.model_name if hasattr(pipeline.detector.model, 'model_name') else "yolov8",
+            "backend": pipeline.detector.backend,
             "version": "v2.1"
         },
         "reid": {
@@ -450,9 +500,25 @@ async def get_models_info():
             "models": ["geometric", "cnn", "transformer"],
             "ensemble": True,
             "version": "v3.0"
-        }
+        },
+        # Modèles chargés à la demande: résidents ou non, taille, inactivité
+        "managed": pipeline.models.status() if hasattr(pipeline, 'models') else None
     }
 
+@app.get("/api/metrics/batching")
+async def get_batching_metrics():
+    """
+    Histogrammes du micro-batching des détections
+    
+    Returns:
+        Tailles de batch, attente en file et durée d'inférence, pour régler
+        `batching.window_ms` face à la latence p99
+    """
+    if detection_batcher is None:
+        return {"enabled": False}
+    
+    return {"enabled": True, **detection_batcher.stats()}
+
 def generate_warnings(capture_conditions: Dict) -> List[str]:
     """Génère des avertissements basés sur les conditions de capture"""
     warnings = []
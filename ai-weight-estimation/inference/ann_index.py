@@ -0,0 +1,259 @@
+"""
+Index approché IVF-PQ pour les grandes galeries Re-ID
+Quantificateur grossier (IVF) + codes produit (PQ) en NumPy / scikit-learn,
+avec re-classement exact des meilleurs candidats
+"""
+
+import os
+import time
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .gallery import FeatureGallery
+
+
+class IVFPQIndex:
+    """
+    Index IVF-PQ sur des features normalisées L2
+
+    - IVF : k-means en `n_lists` cellules ; une requête ne visite que les
+      `n_probe` cellules les plus proches
+    - PQ : le résidu (vecteur - centroïde de sa cellule) est découpé en
+      `n_subvectors` sous-vecteurs, chacun codé sur un octet (256 centroïdes),
+      soit `n_subvectors` octets par porc au lieu de 4 * dim
+    - Les `rerank_k` meilleurs candidats (distance approchée) sont re-classés
+      avec les features exactes de la galerie
+
+    L'index est indexé par identifiant de porc : il reste valide quand la
+    galerie renumérote ses lignes (compaction).
+
+    L'entraînement (k-means) prend de l'ordre de la minute sur une grande
+    galerie : il se fait hors des requêtes (voir PigReID) et seuls les
+    quantificateurs sont sauvegardés (save / load), les porcs étant
+    ré-encodés depuis la galerie au chargement.
+    """
+
+    def __init__(self, dim: int, n_lists: int = 256, n_subvectors: int = 64, n_probe: int = 16,
+                 rerank_k: int = 50, seed: int = 0):
+        if dim % n_subvectors != 0:
+            raise ValueError(f"feature_dim ({dim}) doit être divisible par n_subvectors ({n_subvectors})")
+
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_subvectors = n_subvectors
+        self.sub_dim = dim // n_subvectors
+        self.n_probe = n_probe
+        self.rerank_k = rerank_k
+        self.seed = seed
+
+        self.coarse_centroids: Optional[np.ndarray] = None  # (n_lists, dim)
+        self.codebooks: Optional[np.ndarray] = None  # (n_subvectors, 256, sub_dim)
+        self._list_ids: List[List[str]] = []
+        self._list_codes: List[np.ndarray] = []
+        self._list_bias: List[np.ndarray] = []  # Part de la distance indépendante de la requête
+        self._location: Dict[str, Tuple[int, int]] = {}  # pig_id -> (cellule, position)
+        self.trained_size = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.coarse_centroids is not None
+
+    def __len__(self) -> int:
+        return len(self._location)
+
+    def train(self, vectors: np.ndarray):
+        """Apprend le quantificateur grossier et les codebooks PQ"""
+        from sklearn.cluster import KMeans
+
+        vectors = FeatureGallery.normalize(vectors)
+        n_lists = min(self.n_lists, len(vectors))
+
+        coarse = KMeans(n_clusters=n_lists, n_init=1, random_state=self.seed).fit(vectors)
+        self.coarse_centroids = coarse.cluster_centers_.astype(np.float32)
+        residuals = vectors - self.coarse_centroids[coarse.labels_]
+
+        n_codes = min(256, len(vectors))
+        self.codebooks = np.zeros((self.n_subvectors, 256, self.sub_dim), dtype=np.float32)
+        for j in range(self.n_subvectors):
+            sub = residuals[:, j * self.sub_dim:(j + 1) * self.sub_dim]
+            kmeans = KMeans(n_clusters=n_codes, n_init=1, random_state=self.seed).fit(sub)
+            self.codebooks[j, :n_codes] = kmeans.cluster_centers_
+            # Codes inutilisés (petite galerie): loin de tout sous-vecteur
+            self.codebooks[j, n_codes:] = 1e3
+
+        self._prepare(len(vectors))
+
+    def _prepare(self, trained_size: int):
+        """Termes précalculés et listes vides, après entraînement ou chargement"""
+        n_lists = len(self.coarse_centroids)
+        # Termes précalculés de ||r - c||² = ||q - C||² + (||c||² + 2 C·c) - 2 q·c
+        # (r = q - C résidu de la requête dans la cellule C, c centroïde PQ)
+        self._codebook_norms = (self.codebooks ** 2).sum(axis=2)  # (n_subvectors, 256)
+        coarse_sub = self.coarse_centroids.reshape(n_lists, self.n_subvectors, self.sub_dim)
+        self._cell_terms = np.einsum('lsd,skd->lsk', coarse_sub, self.codebooks)  # (n_lists, n_subvectors, 256)
+
+        self._list_ids = [[] for _ in range(n_lists)]
+        self._list_codes = [np.zeros((0, self.n_subvectors), dtype=np.uint8) for _ in range(n_lists)]
+        self._list_bias = [np.zeros(0, dtype=np.float32) for _ in range(n_lists)]
+        self._location = {}
+        self.trained_size = trained_size
+
+    def save(self, path: str):
+        """Sauvegarde atomique des quantificateurs entraînés (.npz)"""
+        path = Path(path)
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(f, coarse_centroids=self.coarse_centroids, codebooks=self.codebooks,
+                     trained_size=self.trained_size, seed=self.seed)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, dim: int, n_probe: int = 16, rerank_k: int = 50) -> 'IVFPQIndex':
+        """
+        Index entraîné et vide (les porcs sont ajoutés ensuite avec add)
+
+        Raises:
+            ValueError: Fichier incompatible avec `dim`
+        """
+        with np.load(path) as data:
+            coarse_centroids = data['coarse_centroids'].astype(np.float32)
+            codebooks = data['codebooks'].astype(np.float32)
+            trained_size, seed = int(data['trained_size']), int(data['seed'])
+        n_lists, n_subvectors = len(coarse_centroids), len(codebooks)
+        if coarse_centroids.shape[1] != dim:
+            raise ValueError(f"Index {path} construit pour dim={coarse_centroids.shape[1]}, attendu {dim}")
+
+        index = cls(dim, n_lists=n_lists, n_subvectors=n_subvectors, n_probe=n_probe,
+                    rerank_k=rerank_k, seed=seed)
+        index.coarse_centroids, index.codebooks = coarse_centroids, codebooks
+        index._prepare(trained_size)
+        return index
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Cellule IVF et codes PQ (N, n_subvectors) uint8"""
+        lists = (vectors @ self.coarse_centroids.T * -2 + (self.coarse_centroids ** 2).sum(1)).argmin(axis=1)
+        residuals = vectors - self.coarse_centroids[lists]
+
+        codes = np.empty((len(vectors), self.n_subvectors), dtype=np.uint8)
+        for j in range(self.n_subvectors):
+            sub = residuals[:, j * self.sub_dim:(j + 1) * self.sub_dim]
+            codebook = self.codebooks[j]
+            # ||a - b||² sans le terme ||a||² (constant pour l'argmin)
+            distances = (codebook ** 2).sum(axis=1) - 2 * sub @ codebook.T
+            codes[:, j] = distances.argmin(axis=1)
+        return lists, codes
+
+    def add(self, pig_ids: Sequence[str], vectors: np.ndarray):
+        """Ajoute (ou remplace) des porcs sans réentraîner"""
+        if not len(pig_ids):
+            return
+        vectors = FeatureGallery.normalize(np.asarray(vectors).reshape(-1, self.dim))
+        lists, codes = self._encode(vectors)
+
+        for pig_id in pig_ids:
+            self.remove(pig_id)
+
+        # Une seule concaténation par cellule touchée
+        for cell in np.unique(lists).tolist():
+            members = np.flatnonzero(lists == cell)
+            for i in members.tolist():
+                self._location[pig_ids[i]] = (cell, len(self._list_ids[cell]))
+                self._list_ids[cell].append(pig_ids[i])
+            self._list_codes[cell] = np.vstack([self._list_codes[cell], codes[members]])
+            self._list_bias[cell] = np.concatenate([self._list_bias[cell], self._bias(cell, codes[members])])
+
+    def _bias(self, cell: int, codes: np.ndarray) -> np.ndarray:
+        """Somme sur les sous-vecteurs de ||c||² + 2 C·c pour chaque code"""
+        table = self._codebook_norms + 2 * self._cell_terms[cell]
+        return table[np.arange(self.n_subvectors), codes].sum(axis=1).astype(np.float32)
+
+    def remove(self, pig_id: str) -> bool:
+        """Retire un porc (échange avec le dernier élément de sa cellule)"""
+        location = self._location.pop(pig_id, None)
+        if location is None:
+            return False
+
+        cell, position = location
+        ids, codes, bias = self._list_ids[cell], self._list_codes[cell], self._list_bias[cell]
+        last = len(ids) - 1
+        if position != last:
+            ids[position] = ids[last]
+            codes[position] = codes[last]
+            bias[position] = bias[last]
+            self._location[ids[position]] = (cell, position)
+        ids.pop()
+        self._list_codes[cell] = codes[:last]
+        self._list_bias[cell] = bias[:last]
+        return True
+
+    def candidates(self, query: np.ndarray) -> List[str]:
+        """Meilleurs candidats d'une requête normalisée (distance asymétrique PQ)"""
+        coarse_distances = ((self.coarse_centroids - query) ** 2).sum(axis=1)
+        probe = [cell for cell in np.argsort(coarse_distances)[:self.n_probe].tolist() if self._list_ids[cell]]
+        if not probe:
+            return []
+
+        # Seule partie dépendante de la requête: q·c pour chaque centroïde PQ
+        query_terms = np.einsum('sd,skd->sk', query.reshape(self.n_subvectors, self.sub_dim), self.codebooks)
+
+        codes = np.concatenate([self._list_codes[cell] for cell in probe])
+        distances = (
+            np.repeat(coarse_distances[probe], [len(self._list_ids[cell]) for cell in probe])
+            + np.concatenate([self._list_bias[cell] for cell in probe])
+            - 2 * query_terms[np.arange(self.n_subvectors), codes].sum(axis=1)
+        )
+        ids = [pig_id for cell in probe for pig_id in self._list_ids[cell]]
+
+        top = np.argsort(distances, kind='stable')[:self.rerank_k]
+        return [ids[i] for i in top.tolist()]
+
+    def search(self, queries: np.ndarray, gallery: FeatureGallery,
+               threshold: float = 0.0) -> List[Optional[Tuple[str, float]]]:
+        """
+        Meilleur porc pour chaque requête, re-classé avec les features exactes
+
+        Args:
+            queries: Features (Q, dim)
+            gallery: Galerie contenant les features exactes
+            threshold: Similarité minimum
+
+        Returns:
+            Pour chaque requête, (pig_id, similarité) ou None
+        """
+        queries = FeatureGallery.normalize(np.asarray(queries).reshape(-1, self.dim))
+        results = []
+        for query in queries:
+            # Re-classement exact restreint aux candidats (lignes de la galerie)
+            results.append(gallery.search(query[None], threshold, candidate_ids=self.candidates(query))[0])
+        return results
+
+
+def recall_report(index: IVFPQIndex, gallery: FeatureGallery, queries: np.ndarray,
+                  n_probes: Sequence[int] = (1, 4, 8, 16, 32)) -> List[Dict]:
+    """
+    Recall@1 et latence de l'index face à la recherche exacte
+
+    Returns:
+        Une ligne par valeur de n_probe (plus la référence exacte)
+    """
+    # Requêtes une par une pour les deux méthodes (cas d'un porc par image)
+    start = time.perf_counter()
+    exact = [gallery.search(query[None])[0] for query in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    rows = [{'method': 'exact', 'n_probe': None, 'recall@1': 1.0, 'latency_ms': round(exact_ms, 3)}]
+
+    original_probe = index.n_probe
+    try:
+        for n_probe in n_probes:
+            index.n_probe = n_probe
+            start = time.perf_counter()
+            approx = [index.search(query[None], gallery)[0] for query in queries]
+            latency = (time.perf_counter() - start) * 1000 / len(queries)
+            hits = sum(1 for a, e in zip(approx, exact) if a is not None and e is not None and a[0] == e[0])
+            rows.append({'method': 'ivfpq', 'n_probe': n_probe, 'recall@1': round(hits / len(queries), 4),
+                         'latency_ms': round(latency, 3)})
+    finally:
+        index.n_probe = original_probe
+
+    return rows
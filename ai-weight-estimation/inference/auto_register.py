@@ -13,14 +13,17 @@ logger = logging.getLogger(__name__)
 class AutoRegister:
     """Gère l'enregistrement automatique des porcs pour identification future"""
     
-    def __init__(self, reid_system):
+    def __init__(self, reid_system, mirror_systems: Optional[List] = None):
         """
         Initialise le système d'enregistrement automatique
         
         Args:
             reid_system: Instance de PigReID
+            mirror_systems: Autres PigReID (autres espaces d'embeddings, ex: Re-ID neck
+                            de la vidéo) où chaque porc est aussi enregistré
         """
         self.reid = reid_system
+        self.mirror_systems = mirror_systems or []
     
     def register_detected_pig(self, image: np.ndarray, bbox: List[int], 
                             animal_id: str, metadata: Dict) -> bool:
@@ -39,6 +42,11 @@ class AutoRegister:
         try:
             # Enregistrer dans le système Re-ID
             self.reid.register_pig(animal_id, image, bbox, metadata)
+            for mirror in self.mirror_systems:
+                try:
+                    mirror.register_pig(animal_id, image, bbox, metadata)
+                except Exception as e:
+                    logger.warning(f"Enregistrement secondaire du porc {animal_id} impossible: {e}")
             logger.info(f"Porc {animal_id} ({metadata.get('code', 'N/A')}) enregistré avec succès")
             return True
         except Exception as e:
@@ -62,46 +70,28 @@ class AutoRegister:
         if not possible_animals or not self.reid:
             return None
         
-        # Extraire les features du porc détecté
+        # Extraire les features du porc détecté (déjà calculées par l'identification
+        # de la même requête, via le cache d'embeddings)
         try:
             query_features = self.reid.extract_features(image, bbox)
         except Exception as e:
             logger.error(f"Erreur lors de l'extraction des features: {e}")
             return None
         
-        best_match = None
-        best_score = 0.0
         threshold = 0.5  # Seuil plus bas pour les suggestions
+        animals = {animal.get('id'): animal for animal in possible_animals if animal.get('id')}
         
-        # Comparer avec les animaux enregistrés
-        for animal in possible_animals:
-            animal_id = animal.get('id')
-            if not animal_id or animal_id not in self.reid.pig_database:
-                continue
-            
-            pig_data = self.reid.pig_database[animal_id]
-            features = pig_data.get('features')
-            
-            if features is None:
-                continue
-            
-            # Calculer la similarité
-            try:
-                similarity = np.dot(query_features, features) / (
-                    np.linalg.norm(query_features) * np.linalg.norm(features)
-                )
-                
-                if similarity > best_score and similarity >= threshold:
-                    best_score = similarity
-                    best_match = {
-                        'animal_id': animal_id,
-                        'code': animal.get('code', ''),
-                        'name': animal.get('name', ''),
-                        'similarity': float(similarity)
-                    }
-            except Exception as e:
-                logger.error(f"Erreur lors du calcul de similarité: {e}")
-                continue
+        # Comparer avec les animaux enregistrés : un produit matriciel restreint aux candidats
+        with self.reid.lock:
+            match = self.reid.gallery.search(query_features[None], threshold, candidate_ids=list(animals))[0]
+        if match is None:
+            return None
         
-        return best_match
-
+        animal_id, similarity = match
+        animal = animals[animal_id]
+        return {
+            'animal_id': animal_id,
+            'code': animal.get('code', ''),
+            'name': animal.get('name', ''),
+            'similarity': float(similarity)
+        }
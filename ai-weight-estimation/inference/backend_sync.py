@@ -5,10 +5,11 @@ Charge les animaux depuis l'API backend et les enregistre dans le système Re-ID
 
 import requests
 from typing import List, Dict, Optional
-import yaml
 from pathlib import Path
 import logging
 
+from .startup import load_config
+
 logger = logging.getLogger(__name__)
 
 class BackendSync:
@@ -22,8 +23,7 @@ class BackendSync:
             config_path: Chemin vers le fichier de configuration
         """
         # Charger la configuration
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        self.config = load_config(config_path)
         
         # URL du backend NestJS
         backend_config = self.config.get('backend', {})
@@ -124,20 +124,11 @@ class BackendSync:
                 # Formater les métadonnées
                 metadata = self.format_animal_metadata(animal)
                 
-                # Vérifier si l'animal est déjà enregistré
-                if animal_id in reid_system.pig_database:
-                    # Mettre à jour les métadonnées
-                    reid_system.pig_database[animal_id]['metadata'] = metadata
+                # Mise à jour sous le verrou Re-ID (thread d'arrière-plan) ; un animal sans
+                # image reste en attente, ses features seront ajoutées à la première détection
+                if reid_system.sync_metadata(animal_id, metadata):
                     logger.debug(f"Métadonnées mises à jour pour l'animal {animal_id}")
                 else:
-                    # L'animal n'a pas encore d'image associée dans Re-ID
-                    # On l'enregistre avec des métadonnées vides pour les features
-                    # Les features seront ajoutées lors de la première détection
-                    reid_system.pig_database[animal_id] = {
-                        'features': None,  # Sera rempli lors de la première détection
-                        'metadata': metadata,
-                        'bbox': None
-                    }
                     logger.debug(f"Animal {animal_id} enregistré dans Re-ID (en attente d'image)")
                 
                 synced_count += 1
@@ -188,15 +179,7 @@ class BackendSync:
         
         metadata = self.format_animal_metadata(animal)
         
-        if animal_id in reid_system.pig_database:
-            reid_system.pig_database[animal_id]['metadata'] = metadata
-            return True
-        else:
-            # Créer une entrée si elle n'existe pas
-            reid_system.pig_database[animal_id] = {
-                'features': None,
-                'metadata': metadata,
-                'bbox': None
-            }
-            return True
+        # Met à jour le porc enregistré, ou crée une entrée en attente d'image
+        reid_system.sync_metadata(animal_id, metadata)
+        return True
 
@@ -0,0 +1,250 @@
+"""
+Backends d'exécution des modèles par crop (Re-ID, poids, points clés)
+torch (eager ou TorchScript gelé, précision configurable) ou ONNX Runtime
+(CPU), derrière la même interface : batch (N, 3, H, W) -> sorties float32
+"""
+
+import inspect
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+import torch
+
+from .compiled import checkpoint_digest, compile_for_inference, load_compiled
+from .cpu_budget import current_thread_budget
+from .precision import InferencePrecision
+
+BACKENDS = ('torch', 'onnxruntime')
+ONNX_OPSET = 17
+# Métadonnées écrites à l'export: le graphe est rejeté s'il ne correspond plus au checkpoint
+CHECKPOINT_METADATA = 'checkpoint_sha256'
+
+
+class InferenceBackend(ABC):
+    """Exécute un modèle sur un batch de crops"""
+
+    name = 'base'
+
+    @abstractmethod
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+            batch: Tensor (N, 3, H, W) normalisé
+
+        Returns:
+            Sorties float32 (N, ...) sur le device du batch
+        """
+
+
+class TorchBackend(InferenceBackend):
+    """Modèle torch (nn.Module ou ScriptModule) dans la précision choisie"""
+
+    name = 'torch'
+
+    def __init__(self, model, precision):
+        """
+        Args:
+            model: Modèle en mode eval (éventuellement compilé, voir compile_for_inference)
+            precision: InferencePrecision du modèle
+        """
+        self.model = model
+        self.precision = precision
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        return self.precision.run(self.model, batch)
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """Graphe ONNX exporté (scripts/export_onnx.py) exécuté par ONNX Runtime sur le CPU"""
+
+    name = 'onnxruntime'
+
+    def __init__(self, onnx_path: str, checkpoint_path: Optional[str] = None, input_shape: Optional[Sequence[int]] = None,
+                 num_threads: int = 0, optimization_level: str = 'all'):
+        """
+        Args:
+            onnx_path: Graphe exporté
+            checkpoint_path: Checkpoint dont le graphe doit provenir (vérifié via les métadonnées)
+            input_shape: Forme d'entrée (C, H, W) attendue par le composant (vérifiée)
+            num_threads: Threads intra-op (0 = budget du worker, voir cpu_budget)
+            optimization_level: Optimisations de graphe: disable, basic, extended ou all
+        """
+        import onnxruntime as ort
+
+        if not Path(onnx_path).exists():
+            raise FileNotFoundError(f"Modèle ONNX non trouvé: {onnx_path}")
+
+        levels = {
+            'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        }
+        if optimization_level not in levels:
+            raise ValueError(f"Niveau d'optimisation ONNX inconnu: {optimization_level}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = levels[optimization_level]
+        if not num_threads:
+            budget = current_thread_budget()
+            num_threads = budget['intra_op'] if budget else 0
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(str(onnx_path), sess_options=options,
+                                            providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.num_threads = num_threads
+        self.size_bytes = os.path.getsize(onnx_path)
+
+        if input_shape is not None and list(model_input.shape[1:]) != [int(d) for d in input_shape]:
+            raise ValueError(f"{onnx_path} attend des entrées {model_input.shape[1:]}, "
+                             f"le modèle est configuré en {list(input_shape)} (réexporter)")
+
+        if checkpoint_path and Path(checkpoint_path).exists():
+            metadata = self.session.get_modelmeta().custom_metadata_map
+            exported_from = metadata.get(CHECKPOINT_METADATA)
+            if exported_from != checkpoint_digest(checkpoint_path):
+                raise ValueError(f"{onnx_path} n'a pas été exporté depuis {checkpoint_path} (réexporter)")
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        inputs = np.ascontiguousarray(batch.detach().cpu().numpy(), dtype=np.float32)
+        output = self.session.run(None, {self.input_name: inputs})[0]
+        return torch.from_numpy(output).to(batch.device)
+
+
+def default_onnx_path(model_path: str) -> str:
+    """Graphe ONNX à côté du checkpoint (même nom, extension .onnx)"""
+    return str(Path(model_path).with_suffix('.onnx'))
+
+
+def load_backend(model_config: Dict, model_path: str, load_model: Callable[[], torch.nn.Module],
+                 input_shape: Sequence[int], device: torch.device, config: Dict,
+                 name: str = 'model') -> InferenceBackend:
+    """
+    Backend configuré pour un modèle
+
+    Le modèle torch n'est construit que si le backend torch est retenu et que
+    le cache compilé ne le fournit pas : avec ONNX Runtime, le worker ne garde
+    que la session. Un graphe absent, exporté
+    depuis un autre checkpoint ou pour une autre taille d'entrée retombe sur torch.
+
+    Args:
+        model_config: Section du modèle (backend, onnx_path, onnx_num_threads,
+                      onnx_optimization, precision)
+        model_path: Checkpoint du modèle
+        load_model: Construction du modèle torch depuis le checkpoint
+        input_shape: Forme d'une entrée (C, H, W)
+        device: Device du modèle torch
+        config: Configuration complète (sections precision_calibration et compilation)
+        name: Nom du modèle pour les messages
+    """
+    backend = model_config.get('backend', 'torch')
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend inconnu pour {name}: {backend} (attendu: {', '.join(BACKENDS)})")
+
+    if backend == 'onnxruntime':
+        onnx_path = model_config.get('onnx_path') or default_onnx_path(model_path)
+        try:
+            runner = OnnxRuntimeBackend(
+                onnx_path,
+                checkpoint_path=model_path,
+                input_shape=input_shape,
+                num_threads=model_config.get('onnx_num_threads', 0),
+                optimization_level=model_config.get('onnx_optimization', 'all')
+            )
+            print(f"✅ {name}: backend ONNX Runtime ({onnx_path}, {runner.num_threads or 'auto'} threads)")
+            return runner
+        except (FileNotFoundError, ValueError, ImportError) as e:
+            print(f"⚠️  {name}: backend ONNX Runtime indisponible ({e})")
+            print(f"💡 Exportez le modèle avec scripts/export_onnx.py --models {name}. Retour au backend torch.")
+
+    # Précision (fp32/bf16) et format mémoire, bf16 soumis à la calibration du checkpoint
+    precision = InferencePrecision(model_config.get('precision', {}), device, model_path,
+                                   config.get('precision_calibration', {}), name=name)
+    compilation = config.get('compilation', {})
+    if config.get('startup', {}).get('mmap_weights', False) and torch.device(device).type == 'cpu':
+        private = [label for label, active in (('compilation TorchScript', compilation.get('enabled', False)),
+                                               ('channels_last', precision.channels_last)) if active]
+        if private:
+            print(f"⚠️  {name}: {' et '.join(private)} copient les poids dans chaque worker "
+                  "(startup.mmap_weights sans effet pour ce modèle)")
+
+    # TorchScript gelé sur CPU si activé (section compilation) : en cache, le modèle
+    # eager n'est pas construit
+    model = load_compiled(model_path, input_shape, device, compilation, name=name, variant=precision.tag)
+    if model is None:
+        model = precision.prepare(load_model())
+        model.eval()
+        model = compile_for_inference(model, model_path, input_shape, device, compilation,
+                                      name=name, variant=precision.tag)
+    return TorchBackend(model, precision)
+
+
+def export_onnx(model: torch.nn.Module, output_path: str, input_shape: Sequence[int],
+                checkpoint_path: Optional[str] = None, opset: int = ONNX_OPSET) -> Path:
+    """
+    Exporte un modèle eager en ONNX (axe batch dynamique)
+
+    Args:
+        model: Modèle eager en mode eval, fp32
+        output_path: Fichier .onnx
+        input_shape: Forme d'une entrée (C, H, W)
+        checkpoint_path: Checkpoint d'origine, son empreinte est écrite dans les métadonnées
+        opset: Version d'opset ONNX
+
+    Returns:
+        Chemin du fichier écrit
+    """
+    import onnx
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    example = torch.randn(2, *input_shape)
+    # torch >= 2.5: exporteur TorchScript explicite (l'exporteur dynamo demande onnxscript)
+    legacy = {'dynamo': False} if 'dynamo' in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            example,
+            str(output_path),
+            export_params=True,
+            opset_version=opset,
+            do_constant_folding=True,  # Batch norm repliées dans les convolutions
+            input_names=['input'],
+            output_names=['output'],
+            dynamic_axes={'input': {0: 'batch_size'}, 'output': {0: 'batch_size'}},
+            **legacy
+        )
+
+    graph = onnx.load(str(output_path))
+    onnx.checker.check_model(graph)
+    metadata = {'input_shape': 'x'.join(str(int(d)) for d in input_shape)}
+    if checkpoint_path and Path(checkpoint_path).exists():
+        metadata[CHECKPOINT_METADATA] = checkpoint_digest(checkpoint_path)
+    for key, value in metadata.items():
+        entry = graph.metadata_props.add()
+        entry.key, entry.value = key, value
+    onnx.save(graph, str(output_path))
+    return output_path
+
+
+def onnx_parity(model: torch.nn.Module, onnx_path: str, input_shape: Sequence[int],
+                batch_size: int = 4, seed: int = 0) -> Dict[str, float]:
+    """Écarts entre le modèle torch (fp32) et le graphe ONNX sur un batch aléatoire"""
+    generator = torch.Generator().manual_seed(seed)
+    batch = torch.randn(batch_size, *input_shape, generator=generator)
+    with torch.inference_mode():
+        reference = model(batch).float()
+    output = OnnxRuntimeBackend(onnx_path)(batch)
+    error = (output - reference).abs()
+    return {
+        'max_abs_error': float(error.max()),
+        'mean_abs_error': float(error.mean()),
+        'output_scale': float(reference.abs().max())
+    }
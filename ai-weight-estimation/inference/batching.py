@@ -0,0 +1,140 @@
+"""
+Micro-batching dynamique des détections entre requêtes concurrentes
+Regroupe les images reçues pendant une courte fenêtre pour un seul forward batché
+"""
+
+import asyncio
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .detections import DetectionBatch
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Histogramme à bornes fixes (compteurs cumulés façon Prometheus)"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Dernier bucket = +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        """Enregistre une observation"""
+        index = int(np.searchsorted(self.buckets, value, side='left'))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> Dict:
+        """Export JSON: compteurs cumulés par borne supérieure"""
+        cumulative = np.cumsum(self.counts).tolist()
+        buckets = {str(bound): cumulative[i] for i, bound in enumerate(self.buckets)}
+        buckets['+Inf'] = cumulative[-1]
+        return {
+            'buckets': buckets,
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'mean': round(self.sum / self.count, 3) if self.count else 0.0
+        }
+
+
+class DetectionBatcher:
+    """
+    Planificateur de micro-batching devant la détection
+
+    Chaque requête dépose son image dans une file ; une tâche unique collecte
+    les images pendant `window_ms` (ou jusqu'à `max_batch_size`), exécute un seul
+    forward batché dans un thread dédié, puis réveille chaque coroutine en attente
+    avec ses propres détections.
+    """
+
+    def __init__(self, detect_fn: Callable[[List[np.ndarray]], List[DetectionBatch]],
+                 max_batch_size: int = 8, window_ms: float = 10.0):
+        """
+        Args:
+            detect_fn: Détection batchée (ex: WeightEstimationPipeline.detect_many)
+            max_batch_size: Taille maximum d'un batch
+            window_ms: Attente maximum après la première image d'un batch
+        """
+        self.detect_fn = detect_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window_s = max(0.0, float(window_ms)) / 1000.0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Un seul thread: les forwards batchés ne se chevauchent pas
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='detection-batcher')
+
+        self.batch_size_histogram = Histogram([1, 2, 4, 8, 16, 32])
+        self.queue_wait_histogram = Histogram([1, 2, 5, 10, 20, 50, 100, 250])  # ms
+        self.inference_histogram = Histogram([10, 25, 50, 100, 250, 500, 1000, 2500])  # ms
+
+    async def detect(self, image: np.ndarray) -> DetectionBatch:
+        """Détecte les porcs d'une image en la regroupant avec les requêtes concurrentes"""
+        if self._worker is None or self._worker.done():
+            self._start()
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, future, time.perf_counter()))
+        return await future
+
+    def _start(self):
+        """Démarre la tâche de collecte dans la boucle courante"""
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        """Boucle de collecte et d'exécution des batchs"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window_s
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            dispatch_time = time.perf_counter()
+            self.batch_size_histogram.observe(len(batch))
+            for _, _, enqueued_at in batch:
+                self.queue_wait_histogram.observe((dispatch_time - enqueued_at) * 1000)
+
+            images = [image for image, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self.detect_fn, images)
+            except Exception as e:
+                logger.error(f"Erreur lors de la détection batchée ({len(batch)} images): {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.inference_histogram.observe((time.perf_counter() - dispatch_time) * 1000)
+
+            for (_, future, _), detections in zip(batch, results):
+                # La requête a pu être annulée (client déconnecté) pendant l'attente
+                if not future.done():
+                    future.set_result(detections)
+
+    def stats(self) -> Dict:
+        """Histogrammes pour régler la fenêtre face à la latence p99"""
+        return {
+            'max_batch_size': self.max_batch_size,
+            'window_ms': self.window_s * 1000,
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'batch_size': self.batch_size_histogram.snapshot(),
+            'queue_wait_ms': self.queue_wait_histogram.snapshot(),
+            'inference_ms': self.inference_histogram.snapshot()
+        }
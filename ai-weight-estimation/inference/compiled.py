@@ -0,0 +1,179 @@
+"""
+Chemin d'inférence compilé (CPU)
+Modèles TorchScript gelés (batch norm fusionnées dans les convolutions),
+mis en cache sur disque à côté du checkpoint
+"""
+
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import torch
+import torch.nn as nn
+
+# Empreintes des checkpoints déjà calculées, par (chemin, taille, date de modification)
+_digests: Dict[Tuple[str, int, float], str] = {}
+
+
+def checkpoint_digest(model_path: str) -> str:
+    """SHA-256 du fichier de checkpoint (calculé une fois par processus et par version du fichier)"""
+    stat = os.stat(model_path)
+    key = (str(Path(model_path).resolve()), stat.st_size, stat.st_mtime)
+    if key not in _digests:
+        digest = hashlib.sha256()
+        with open(model_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        _digests[key] = digest.hexdigest()
+    return _digests[key]
+
+
+def compiled_cache_path(model_path: str, input_shape: Sequence[int], cache_dir: Optional[str] = None,
+                        variant: str = '') -> Path:
+    """
+    Fichier TorchScript correspondant à un checkpoint et une taille d'entrée
+
+    Le nom contient l'empreinte du checkpoint, la forme (C, H, W) et la version
+    de torch : un nouveau checkpoint ou une mise à jour de torch donne un
+    nouveau fichier au lieu de recharger un modèle périmé. `variant` distingue
+    les compilations d'un même checkpoint (ex: poids channels_last).
+    """
+    shape = 'x'.join(str(int(d)) for d in input_shape)
+    version = torch.__version__.split('+')[0]
+    suffix = f"-{variant}" if variant else ''
+    name = f"{Path(model_path).stem}-{checkpoint_digest(model_path)[:16]}-{shape}{suffix}-torch{version}.ts"
+    directory = Path(cache_dir) if cache_dir else Path(model_path).parent / 'compiled'
+    return directory / name
+
+
+def freeze_model(model: nn.Module, example: torch.Tensor, optimize: bool = False) -> torch.jit.ScriptModule:
+    """
+    Trace puis gèle le modèle : poids en constantes, batch norm fusionnées
+    dans les convolutions, dropout supprimés
+
+    Args:
+        model: Modèle en mode eval
+        example: Entrée d'exemple (N, C, H, W) ; la taille du batch reste libre
+        optimize: Appliquer aussi torch.jit.optimize_for_inference (MKLDNN)
+    """
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+    frozen = torch.jit.freeze(traced.eval())
+    if optimize:
+        frozen = torch.jit.optimize_for_inference(frozen)
+    return frozen
+
+
+def _cache_file(model_path: Optional[str], input_shape: Sequence[int], settings: Dict,
+                variant: str) -> Optional[Path]:
+    """Fichier de cache de la compilation (None sans checkpoint sur disque)"""
+    if not model_path or not Path(model_path).exists():
+        return None
+    cache_path = compiled_cache_path(model_path, input_shape, settings.get('cache_dir') or None, variant)
+    if settings.get('optimize_for_inference', False):
+        cache_path = cache_path.with_name(cache_path.stem + '-mkldnn.ts')
+    return cache_path
+
+
+def load_compiled(model_path: Optional[str], input_shape: Sequence[int], device: torch.device,
+                  settings: Optional[Dict] = None, name: str = 'model', variant: str = ''):
+    """
+    Modèle compilé déjà en cache, sans construire le modèle eager
+
+    Returns:
+        ScriptModule gelé, ou None (compilation désactivée, hors CPU, cache
+        absent ou illisible) : construire alors le modèle et appeler
+        compile_for_inference
+    """
+    settings = settings or {}
+    if not settings.get('enabled', False) or torch.device(device).type != 'cpu':
+        return None
+    cache_path = _cache_file(model_path, input_shape, settings, variant)
+    if cache_path is None or not cache_path.exists():
+        return None
+
+    start = time.perf_counter()
+    try:
+        compiled = torch.jit.load(str(cache_path), map_location='cpu')
+    except Exception as e:
+        print(f"⚠️  Cache compilé illisible pour {name} ({e}), nouvelle compilation.")
+        return None
+    print(f"✅ {name}: modèle compilé chargé depuis le cache ({time.perf_counter() - start:.2f} s)")
+    return compiled
+
+
+def compile_for_inference(model: nn.Module, model_path: Optional[str], input_shape: Sequence[int],
+                          device: torch.device, settings: Optional[Dict] = None, name: str = 'model',
+                          variant: str = ''):
+    """
+    Version compilée du modèle si la section `compilation` l'active, sinon le modèle inchangé
+
+    Le fichier en cache est rechargé tel quel par les workers suivants ; il
+    n'est créé qu'après avoir vérifié que le modèle gelé donne les mêmes
+    sorties que le modèle eager. Tout échec retombe sur le modèle eager.
+
+    Args:
+        model: Modèle eager déjà chargé (mode eval)
+        model_path: Checkpoint du modèle (None ou absent: compilé sans cache)
+        input_shape: Forme d'une entrée (C, H, W)
+        device: Device du modèle (seul le CPU est compilé)
+        settings: Section `compilation` de model_config.yaml
+        name: Nom du modèle pour les messages
+        variant: Variante du modèle eager (voir compiled_cache_path)
+
+    Returns:
+        Module appelable comme le modèle (ScriptModule gelé ou modèle d'origine)
+    """
+    settings = settings or {}
+    if not settings.get('enabled', False):
+        return model
+    if torch.device(device).type != 'cpu':
+        print(f"ℹ️  Compilation TorchScript réservée au CPU: {name} reste en mode eager.")
+        return model
+
+    optimize = settings.get('optimize_for_inference', False)
+    cache_path = _cache_file(model_path, input_shape, settings, variant)
+    cached = load_compiled(model_path, input_shape, device, settings, name=name, variant=variant)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    try:
+        example = torch.randn(2, *input_shape)
+        compiled = freeze_model(model, example, optimize=optimize)
+        with torch.inference_mode():
+            error = (compiled(example) - model(example)).abs().max().item()
+        if error > settings.get('tolerance', 1e-3):
+            print(f"⚠️  {name}: écart eager/compilé de {error:.2e}, modèle eager conservé.")
+            return model
+    except Exception as e:
+        print(f"⚠️  Compilation TorchScript impossible pour {name} ({e}), modèle eager conservé.")
+        return model
+
+    if cache_path is not None:
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            # Écriture atomique: plusieurs workers peuvent compiler en même temps
+            tmp_path = cache_path.with_name(f".{cache_path.name}.{os.getpid()}.tmp")
+            torch.jit.save(compiled, str(tmp_path))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"⚠️  Cache compilé non écrit pour {name} ({e})")
+
+    print(f"✅ {name}: modèle compilé en {time.perf_counter() - start:.2f} s (écart max {error:.1e})")
+    return compiled
+
+
+def compiled_bytes(module) -> int:
+    """Taille des constantes tensor d'un module gelé (ses poids ne sont plus des paramètres)"""
+    graph = getattr(module, 'graph', None)
+    if graph is None:
+        return 0
+    total = 0
+    for node in graph.findAllNodes('prim::Constant'):
+        if node.output().type().kind() == 'TensorType':
+            tensor = node.output().toIValue()
+            total += tensor.numel() * tensor.element_size()
+    return total
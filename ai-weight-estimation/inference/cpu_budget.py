@@ -0,0 +1,132 @@
+"""
+Budget de threads CPU par worker
+Répartit les cœurs entre les workers de l'API (torch, OpenCV, ONNX Runtime)
+au lieu de laisser chaque bibliothèque de chaque worker utiliser tous les cœurs
+"""
+
+import os
+from typing import Dict, List, Optional
+
+import cv2
+
+# Budget appliqué dans ce processus (une seule fois: les threads inter-op de
+# torch ne sont plus réglables après le premier calcul parallèle)
+_applied: Optional[Dict] = None
+# Fichier de slot gardé ouvert (verrou) pendant toute la vie du worker
+_slot_file = None
+
+
+def available_cpus() -> List[int]:
+    """Cœurs utilisables par ce processus (respecte taskset/cgroups)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def compute_thread_budget(num_workers: int = 1, threads_per_worker: int = 0, interop_threads: int = 1,
+                          opencv_threads: int = 0, cpu_count: Optional[int] = None) -> Dict[str, int]:
+    """
+    Threads par worker pour que `num_workers` workers se partagent la machine
+
+    Args:
+        num_workers: Workers qui tournent en même temps sur la machine
+        threads_per_worker: Threads intra-op forcés (0: cœurs / workers)
+        interop_threads: Threads inter-op torch
+        opencv_threads: Threads OpenCV (0: comme intra-op)
+        cpu_count: Cœurs disponibles (défaut: affinité du processus)
+
+    Returns:
+        Dict avec intra_op, inter_op et opencv
+    """
+    cpus = cpu_count or len(available_cpus())
+    intra_op = threads_per_worker or max(1, cpus // max(1, num_workers))
+    return {
+        'intra_op': intra_op,
+        'inter_op': max(1, interop_threads),
+        'opencv': opencv_threads or intra_op
+    }
+
+
+def claim_worker_slot(num_workers: int, lock_dir: str = "/tmp") -> Optional[int]:
+    """
+    Numéro de worker (0..num_workers-1) unique sur la machine
+
+    Les workers uvicorn ne connaissent pas leur rang : chacun verrouille le
+    premier fichier de slot libre et le garde jusqu'à sa fin (libéré par le
+    système si le worker meurt). None si aucun slot n'est libre ou hors POSIX.
+    """
+    global _slot_file
+    try:
+        import fcntl
+    except ImportError:
+        return None
+
+    for slot in range(num_workers):
+        handle = open(os.path.join(lock_dir, f"pig-ai-worker-{slot}.lock"), 'w')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        _slot_file = handle
+        return slot
+    return None
+
+
+def pin_worker(slot: int, threads: int) -> Optional[List[int]]:
+    """Restreint le processus aux cœurs de son slot (Linux), retourne les cœurs retenus"""
+    if not hasattr(os, 'sched_setaffinity'):
+        return None
+    cpus = available_cpus()
+    start = (slot * threads) % len(cpus)
+    pinned = [cpus[(start + i) % len(cpus)] for i in range(min(threads, len(cpus)))]
+    os.sched_setaffinity(0, pinned)
+    return pinned
+
+
+def apply_thread_budget(performance_config: Dict) -> Dict:
+    """
+    Applique le budget de la section `inference.performance` (une fois par processus)
+
+    Returns:
+        Budget appliqué (avec 'slot' et 'cpus' si l'affinité est activée)
+    """
+    global _applied
+    if _applied is not None:
+        return _applied
+
+    import torch
+
+    num_workers = performance_config.get('num_workers', 1)
+    budget = compute_thread_budget(
+        num_workers=num_workers,
+        threads_per_worker=performance_config.get('threads_per_worker', 0),
+        interop_threads=performance_config.get('interop_threads', 1),
+        opencv_threads=performance_config.get('opencv_threads', 0)
+    )
+
+    if performance_config.get('cpu_affinity', False):
+        slot = claim_worker_slot(num_workers)
+        if slot is not None:
+            budget['slot'] = slot
+            budget['cpus'] = pin_worker(slot, budget['intra_op'])
+        else:
+            print("⚠️  Aucun slot de worker libre: affinité CPU non appliquée.")
+
+    torch.set_num_threads(budget['intra_op'])
+    try:
+        torch.set_num_interop_threads(budget['inter_op'])
+    except RuntimeError:
+        # Déjà fixé (calcul parallèle déjà lancé dans ce processus)
+        budget['inter_op'] = torch.get_num_interop_threads()
+    cv2.setNumThreads(budget['opencv'])
+
+    _applied = budget
+    print(f"🧵 Threads par worker: torch {budget['intra_op']} (inter-op {budget['inter_op']}), "
+          f"OpenCV {budget['opencv']}" + (f", cœurs {budget['cpus']}" if budget.get('cpus') else ""))
+    return budget
+
+
+def current_thread_budget() -> Optional[Dict]:
+    """Budget appliqué dans ce processus, None si aucun"""
+    return _applied
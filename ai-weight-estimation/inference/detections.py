@@ -0,0 +1,137 @@
+"""
+Structure compacte des détections (struct-of-arrays)
+Évite de construire un dict Python par boîte à chaque étape du pipeline
+"""
+
+import numpy as np
+from typing import List, Dict, Optional, Iterator, Sequence, Union
+
+
+class DetectionBatch:
+    """
+    Détections d'une image stockées en colonnes
+
+    - boxes: (N, 4) float32 [x1, y1, x2, y2]
+    - confidences: (N,) float32
+    - classes: (N,) int32
+
+    La vue en dicts (format historique 'bbox', 'confidence', 'class', 'class_name')
+    n'est construite qu'au premier accès, pour la couche JSON et le code existant.
+    Les tableaux doivent donc être finalisés (ex: remise à l'échelle) avant d'itérer.
+    """
+
+    __slots__ = ('boxes', 'confidences', 'classes', 'names', '_records')
+
+    def __init__(self, boxes: np.ndarray, confidences: np.ndarray, classes: np.ndarray,
+                 names: Optional[Union[Dict[int, str], Sequence[str]]] = None):
+        self.boxes = np.ascontiguousarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.confidences = np.ascontiguousarray(confidences, dtype=np.float32).reshape(-1)
+        self.classes = np.ascontiguousarray(classes, dtype=np.int32).reshape(-1)
+        self.names = names if names is not None else {}
+        self._records: Optional[List[Dict]] = None
+
+    @classmethod
+    def empty(cls, names=None) -> 'DetectionBatch':
+        """Batch vide"""
+        return cls(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int32), names)
+
+    @classmethod
+    def from_array(cls, data: np.ndarray, names=None) -> 'DetectionBatch':
+        """
+        Construit un batch depuis un tableau (N, 6) [x1, y1, x2, y2, conf, cls]
+
+        C'est le format de `result.boxes.data` (ultralytics) : un seul transfert
+        device -> host suffit pour toute l'image.
+        """
+        data = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+        return cls(data[:, :4], data[:, 4], data[:, 5].astype(np.int32), names)
+
+    @classmethod
+    def from_ultralytics(cls, result, names=None) -> 'DetectionBatch':
+        """Construit un batch depuis un résultat ultralytics (une image)"""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return cls.empty(names)
+        return cls.from_array(boxes.data.cpu().numpy(), names)
+
+    @classmethod
+    def from_dicts(cls, detections: List[Dict], names=None) -> 'DetectionBatch':
+        """Construit un batch depuis l'ancien format liste de dicts"""
+        if not detections:
+            return cls.empty(names)
+        return cls(
+            np.array([d['bbox'] for d in detections], dtype=np.float32),
+            np.array([d.get('confidence', 0.0) for d in detections], dtype=np.float32),
+            np.array([d.get('class', 0) for d in detections], dtype=np.int32),
+            names
+        )
+
+    def __len__(self) -> int:
+        return self.boxes.shape[0]
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self.to_dicts())
+
+    def __getitem__(self, index: int) -> Dict:
+        return self.to_dicts()[index]
+
+    def int_boxes(self) -> np.ndarray:
+        """Boîtes en entiers (troncature, comme l'ancien `int(x1)`)"""
+        return self.boxes.astype(np.int32)
+
+    def class_name(self, cls: int) -> str:
+        """Nom de la classe, 'pig' si inconnue"""
+        if isinstance(self.names, dict):
+            return self.names.get(cls, 'pig')
+        return self.names[cls] if 0 <= cls < len(self.names) else 'pig'
+
+    def to_dicts(self) -> List[Dict]:
+        """Vue en liste de dicts (construite une seule fois, puis partagée)"""
+        if self._records is None:
+            boxes = self.int_boxes().tolist()
+            confidences = self.confidences.tolist()
+            classes = self.classes.tolist()
+            self._records = [
+                {
+                    'bbox': bbox,
+                    'confidence': confidence,
+                    'class': cls,
+                    'class_name': self.class_name(cls)
+                }
+                for bbox, confidence, cls in zip(boxes, confidences, classes)
+            ]
+        return self._records
+
+    def set_boxes(self, boxes: np.ndarray):
+        """Remplace les boîtes (ex: retour au repère de l'image originale)"""
+        self.boxes = np.ascontiguousarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self._records = None
+
+    def select(self, indices: np.ndarray) -> 'DetectionBatch':
+        """Sous-ensemble des détections (indices ou masque booléen)"""
+        return DetectionBatch(self.boxes[indices], self.confidences[indices], self.classes[indices], self.names)
+
+    def best_index(self) -> int:
+        """Index de la détection la plus confiante"""
+        return int(np.argmax(self.confidences))
+
+
+def as_records(detections: Union[DetectionBatch, List[Dict]]) -> List[Dict]:
+    """
+    Retourne des dicts modifiables pour annoter les détections
+
+    Un DetectionBatch fournit sa propre vue (aucune copie) ; une liste de dicts
+    est copiée comme auparavant pour ne pas modifier l'entrée de l'appelant.
+    """
+    if isinstance(detections, DetectionBatch):
+        return detections.to_dicts()
+    return [det.copy() for det in detections]
+
+
+def boxes_of(detections: Union[DetectionBatch, List[Dict]]) -> np.ndarray:
+    """Boîtes (N, 4) en entiers, quel que soit le format des détections"""
+    if isinstance(detections, DetectionBatch):
+        return detections.int_boxes()
+    if not detections:
+        return np.zeros((0, 4), dtype=np.int32)
+    return np.array([det['bbox'] for det in detections], dtype=np.int32)
@@ -3,47 +3,114 @@ Module de détection des porcs dans les images/vidéos
 Utilise YOLOv8 pour détecter les porcs
 """
 
+import threading
+
 import cv2
 import numpy as np
-from typing import List, Tuple, Optional
-from ultralytics import YOLO
+from typing import Dict, List, Tuple, Optional, Union
 import torch
 from pathlib import Path
-import yaml
+
+from .detections import DetectionBatch
+from .onnx_detector import OnnxYoloRunner
+from .preprocessing import ImagePreprocessor
+from .postprocessing import ResultPostprocessor
+from .startup import load_config
+from .cpu_budget import current_thread_budget
 
 class PigDetector:
     """Détecteur de porcs basé sur YOLOv8"""
     
-    def __init__(self, model_path: Optional[str] = None, config_path: str = "config/config.yaml"):
+    def __init__(self, model_path: Optional[str] = None, config_path: str = "config/config.yaml",
+                 config: Optional[Dict] = None):
         """
         Initialise le détecteur
         
         Args:
             model_path: Chemin vers le modèle YOLO pré-entraîné
             config_path: Chemin vers le fichier de configuration
+            config: Configuration déjà chargée, à la place de config_path (copie modifiée
+                    par un script ; la configuration mise en cache reste en lecture seule)
         """
         # Charger la configuration
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        self.config = config if config is not None else load_config(config_path)
+        
+        detection_config = self.config.get('models', {}).get('detection', {})
+        self.confidence_threshold = detection_config.get('confidence_threshold', 0.5)
+        self.iou_threshold = detection_config.get('iou_threshold', 0.45)
+        self.input_size = detection_config.get('input_size', [640, 640])
+        
+        # Formes rectangulaires: moins de calcul perdu sur le padding des images 16:9
+        rect_config = detection_config.get('rect_inference', {})
+        self.rect_inference = rect_config.get('enabled', False)
+        self.inference_shapes = [tuple(shape) for shape in rect_config.get('shapes', [self.input_size])]
+        if tuple(self.input_size) not in self.inference_shapes:
+            self.inference_shapes.append(tuple(self.input_size))
+        
+        # Découpage en tuiles des vues d'ensemble haute résolution
+        tiling_config = detection_config.get('tiling', {})
+        self.tiling_enabled = tiling_config.get('enabled', False)
+        self.tile_size = tiling_config.get('tile_size', 640)
+        self.tile_overlap = tiling_config.get('overlap', 0.2)
+        self.tile_min_image_size = tiling_config.get('min_image_size', 1920)
+        self.tile_merge_threshold = tiling_config.get('merge_iou_threshold', 0.5)
+        self.tile_include_full_frame = tiling_config.get('include_full_frame', True)
+        self.tile_border_weight = tiling_config.get('border_weight', 0.5)
+        
+        # Un seul forward à la fois : le predictor ultralytics (et son modèle fusionné)
+        # n'est pas thread-safe, et le batcher, les prédictions du threadpool et la
+        # vidéo partagent ce détecteur
+        self.lock = threading.RLock()
+        
+        # Backend d'inférence: 'torch' (ultralytics) ou 'onnxruntime' (CPU)
+        self.backend = detection_config.get('backend', 'torch')
+        self.model = None
+        self.onnx_runner = None
+        
+        if self.backend == 'onnxruntime':
+            # Sans réglage explicite: budget de threads du worker plutôt que tous les cœurs
+            budget = current_thread_budget()
+            onnx_threads = budget['intra_op'] if budget else 0
+            onnx_path = detection_config.get('onnx_path', 'models/detection/yolov8l_pig.onnx')
+            if Path(onnx_path).exists():
+                self.onnx_runner = OnnxYoloRunner(
+                    onnx_path,
+                    confidence_threshold=self.confidence_threshold,
+                    iou_threshold=self.iou_threshold,
+                    max_detections=detection_config.get('max_detections', 300),
+                    num_threads=detection_config.get('onnx_num_threads', 0) or onnx_threads
+                )
+                self.names = self.onnx_runner.names
+                if self.rect_inference and not self.onnx_runner.dynamic_shape:
+                    print(f"⚠️  Modèle ONNX exporté en taille fixe {self.onnx_runner.input_shape[2:]}: formes rectangulaires désactivées.")
+                    print("💡 Réexportez avec scripts/compare_detector_backends.py --export (axes dynamiques).")
+                    self.rect_inference = False
+                return
+            print(f"⚠️  Modèle ONNX non trouvé: {onnx_path}")
+            print("📥 Retour au backend torch (ultralytics).")
+            self.backend = 'torch'
         
         # Charger le modèle
         if model_path is None:
-            model_path = self.config.get('models', {}).get('detection', {}).get('path', 'models/detection/yolov8l_pig.pt')
+            model_path = detection_config.get('path', 'models/detection/yolov8l_pig.pt')
         
         # Vérifier si le modèle existe, sinon utiliser un modèle pré-entraîné générique
         if not Path(model_path).exists():
+            if self.config.get('startup', {}).get('offline', False):
+                raise FileNotFoundError(f"Modèle de détection non trouvé: {model_path} "
+                                        "(mode hors-ligne: pas de téléchargement de yolov8n.pt)")
             print(f"⚠️  Modèle personnalisé non trouvé: {model_path}")
             print("📥 Utilisation du modèle YOLOv8 pré-entraîné générique (sera téléchargé automatiquement)...")
             print("💡 Note: Ce modèle détectera tous les objets. Entraînez un modèle spécifique aux porcs pour de meilleurs résultats.")
             # Utiliser yolov8n.pt (nano) qui sera téléchargé automatiquement par ultralytics
             model_path = 'yolov8n.pt'  # Modèle générique qui sera téléchargé
         
+        # Import différé: ultralytics n'est chargé que pour le backend torch
+        from ultralytics import YOLO
         self.model = YOLO(model_path)
-        self.confidence_threshold = self.config.get('models', {}).get('detection', {}).get('confidence_threshold', 0.5)
-        self.iou_threshold = self.config.get('models', {}).get('detection', {}).get('iou_threshold', 0.45)
-        self.input_size = self.config.get('models', {}).get('detection', {}).get('input_size', [640, 640])
+        self.names = self.model.names
         
-    def detect(self, image: np.ndarray) -> List[dict]:
+    def detect(self, image: np.ndarray) -> DetectionBatch:
         """
         Détecte les porcs dans une image
         
@@ -51,36 +118,25 @@ class PigDetector:
             image: Image en format numpy array (BGR)
             
         Returns:
-            Liste de détections avec bounding boxes, confiance, etc.
+            DetectionBatch (itérable en dicts avec bbox, confiance, etc.)
         """
+        if self.onnx_runner is not None:
+            return self.detect_resized([image])[0]
+        
         # Exécuter la détection
-        results = self.model(
-            image,
-            conf=self.confidence_threshold,
-            iou=self.iou_threshold,
-            imgsz=self.input_size,
-            verbose=False
-        )
+        with self.lock:
+            results = self.model(
+                image,
+                conf=self.confidence_threshold,
+                iou=self.iou_threshold,
+                imgsz=self.input_size,
+                verbose=False
+            )
         
-        detections = []
-        for result in results:
-            boxes = result.boxes
-            for i in range(len(boxes)):
-                box = boxes[i]
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                confidence = float(box.conf[0].cpu().numpy())
-                cls = int(box.cls[0].cpu().numpy())
-                
-                detections.append({
-                    'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                    'confidence': confidence,
-                    'class': cls,
-                    'class_name': self.model.names[cls] if cls < len(self.model.names) else 'pig'
-                })
-        
-        return detections
+        # Un seul transfert device -> host pour toutes les boîtes de l'image
+        return DetectionBatch.from_ultralytics(results[0], self.names)
     
-    def detect_batch(self, images: List[np.ndarray]) -> List[List[dict]]:
+    def detect_batch(self, images: List[np.ndarray]) -> List[DetectionBatch]:
         """
         Détecte les porcs dans un batch d'images
         
@@ -88,37 +144,214 @@ class PigDetector:
             images: Liste d'images
             
         Returns:
-            Liste de listes de détections
-        """
-        results = self.model(
-            images,
-            conf=self.confidence_threshold,
-            iou=self.iou_threshold,
-            imgsz=self.input_size,
-            verbose=False
+            Un DetectionBatch par image
+        """
+        if self.onnx_runner is not None:
+            return self.detect_resized(images)
+        
+        with self.lock:
+            results = self.model(
+                images,
+                conf=self.confidence_threshold,
+                iou=self.iou_threshold,
+                imgsz=self.input_size,
+                verbose=False
+            )
+        
+        return [DetectionBatch.from_ultralytics(result, self.names) for result in results]
+    
+    def detect_letterboxed(self, letterboxed: List[np.ndarray]) -> List[DetectionBatch]:
+        """
+        Détecte les porcs dans des images déjà letterboxées
+        
+        Les images viennent de ImagePreprocessor.preprocess_for_detection : le tensor
+        est passé tel quel au modèle, ultralytics ne refait donc ni redimensionnement,
+        ni padding, ni normalisation.
+        
+        Args:
+            letterboxed: Images BGR uint8 de même taille (multiple du stride)
+            
+        Returns:
+            Un DetectionBatch par image, boîtes dans le repère letterboxé
+            (voir ResultPostprocessor.transform_boxes)
+        """
+        batch = self._to_array(letterboxed)
+        
+        if self.onnx_runner is not None:
+            with self.lock:
+                outputs = self.onnx_runner(batch)
+            return [DetectionBatch.from_array(data, self.names) for data in outputs]
+        
+        device = next(self.model.model.parameters()).device
+        tensor = torch.from_numpy(batch).to(device)
+        with self.lock:
+            results = self.model(
+                tensor,
+                conf=self.confidence_threshold,
+                iou=self.iou_threshold,
+                imgsz=list(tensor.shape[2:]),
+                verbose=False
+            )
+        
+        return [DetectionBatch.from_ultralytics(result, self.names) for result in results]
+    
+    def should_tile(self, image: np.ndarray) -> bool:
+        """True si l'image est assez grande pour être découpée en tuiles"""
+        return self.tiling_enabled and max(image.shape[:2]) >= self.tile_min_image_size
+    
+    def detect_tiled(self, image: np.ndarray,
+                     return_features: bool = False) -> Union[DetectionBatch, Tuple[DetectionBatch, Dict]]:
+        """
+        Détection par tuiles pour les vues d'ensemble haute résolution
+        
+        Réduite à 640 px, une image 4K rend les porcs éloignés trop petits pour le
+        détecteur. L'image est découpée en tuiles qui se chevauchent (plus l'image
+        entière pour les porcs plus grands qu'une tuile), toutes passées en un seul
+        forward batché, puis les boîtes sont replacées dans le repère de l'image et
+        les doublons aux bords des tuiles supprimés.
+        
+        Args:
+            image: Image BGR
+            return_features: Renvoyer aussi les features du neck de l'image entière
+                (voir detect_with_features), capturées pendant le même appel
+            
+        Returns:
+            DetectionBatch dans le repère de l'image complète
+            (et ses features si return_features)
+        """
+        tiles, offsets = self.make_tiles(image)
+        full_frame = self.tile_include_full_frame or return_features
+        if full_frame:
+            tiles.append(image)
+        
+        batches, features = self._detect_grouped(tiles, capture_neck=return_features)
+        if self.tile_include_full_frame:
+            offsets.append((0, 0))
+        height, width = image.shape[:2]
+        merged = ResultPostprocessor.merge_tiled_detections(
+            batches[:len(offsets)], offsets, self.tile_merge_threshold, self.names,
+            tile_sizes=[(tile.shape[1], tile.shape[0]) for tile in tiles[:len(offsets)]],
+            image_size=(width, height), border_weight=self.tile_border_weight
         )
+        return (merged, features[-1]) if return_features else merged
+    
+    def make_tiles(self, image: np.ndarray) -> Tuple[List[np.ndarray], List[Tuple[int, int]]]:
+        """
+        Découpe l'image en tuiles carrées qui se chevauchent
+        
+        Returns:
+            (tuiles (vues sans copie), coins (x, y) haut-gauche de chaque tuile)
+        """
+        height, width = image.shape[:2]
+        step = max(1, int(self.tile_size * (1 - self.tile_overlap)))
+        
+        def starts(length: int) -> List[int]:
+            last = max(length - self.tile_size, 0)
+            positions = list(range(0, last + 1, step))
+            if positions[-1] != last:
+                positions.append(last)  # Dernière tuile alignée sur le bord
+            return positions
+        
+        tiles, offsets = [], []
+        for y in starts(height):
+            for x in starts(width):
+                tiles.append(image[y:y + self.tile_size, x:x + self.tile_size])
+                offsets.append((x, y))
+        
+        return tiles, offsets
+    
+    def inference_shape(self, image: np.ndarray) -> Tuple[int, int]:
+        """Taille (width, height) du tensor d'entrée pour cette image"""
+        if not self.rect_inference:
+            return tuple(self.input_size)
+        h, w = image.shape[:2]
+        return ImagePreprocessor.select_inference_shape((w, h), self.inference_shapes)
+    
+    def detect_resized(self, images: List[np.ndarray]) -> List[DetectionBatch]:
+        """
+        Letterbox, forward batché puis retour au repère de chaque image
+        
+        Les images sont regroupées par forme d'inférence : un forward par forme
+        (un seul pour un flux de caméras identiques).
+        """
+        return self._detect_grouped(images)[0]
+    
+    def detect_with_features(self, images: List[np.ndarray]) -> Tuple[List[DetectionBatch], List[Dict]]:
+        """
+        Détection + cartes de features du neck YOLOv8 (entrées de la tête Detect)
         
-        all_detections = []
-        for result in results:
-            detections = []
-            boxes = result.boxes
-            for i in range(len(boxes)):
-                box = boxes[i]
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                confidence = float(box.conf[0].cpu().numpy())
-                cls = int(box.cls[0].cpu().numpy())
-                
-                detections.append({
-                    'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                    'confidence': confidence,
-                    'class': cls,
-                    'class_name': self.model.names[cls] if cls < len(self.model.names) else 'pig'
-                })
-            all_detections.append(detections)
-        
-        return all_detections
+        Les cartes (P3, P4, P5) sont capturées pendant le forward de détection,
+        sans calcul supplémentaire. Backend torch uniquement (le graphe ONNX
+        n'expose que les sorties de la tête).
+        
+        Returns:
+            (détections dans le repère de chaque image, features par image :
+            {'maps': [tensor (1, C, H, W)], 'strides': [8, 16, 32], 'letterbox': metadata})
+        """
+        if self.model is None:
+            raise RuntimeError("Les features du neck nécessitent le backend torch (ultralytics)")
+        return self._detect_grouped(images, capture_neck=True)
+    
+    def _detect_grouped(self, images: List[np.ndarray],
+                        capture_neck: bool = False) -> Tuple[List[DetectionBatch], List[Optional[Dict]]]:
+        """Letterbox et forward par forme d'inférence (voir detect_resized)"""
+        groups = {}
+        for i, image in enumerate(images):
+            groups.setdefault(self.inference_shape(image), []).append(i)
+        
+        results: List[Optional[DetectionBatch]] = [None] * len(images)
+        features: List[Optional[Dict]] = [None] * len(images)
+        if not capture_neck:
+            for target_size, indices in groups.items():
+                letterboxed = [ImagePreprocessor.preprocess_for_detection(images[i], target_size) for i in indices]
+                batches = self.detect_letterboxed([padded for padded, _ in letterboxed])
+                for i, batch, (_, metadata) in zip(indices, batches, letterboxed):
+                    batch.set_boxes(ResultPostprocessor.transform_boxes(batch.boxes, metadata))
+                    results[i] = batch
+            return results, features
+        
+        # Le hook est posé sur le réseau partagé : sous le verrou, aucun forward
+        # d'un autre thread ne peut être capturé à la place de celui-ci
+        with self.lock:
+            captured = []
+            network = self._inference_network()
+            strides = [int(s) for s in network.stride.tolist()]
+            # Les entrées de la tête Detect sont les sorties du neck (copie de la liste:
+            # Detect la modifie sur place)
+            handle = network.model[-1].register_forward_pre_hook(
+                lambda module, args: captured.append(list(args[0])))
+            try:
+                for target_size, indices in groups.items():
+                    letterboxed = [ImagePreprocessor.preprocess_for_detection(images[i], target_size) for i in indices]
+                    batches = self.detect_letterboxed([padded for padded, _ in letterboxed])
+                    
+                    for j, (i, batch, (_, metadata)) in enumerate(zip(indices, batches, letterboxed)):
+                        batch.set_boxes(ResultPostprocessor.transform_boxes(batch.boxes, metadata))
+                        results[i] = batch
+                        # Dernier forward capturé = ce groupe (le premier appel inclut le warmup)
+                        features[i] = {'maps': [level[j:j + 1] for level in captured[-1]],
+                                       'strides': strides, 'letterbox': metadata}
+            finally:
+                handle.remove()
+        
+        return results, features
+    
+    def _inference_network(self) -> torch.nn.Module:
+        """Réseau réellement exécuté par ultralytics (le predictor travaille sur une copie fusionnée)"""
+        if self.model.predictor is None:
+            # Crée le predictor (et sa copie du modèle) avant d'y poser un hook
+            self.model(np.zeros((self.input_size[1], self.input_size[0], 3), dtype=np.uint8),
+                       imgsz=self.input_size, verbose=False)
+        backend = self.model.predictor.model
+        return getattr(backend, 'model', backend)
+    
+    @staticmethod
+    def _to_array(letterboxed: List[np.ndarray]) -> np.ndarray:
+        """Images BGR uint8 (H, W, 3) -> tableau RGB float32 (B, 3, H, W) dans [0, 1]"""
+        batch = np.stack(letterboxed)[..., ::-1].transpose(0, 3, 1, 2)
+        return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
     
-    def draw_detections(self, image: np.ndarray, detections: List[dict]) -> np.ndarray:
+    def draw_detections(self, image: np.ndarray, detections: Union[DetectionBatch, List[dict]]) -> np.ndarray:
         """
         Dessine les détections sur l'image
         
@@ -0,0 +1,83 @@
+"""
+Cache des embeddings Re-ID d'une requête
+Un même crop (image, bbox) n'est embarqué qu'une fois entre identification,
+suggestion et enregistrement
+"""
+
+import collections
+import threading
+import weakref
+import numpy as np
+from typing import Dict, Optional, Sequence, Tuple
+
+
+class EmbeddingCache:
+    """
+    Embeddings indexés par (identifiant de l'image, bbox)
+
+    L'identifiant est `id(image)` : une entrée ne vit que tant que le tableau
+    de l'image existe (weakref), ce qui borne le cache à la durée de la requête
+    et évite qu'un `id` recyclé par Python renvoie les features d'une autre image.
+    """
+
+    def __init__(self):
+        self._frames: Dict[int, Tuple[weakref.ref, Dict[Tuple[int, ...], np.ndarray]]] = {}
+        self._lock = threading.Lock()
+        # Images libérées, retirées de _frames au prochain accès sous verrou
+        self._released = collections.deque()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._purge()
+            return sum(len(entries) for _, entries in self._frames.values())
+
+    @staticmethod
+    def _bbox_key(bbox: Sequence[int]) -> Tuple[int, ...]:
+        return tuple(int(v) for v in bbox)
+
+    def _entries(self, image: np.ndarray) -> Optional[Dict[Tuple[int, ...], np.ndarray]]:
+        frame = self._frames.get(id(image))
+        if frame is None or frame[0]() is not image:
+            return None
+        return frame[1]
+
+    def get(self, image: np.ndarray, bbox: Sequence[int]) -> Optional[np.ndarray]:
+        """Features déjà calculées pour ce crop, ou None"""
+        with self._lock:
+            entries = self._entries(image)
+            return None if entries is None else entries.get(self._bbox_key(bbox))
+
+    def put(self, image: np.ndarray, bbox: Sequence[int], features: np.ndarray):
+        """Mémorise les features d'un crop jusqu'à la libération de l'image"""
+        with self._lock:
+            self._purge()
+            entries = self._entries(image)
+            if entries is None:
+                entries = {}
+                frame_id = id(image)
+                self._frames[frame_id] = (weakref.ref(image), entries)
+                weakref.finalize(image, self._forget, frame_id, entries)
+            entries[self._bbox_key(bbox)] = np.asarray(features, dtype=np.float32)
+
+    def _forget(self, frame_id: int, entries: Dict):
+        """
+        Appelé quand l'image est libérée
+
+        Sans verrou : le ramasse-miettes peut appeler ce finaliseur dans un
+        thread qui tient déjà self._lock (deadlock avec un Lock, modification
+        de _frames pendant son parcours avec un RLock).
+        """
+        self._released.append((frame_id, entries))
+
+    def _purge(self):
+        """Retire les entrées des images libérées (sous verrou)"""
+        while self._released:
+            frame_id, entries = self._released.popleft()
+            frame = self._frames.get(frame_id)
+            if frame is not None and frame[1] is entries:
+                del self._frames[frame_id]
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._released.clear()
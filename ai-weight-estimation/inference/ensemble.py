@@ -4,14 +4,14 @@ Module de fusion bayésienne des modèles d'estimation de poids
 
 import numpy as np
 from typing import List, Dict, Optional
-import yaml
+
+from .startup import load_config
 
 class WeightEnsemble:
     """Fusion bayésienne des estimations de poids"""
     
     def __init__(self, config_path: str = "config/inference_config.yaml"):
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        self.config = load_config(config_path)
         
         self.weights = self.config['inference']['weight_estimation']['ensemble_weights']
         self.methods = self.config['inference']['weight_estimation']['methods']
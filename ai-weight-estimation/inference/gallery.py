@@ -0,0 +1,682 @@
+"""
+Galerie de features Re-ID sous forme de matrice contiguë
+Recherche de tous les porcs d'une image en un seul produit matriciel
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: verrou limité au processus
+    fcntl = None
+
+
+class GalleryIndex(NamedTuple):
+    """
+    État lu par une recherche : lignes, matrice et masque d'occupation cohérents
+
+    La galerie persistante publie un nouvel état en une seule affectation ;
+    une recherche concurrente voit l'ancien ou le nouveau, jamais un mélange.
+    """
+    ids: List[Optional[str]]
+    rows: Dict[str, int]
+    matrix: np.ndarray
+    active: np.ndarray
+    size: int
+    shot_rows: Optional[Dict[str, Dict[int, int]]] = None  # Galerie persistante: pig_id -> {case: ligne}
+    shot_matrix: Optional[np.ndarray] = None
+
+
+class FeatureGallery:
+    """
+    Matrice (capacité, dim) float32 de features normalisées L2
+
+    - Les lignes [0, size) sont occupées ; la capacité double quand elle est atteinte
+      (ajout amorti en O(dim), sans reconstruire la matrice)
+    - Une suppression marque la ligne comme libre (tombstone) ; la matrice est
+      compactée quand plus de la moitié des lignes sont libres
+    - `ids[i]` donne l'identifiant de la ligne i, `_rows[pig_id]` l'inverse
+
+    Chaque porc est multi-vues : sa ligne contient le centroïde courant de tous
+    ses embeddings, et un réservoir borné de `reservoir_size` embeddings tirés
+    uniformément (Algorithm R). La recherche se fait sur la matrice des
+    centroïdes ; les réservoirs ne départagent que les candidats ambigus
+    (score à moins de `ambiguity_margin` du meilleur).
+
+    Les écritures ne sont pas protégées : l'appelant les sérialise (PigReID).
+    """
+
+    def __init__(self, dim: int, initial_capacity: int = 64, reservoir_size: int = 8,
+                 ambiguity_margin: float = 0.05, max_ambiguous: int = 3, seed: int = 0):
+        self.dim = dim
+        self._matrix = np.zeros((max(1, initial_capacity), dim), dtype=np.float32)
+        self._ids: List[Optional[str]] = []
+        self._active = np.zeros(max(1, initial_capacity), dtype=bool)
+        self._rows: Dict[str, int] = {}
+        self._size = 0
+
+        self.reservoir_size = max(1, reservoir_size)
+        self.ambiguity_margin = ambiguity_margin
+        self.max_ambiguous = max_ambiguous
+        self._rng = np.random.default_rng(seed)
+        self._shots: Dict[str, np.ndarray] = {}  # pig_id -> (k, dim) embeddings normalisés
+        self._seen: Dict[str, int] = {}  # Nombre d'embeddings reçus par porc
+        self._mean_norms: Dict[str, float] = {}  # Norme du centroïde avant normalisation
+
+    def __len__(self) -> int:
+        return len(self._index().rows)
+
+    def __contains__(self, pig_id: str) -> bool:
+        return pig_id in self._index().rows
+
+    def _index(self) -> GalleryIndex:
+        """État courant pour les lectures (une recherche n'en lit qu'un)"""
+        return GalleryIndex(self._ids, self._rows, self._matrix, self._active, self._size)
+
+    @property
+    def ids(self) -> List[str]:
+        """Identifiants enregistrés, dans l'ordre des lignes"""
+        return [pig_id for pig_id in self._index().ids if pig_id is not None]
+
+    @staticmethod
+    def normalize(features: np.ndarray) -> np.ndarray:
+        """Normalisation L2 ligne par ligne (float32)"""
+        features = np.asarray(features, dtype=np.float32)
+        norms = np.linalg.norm(features, axis=-1, keepdims=True)
+        return features / np.maximum(norms, 1e-12)
+
+    def get(self, pig_id: str) -> Optional[np.ndarray]:
+        """Features normalisées d'un porc (copie) ou None"""
+        index = self._index()
+        row = index.rows.get(pig_id)
+        return None if row is None else np.array(index.matrix[row])
+
+    def vectors(self, pig_ids: Sequence[str], index: Optional[GalleryIndex] = None) -> np.ndarray:
+        """Features normalisées (len(pig_ids), dim) des porcs demandés"""
+        index = index or self._index()
+        return np.asarray(index.matrix[[index.rows[pig_id] for pig_id in pig_ids]])
+
+    def add(self, pig_id: str, features: np.ndarray, metadata: Optional[Dict] = None,
+            bbox: Optional[List[int]] = None):
+        """
+        Ajoute une vue d'un porc (crée l'entrée si le porc est inconnu)
+
+        Le centroïde est mis à jour et l'embedding entre éventuellement dans le
+        réservoir. `metadata` et `bbox` ne sont conservés que par la galerie
+        persistante.
+        """
+        vector = self.normalize(np.asarray(features).reshape(-1))
+        centroid, norm, seen, slot = self._next_shot(pig_id, vector)
+
+        row = self._rows.get(pig_id)
+        if row is None:
+            if self._size == self._matrix.shape[0]:
+                self._grow()
+            row = self._size
+            self._size += 1
+            self._ids.append(pig_id)
+            self._rows[pig_id] = row
+            self._active[row] = True
+
+        self._matrix[row] = centroid
+        self._mean_norms[pig_id] = norm
+        self._seen[pig_id] = seen
+
+        if slot is not None:
+            shots = self._shots.get(pig_id, np.zeros((0, self.dim), dtype=np.float32))
+            if slot == len(shots):
+                shots = np.vstack([shots, vector[None]])
+            else:
+                shots[slot] = vector
+            self._shots[pig_id] = shots
+
+    def _next_shot(self, pig_id: str, vector: np.ndarray) -> Tuple[np.ndarray, float, int, Optional[int]]:
+        """
+        Effet d'une nouvelle vue normalisée
+
+        Returns:
+            (centroïde normalisé, norme du centroïde, nombre de vues,
+             case du réservoir à remplacer ou None)
+        """
+        seen = self._seen.get(pig_id, 0) + 1
+        row = self._rows.get(pig_id)
+        if row is None:
+            mean = vector
+        else:
+            previous = np.asarray(self._matrix[row]) * self._mean_norms.get(pig_id, 1.0)
+            mean = previous + (vector - previous) / seen
+
+        # Algorithm R: chaque vue reste dans le réservoir avec probabilité k / seen
+        if seen <= self.reservoir_size:
+            slot = seen - 1
+        else:
+            j = int(self._rng.integers(0, seen))
+            slot = j if j < self.reservoir_size else None
+
+        norm = float(np.linalg.norm(mean))
+        return self.normalize(mean), norm, seen, slot
+
+    def reservoir(self, pig_id: str, index: Optional[GalleryIndex] = None) -> np.ndarray:
+        """Embeddings conservés pour un porc (k, dim)"""
+        return self._shots.get(pig_id, np.zeros((0, self.dim), dtype=np.float32))
+
+    def remove(self, pig_id: str) -> bool:
+        """Retire un porc de la galerie ; False s'il n'y était pas"""
+        row = self._rows.pop(pig_id, None)
+        if row is None:
+            return False
+
+        self._ids[row] = None
+        self._active[row] = False
+        self._matrix[row] = 0.0
+        self._shots.pop(pig_id, None)
+        self._seen.pop(pig_id, None)
+        self._mean_norms.pop(pig_id, None)
+
+        if self._size - len(self._rows) > self._size // 2:
+            self.compact()
+        return True
+
+    def refresh(self) -> List[str]:
+        """Relit les écritures des autres processus (rien à faire en mémoire)"""
+        return []
+
+    def update_metadata(self, pig_id: str, metadata: Dict):
+        """Métadonnées conservées par la galerie persistante uniquement"""
+
+    def compact(self):
+        """Supprime les lignes libres (l'ordre des porcs restants est conservé)"""
+        keep = np.flatnonzero(self._active[:self._size])
+        capacity = self._matrix.shape[0]
+
+        self._matrix[:len(keep)] = self._matrix[keep]
+        self._matrix[len(keep):self._size] = 0.0
+        self._ids = [self._ids[i] for i in keep]
+        self._active = np.zeros(capacity, dtype=bool)
+        self._active[:len(keep)] = True
+        self._size = len(keep)
+        self._rows = {pig_id: row for row, pig_id in enumerate(self._ids)}
+
+    def _grow(self):
+        """Double la capacité"""
+        capacity = self._matrix.shape[0] * 2
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        active = np.zeros(capacity, dtype=bool)
+        active[:self._size] = self._active[:self._size]
+        self._matrix, self._active = matrix, active
+
+    def similarities(self, queries: np.ndarray, index: Optional[GalleryIndex] = None) -> np.ndarray:
+        """
+        Similarités cosinus (requêtes × lignes occupées)
+
+        Args:
+            queries: Features (Q, dim) ; normalisées ici
+            index: État lu (par défaut l'état courant)
+
+        Returns:
+            Matrice (Q, size), -inf sur les lignes libres
+        """
+        index = index or self._index()
+        queries = self.normalize(np.asarray(queries).reshape(-1, self.dim))
+        scores = queries @ index.matrix[:index.size].T
+        scores[:, ~index.active[:index.size]] = -np.inf
+        return scores
+
+    def search(self, queries: np.ndarray, threshold: float = 0.0,
+               candidate_ids: Optional[Sequence[str]] = None) -> List[Optional[Tuple[str, float]]]:
+        """
+        Meilleur porc pour chaque requête
+
+        Args:
+            queries: Features (Q, dim)
+            threshold: Similarité minimum
+            candidate_ids: Restreindre la recherche à ces porcs (optionnel)
+
+        Returns:
+            Pour chaque requête, (pig_id, similarité) ou None sous le seuil
+        """
+        queries = self.normalize(np.asarray(queries).reshape(-1, self.dim))
+        index = self._index()
+        if candidate_ids is None:
+            row_ids = index.ids
+            scores = self.similarities(queries, index) if index.rows else None
+        else:
+            # Seules les lignes candidates sont évaluées
+            row_ids = [pig_id for pig_id in dict.fromkeys(candidate_ids) if pig_id in index.rows]
+            scores = queries @ self.vectors(row_ids, index).T if row_ids else None
+
+        if scores is None or queries.shape[0] == 0:
+            return [None] * queries.shape[0]
+
+        best_rows = scores.argmax(axis=1)
+        best_scores = scores[np.arange(len(best_rows)), best_rows]
+        if self.ambiguity_margin > 0 and scores.shape[1] > 1:
+            self._resolve_ambiguous(queries, scores, row_ids, best_rows, best_scores, index)
+        matched = best_scores >= threshold
+
+        return [
+            (row_ids[row], float(score)) if ok else None
+            for row, score, ok in zip(best_rows.tolist(), best_scores.tolist(), matched.tolist())
+        ]
+
+    def score_matrix(self, queries: np.ndarray, pig_ids: Sequence[str]) -> np.ndarray:
+        """
+        Similarités (Q, len(pig_ids)) avec un petit ensemble de porcs (ex: un enclos)
+
+        Chaque score est le maximum entre le centroïde et les vues du réservoir.
+        Les porcs doivent être enregistrés dans la galerie.
+        """
+        queries = self.normalize(np.asarray(queries).reshape(-1, self.dim))
+        index = self._index()
+        scores = queries @ self.vectors(pig_ids, index).T
+        for column, pig_id in enumerate(pig_ids):
+            shots = self.reservoir(pig_id, index)
+            if len(shots):
+                scores[:, column] = np.maximum(scores[:, column], (queries @ shots.T).max(axis=1))
+        return scores
+
+    def _resolve_ambiguous(self, queries: np.ndarray, scores: np.ndarray, row_ids: Sequence[Optional[str]],
+                           best_rows: np.ndarray, best_scores: np.ndarray, index: GalleryIndex):
+        """
+        Départage les requêtes dont plusieurs centroïdes sont proches du meilleur
+
+        Le score d'un candidat devient le maximum entre son centroïde et ses vues
+        du réservoir. `best_rows` et `best_scores` sont modifiés en place.
+        """
+        k = min(self.max_ambiguous, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        close = top_scores >= (best_scores - self.ambiguity_margin)[:, None]
+
+        for q in np.flatnonzero(close.sum(axis=1) > 1).tolist():
+            candidates = top[q][close[q]]
+            refined = []
+            for column in candidates.tolist():
+                shots = self.reservoir(row_ids[column], index)
+                shot_score = float((shots @ queries[q]).max()) if len(shots) else -np.inf
+                refined.append(max(float(scores[q, column]), shot_score))
+            best = int(np.argmax(refined))
+            best_rows[q] = candidates[best]
+            best_scores[q] = refined[best]
+
+
+class PersistentFeatureGallery(FeatureGallery):
+    """
+    Galerie sur disque, partagée entre workers et conservée entre redémarrages
+
+    Fichiers d'une génération `g` dans `path` :
+    - `embeddings.g.f32` : un centroïde float32 (dim,) par porc, lu via np.memmap
+      en lecture seule (page cache partagé entre workers)
+    - `shots.g.f32` : vues des réservoirs, dans un fichier séparé pour que la
+      matrice de recherche ne contienne que les centroïdes
+    - `ops.g.jsonl` : journal des opérations (add / remove / metadata)
+    - `CURRENT` : numéro de la génération active
+
+    Une vue réécrit sur place la ligne du centroïde (et celle de la case du
+    réservoir qu'elle remplace) puis ajoute une seule entrée de journal (fsync) :
+    les fichiers ne grossissent qu'avec les nouveaux porcs et les cases de
+    réservoir remplies, pas avec chaque pesée. Un crash entre les deux écritures
+    laisse le centroïde à jour et l'ancien compteur de vues. Les lignes des
+    porcs retirés deviennent obsolètes ; la compaction réécrit les lignes
+    vivantes dans une nouvelle génération, activée par un os.replace atomique
+    de `CURRENT`.
+
+    Concurrence : les écritures prennent le verrou exclusif (threads + flock),
+    les relectures le verrou partagé, et une compaction ne peut donc pas
+    supprimer une génération pendant qu'un worker la relit. L'état relu est
+    publié en une seule affectation (GalleryIndex) : les recherches ne
+    prennent aucun verrou.
+    """
+
+    def __init__(self, dim: int, path: str, compact_ratio: float = 0.5, min_compact_rows: int = 256,
+                 **kwargs):
+        """
+        Args:
+            dim: Dimension des features
+            path: Dossier de la galerie
+            compact_ratio: Compacter quand cette fraction des lignes est obsolète
+            min_compact_rows: Nombre minimum de lignes obsolètes avant compaction
+            **kwargs: Paramètres multi-vues (voir FeatureGallery)
+        """
+        super().__init__(dim, initial_capacity=1, **kwargs)
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.compact_ratio = compact_ratio
+        self.min_compact_rows = min_compact_rows
+        self.records: Dict[str, Dict] = {}  # pig_id -> {'metadata', 'bbox'}, publié avec l'index
+        self._thread_lock = threading.Lock()
+        with self._lock(shared=True):
+            self._load()
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dim * 4
+
+    def _embeddings_file(self, generation: int) -> Path:
+        return self.path / f"embeddings.{generation}.f32"
+
+    def _shots_file(self, generation: int) -> Path:
+        return self.path / f"shots.{generation}.f32"
+
+    def _ops_file(self, generation: int) -> Path:
+        return self.path / f"ops.{generation}.jsonl"
+
+    def _read_generation(self) -> int:
+        current = self.path / "CURRENT"
+        return int(current.read_text().strip()) if current.exists() else 0
+
+    @contextmanager
+    def _lock(self, shared: bool = False):
+        """
+        Verrou entre threads et entre processus
+
+        Exclusif pour les écritures, partagé pour les relectures (plusieurs
+        workers relisent en même temps, mais jamais pendant une écriture).
+        Les threads d'un même processus sont toujours sérialisés.
+        """
+        with self._thread_lock, open(self.path / ".lock", 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _index(self) -> GalleryIndex:
+        return self._published
+
+    def _load(self):
+        """Charge la génération active : relecture du journal puis memmap (sous verrou)"""
+        self._generation = self._read_generation()
+        self._ids, self._rows, self._records = [], {}, {}
+        self._shot_rows: Dict[str, Dict[int, int]] = {}  # pig_id -> {case: ligne de shots}
+        self._shot_size = 0
+        self._seen, self._mean_norms = {}, {}
+        self._log_offset = 0
+        self._replay()
+
+    def _replay(self) -> List[str]:
+        """Applique les entrées du journal ajoutées depuis la dernière lecture (sous verrou)"""
+        ops_file = self._ops_file(self._generation)
+        if not ops_file.exists():
+            self._remap()
+            return []
+
+        with open(ops_file, 'rb') as f:
+            f.seek(self._log_offset)
+            data = f.read()
+
+        changed = []
+        consumed = data.rfind(b'\n') + 1  # Ignorer une dernière ligne incomplète
+        for line in data[:consumed].splitlines():
+            try:
+                op = json.loads(line)
+            except ValueError:
+                continue
+            changed.append(op['id'])
+            self._apply(op)
+        self._log_offset += consumed
+
+        self._remap()
+        return changed
+
+    def _apply(self, op: Dict):
+        """
+        Applique une opération du journal à l'état de travail
+
+        Les dictionnaires par porc sont remplacés, jamais modifiés : la copie
+        publiée par _remap peut rester superficielle.
+        """
+        pig_id = op['id']
+        if op['op'] == 'add':
+            row = op['row']
+            if row >= len(self._ids):
+                self._ids.extend([None] * (row + 1 - len(self._ids)))
+            previous = self._rows.get(pig_id)
+            if previous is not None:
+                self._ids[previous] = None
+            self._ids[row] = pig_id
+            self._rows[pig_id] = row
+            self._seen[pig_id] = op.get('count', 1)
+            self._mean_norms[pig_id] = op.get('norm', 1.0)
+            if op.get('shots'):
+                shot_rows = dict(self._shot_rows.get(pig_id, {}))
+                for slot, shot_row in op['shots']:
+                    shot_rows[slot] = shot_row
+                    self._shot_size = max(self._shot_size, shot_row + 1)
+                self._shot_rows[pig_id] = shot_rows
+            metadata = op['metadata'] if 'metadata' in op else self._records.get(pig_id, {}).get('metadata')
+            self._records[pig_id] = {'metadata': metadata or {}, 'bbox': op.get('bbox')}
+        elif op['op'] == 'remove':
+            row = self._rows.pop(pig_id, None)
+            if row is not None:
+                self._ids[row] = None
+            self._records.pop(pig_id, None)
+            self._shot_rows.pop(pig_id, None)
+            self._seen.pop(pig_id, None)
+            self._mean_norms.pop(pig_id, None)
+        elif op['op'] == 'metadata' and pig_id in self._records:
+            self._records[pig_id] = {**self._records[pig_id], 'metadata': op.get('metadata') or {}}
+
+    def _remap(self):
+        """(Re)mappe les fichiers d'embeddings puis publie le nouvel état (sous verrou)"""
+        self._size = len(self._ids)
+        self._active = np.array([pig_id is not None for pig_id in self._ids], dtype=bool)
+        self._matrix = self._map(self._embeddings_file(self._generation), self._size)
+        self._shot_matrix = self._map(self._shots_file(self._generation), self._shot_size)
+        # Copies: l'état de travail continue d'évoluer sous verrou, l'état publié jamais
+        self.records = dict(self._records)
+        self._published = GalleryIndex(list(self._ids), dict(self._rows), self._matrix, self._active,
+                                       self._size, dict(self._shot_rows), self._shot_matrix)
+
+    def _map(self, path: Path, rows: int) -> np.ndarray:
+        if rows == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.memmap(path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+
+    def refresh(self) -> List[str]:
+        """
+        Relit les écritures des autres workers
+
+        Returns:
+            Identifiants modifiés depuis la dernière lecture
+        """
+        with self._lock(shared=True):
+            return self._refresh()
+
+    def _refresh(self) -> List[str]:
+        """refresh sous verrou (partagé ou exclusif)"""
+        try:
+            if self._read_generation() != self._generation:
+                self._load()
+                return self.ids
+
+            ops_file = self._ops_file(self._generation)
+            if ops_file.exists() and ops_file.stat().st_size > self._log_offset:
+                return self._replay()
+            return []
+        except FileNotFoundError:
+            # Génération supprimée par une compaction (sans flock, ex: Windows) : relire CURRENT
+            self._load()
+            return self.ids
+
+    @staticmethod
+    def _fsync_write(path: Path, data: bytes, offset: Optional[int] = None):
+        """Écrit (en fin de fichier ou à `offset`) puis force l'écriture sur disque"""
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | (0 if offset is not None else os.O_APPEND), 0o644)
+        try:
+            if offset is None:
+                os.write(fd, data)
+            else:
+                os.pwrite(fd, data, offset)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _complete_length(path: Path) -> Tuple[int, int]:
+        """(octets jusqu'à la dernière fin de ligne, taille du fichier)"""
+        with open(path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            position = size
+            while position > 0:
+                step = min(1 << 16, position)
+                position -= step
+                f.seek(position)
+                newline = f.read(step).rfind(b'\n')
+                if newline >= 0:
+                    return position + newline + 1, size
+        return 0, size
+
+    def _append_op(self, op: Dict):
+        """Ajoute une entrée au journal (sous verrou exclusif)"""
+        ops_file = self._ops_file(self._generation)
+        if ops_file.exists():
+            # Ligne incomplète laissée par un crash : seul ce reste est retiré,
+            # jamais une entrée complète (quel que soit _log_offset)
+            complete, size = self._complete_length(ops_file)
+            if complete < size:
+                os.truncate(ops_file, complete)
+        line = json.dumps(op, ensure_ascii=False, default=_json_default) + '\n'
+        self._fsync_write(ops_file, line.encode('utf-8'))
+
+    def reservoir(self, pig_id: str, index: Optional[GalleryIndex] = None) -> np.ndarray:
+        """Embeddings conservés pour un porc (k, dim), lus dans le memmap"""
+        index = index or self._index()
+        rows = list(index.shot_rows.get(pig_id, {}).values())
+        return np.asarray(index.shot_matrix[rows]) if rows else np.zeros((0, self.dim), dtype=np.float32)
+
+    def add(self, pig_id: str, features: np.ndarray, metadata: Optional[Dict] = None,
+            bbox: Optional[List[int]] = None):
+        """
+        Ajoute une vue d'un porc : centroïde (+ vue) et une entrée de journal, durables
+
+        Sans `metadata` (None), les métadonnées déjà enregistrées du porc sont conservées.
+        """
+        vector = self.normalize(np.asarray(features).reshape(-1))
+
+        with self._lock():
+            self._refresh()
+            centroid, norm, seen, slot = self._next_shot(pig_id, vector)
+
+            # Lignes existantes réécrites sur place (taille fixe), nouvelles en fin de fichier
+            row = self._write_row(self._embeddings_file(self._generation), centroid, self._rows.get(pig_id))
+            shots = []
+            if slot is not None:
+                shot_row = self._shot_rows.get(pig_id, {}).get(slot)
+                shots = [[slot, self._write_row(self._shots_file(self._generation), vector, shot_row)]]
+            op = {'op': 'add', 'id': pig_id, 'row': row, 'count': seen, 'norm': norm,
+                  'shots': shots, 'bbox': bbox}
+            if metadata is not None:
+                op['metadata'] = metadata
+            self._append_op(op)
+            self._refresh()
+            compact = self._needs_compaction()
+
+        if compact:
+            self.compact()
+
+    def _write_row(self, path: Path, vector: np.ndarray, row: Optional[int] = None) -> int:
+        """Écrit une ligne (durable) à `row`, ou en fin de fichier, et retourne son index"""
+        if row is None:
+            size = path.stat().st_size if path.exists() else 0
+            row = size // self._row_bytes  # Une ligne partielle (crash) est écrasée
+        self._fsync_write(path, vector.astype(np.float32).tobytes(), offset=row * self._row_bytes)
+        return row
+
+    def remove(self, pig_id: str) -> bool:
+        """Retire un porc (entrée de journal) ; False s'il n'y était pas"""
+        with self._lock():
+            self._refresh()
+            if pig_id not in self._rows:
+                return False
+            self._append_op({'op': 'remove', 'id': pig_id})
+            self._refresh()
+            compact = self._needs_compaction()
+
+        if compact:
+            self.compact()
+        return True
+
+    def update_metadata(self, pig_id: str, metadata: Dict):
+        """Remplace les métadonnées d'un porc enregistré"""
+        with self._lock():
+            self._refresh()
+            if pig_id in self._rows:
+                self._append_op({'op': 'metadata', 'id': pig_id, 'metadata': metadata})
+                self._refresh()
+
+    def _needs_compaction(self) -> bool:
+        """Fraction de lignes obsolètes dépassée (sous verrou)"""
+        live_shots = sum(len(shots) for shots in self._shot_rows.values())
+        total = self._size + self._shot_size
+        obsolete = total - len(self._rows) - live_shots
+        return obsolete >= self.min_compact_rows and obsolete > self.compact_ratio * total
+
+    def compact(self):
+        """Réécrit les lignes vivantes dans une nouvelle génération"""
+        with self._lock():
+            self._refresh()
+            generation = self._generation + 1
+
+            rows, shot_rows, lines = [], [], []
+            for pig_id in self.ids:
+                shots = []
+                for slot, shot_row in sorted(self._shot_rows.get(pig_id, {}).items()):
+                    shots.append([slot, len(shot_rows)])
+                    shot_rows.append(shot_row)
+                lines.append(json.dumps({
+                    'op': 'add', 'id': pig_id, 'row': len(rows), 'count': self._seen.get(pig_id, 1),
+                    'norm': self._mean_norms.get(pig_id, 1.0), 'shots': shots, **self._records[pig_id]
+                }, ensure_ascii=False, default=_json_default) + '\n')
+                rows.append(self._rows[pig_id])
+
+            for path, matrix, selected in ((self._embeddings_file(generation), self._matrix, rows),
+                                           (self._shots_file(generation), self._shot_matrix, shot_rows)):
+                path.unlink(missing_ok=True)
+                self._fsync_write(path, np.ascontiguousarray(matrix[selected], dtype=np.float32).tobytes())
+
+            self._ops_file(generation).unlink(missing_ok=True)
+            self._fsync_write(self._ops_file(generation), ''.join(lines).encode('utf-8'))
+
+            # Bascule atomique vers la nouvelle génération
+            tmp = self.path / "CURRENT.tmp"
+            self._fsync_write(tmp, str(generation).encode('utf-8'))
+            os.replace(tmp, self.path / "CURRENT")
+            self._fsync_dir()
+
+            old_generation = self._generation
+            self._load()
+            # Aucun worker ne relit l'ancienne génération (verrou exclusif) ; ceux
+            # qui la mappent déjà gardent un accès valide jusqu'à leur prochain refresh
+            self._embeddings_file(old_generation).unlink(missing_ok=True)
+            self._shots_file(old_generation).unlink(missing_ok=True)
+            self._ops_file(old_generation).unlink(missing_ok=True)
+
+    def _fsync_dir(self):
+        """Rend durable le renommage de CURRENT (POSIX)"""
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(self.path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _json_default(value):
+    """Sérialise les types NumPy des bbox / métadonnées"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
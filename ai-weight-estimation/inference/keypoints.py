@@ -6,11 +6,15 @@ import cv2
 import numpy as np
 import torch
 import torch.nn as nn
-from torchvision import transforms, models
+from torchvision import transforms
 from typing import List, Dict, Tuple, Optional
-import yaml
 from pathlib import Path
 
+from .backends import load_backend
+from .multihead import SharedBackboneModel
+from .preprocessing import CropBatch
+from .startup import apply_state_dict, build_resnet50, load_checkpoint, load_config
+
 class KeypointDetector:
     """Détecteur de points clés anatomiques des porcs"""
     
@@ -28,16 +32,19 @@ class KeypointDetector:
         'tail_base', 'tail_tip'
     ]
     
-    def __init__(self, model_path: Optional[str] = None, config_path: str = "config/model_config.yaml"):
+    def __init__(self, model_path: Optional[str] = None, config_path: str = "config/model_config.yaml",
+                 shared_model: Optional[SharedBackboneModel] = None, config: Optional[Dict] = None):
         """
         Initialise le détecteur de points clés
         
         Args:
             model_path: Chemin vers le modèle
             config_path: Chemin vers la configuration
+            shared_model: Modèle multi-tête (backbone partagé) remplaçant le ResNet50 dédié
+            config: Configuration déjà chargée, à la place de config_path (copie modifiée
+                    par un script ; la configuration mise en cache reste en lecture seule)
         """
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        self.config = config if config is not None else load_config(config_path)
         
         keypoints_config = self.config['models']['weight']['geometric']
         self.num_keypoints = keypoints_config['num_keypoints']
@@ -46,8 +53,20 @@ class KeypointDetector:
             model_path = keypoints_config['keypoints_model']
         
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model = self._load_model(model_path)
-        self.model.eval()
+        # Poids mappés en mémoire, partagés entre workers (voir startup.mmap_weights)
+        self.mmap_weights = self.config.get('startup', {}).get('mmap_weights', False)
+        # Hors-ligne: jamais de téléchargement des poids ImageNet
+        self.offline = self.config.get('startup', {}).get('offline', False)
+        self.shared_model = shared_model
+        if shared_model is not None:
+            # Points clés fournis par la tête dédiée du modèle multi-tête
+            self.num_keypoints = shared_model.num_keypoints
+            self.model = None
+        else:
+            # Backend torch (précision, compilation) ou ONNX Runtime, voir inference/backends.py
+            self.backend = load_backend(keypoints_config, model_path, lambda: self._load_model(model_path),
+                                        (3, 256, 256), self.device, self.config, name='keypoints')
+            self.model = getattr(self.backend, 'model', None)
         
         self.transform = transforms.Compose([
             transforms.ToPILImage(),
@@ -59,7 +78,8 @@ class KeypointDetector:
     def _load_model(self, model_path: str):
         """Charge le modèle de détection de points clés"""
         # Architecture basée sur ResNet50 avec sortie pour keypoints
-        model = models.resnet50(pretrained=True)
+        # Poids ImageNet seulement sans checkpoint (écrasés sinon)
+        model = build_resnet50(model_path, offline=self.offline)
         
         # Modifier pour détecter les keypoints
         num_features = model.fc.in_features
@@ -67,11 +87,8 @@ class KeypointDetector:
         model.fc = nn.Linear(num_features, self.num_keypoints * 3)  # x, y, visibility
         
         if Path(model_path).exists():
-            checkpoint = torch.load(model_path, map_location=self.device)
-            if 'model_state_dict' in checkpoint:
-                model.load_state_dict(checkpoint['model_state_dict'])
-            else:
-                model.load_state_dict(checkpoint)
+            checkpoint = load_checkpoint(model_path, self.device, mmap=self.mmap_weights)
+            apply_state_dict(model, checkpoint, mmap=self.mmap_weights)
         
         model.to(self.device)
         return model
@@ -89,21 +106,63 @@ class KeypointDetector:
         """
         # Extraire la région
         x1, y1, x2, y2 = bbox
-        roi = image[y1:y2, x1:x2]
         
-        # Prétraiter
-        roi_rgb = cv2.cvtColor(roi, cv2.COLOR_BGR2RGB)
-        tensor = self.transform(roi_rgb).unsqueeze(0).to(self.device)
+        if self.shared_model is not None:
+            # Sortie déjà calculée si le crop est passé par la Re-ID
+            keypoints = self.shared_model.infer(image, [bbox])['keypoints'][0]
+        else:
+            roi = image[y1:y2, x1:x2]
+            
+            # Prétraiter
+            roi_rgb = cv2.cvtColor(roi, cv2.COLOR_BGR2RGB)
+            tensor = self.transform(roi_rgb).unsqueeze(0).to(self.device)
+            
+            # Inférence
+            with torch.inference_mode():
+                output = self.backend(tensor)
+                output = output.cpu().numpy()[0]
+            
+            # Reshape: [num_keypoints * 3] -> [num_keypoints, 3]
+            keypoints = output.reshape(self.num_keypoints, 3)
+        
+        return self._to_absolute(keypoints, bbox)
+    
+    def detect_batch(self, image: np.ndarray, bboxes: List[List[int]],
+                     crops: Optional[CropBatch] = None) -> List[Dict]:
+        """
+        Détecte les points clés de plusieurs porcs d'une image en un seul forward
+        
+        Mêmes résultats que detect boîte par boîte : les crops sont redimensionnés
+        comme par self.transform (PIL bilinéaire, voir CropBatch).
         
-        # Inférence
-        with torch.no_grad():
-            output = self.model(tensor)
-            output = output.cpu().numpy()[0]
+        Args:
+            image: Image complète
+            bboxes: Bounding boxes [x1, y1, x2, y2]
+            crops: Crops de la frame déjà préparés (CropBatch), optionnel
+            
+        Returns:
+            Un dict par boîte (voir detect)
+        """
+        if not len(bboxes):
+            return []
         
-        # Reshape: [num_keypoints * 3] -> [num_keypoints, 3]
-        keypoints = output.reshape(self.num_keypoints, 3)
+        if self.shared_model is not None:
+            keypoints = self.shared_model.infer(image, bboxes, crops)['keypoints']
+        else:
+            rows = crops.rows(bboxes) if crops is not None else None
+            if rows is None:
+                crops = CropBatch(image, bboxes)
+            batch = crops.tensor((256, 256), resize='pil', rows=rows).to(self.device)
+            
+            with torch.inference_mode():
+                output = self.backend(batch).cpu().numpy()
+            keypoints = output.reshape(len(bboxes), self.num_keypoints, 3)
         
-        # Convertir les coordonnées relatives en coordonnées absolues
+        return [self._to_absolute(kps, bbox) for kps, bbox in zip(keypoints, bboxes)]
+    
+    def _to_absolute(self, keypoints: np.ndarray, bbox: List[int]) -> Dict:
+        """Convertit les coordonnées relatives au crop en coordonnées absolues"""
+        x1, y1, x2, y2 = bbox
         roi_width = x2 - x1
         roi_height = y2 - y1
         
@@ -0,0 +1,216 @@
+"""
+Gestion des modèles optionnels du pipeline
+Chargement au premier usage, déchargement après inactivité et budget mémoire
+par worker (éviction du modèle utilisé le moins récemment)
+"""
+
+import gc
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def footprint_bytes(component: Any) -> int:
+    """Taille des paramètres et buffers torch d'un composant (attribut `model`)"""
+    model = getattr(component, 'model', None)
+    if model is None:
+        # Backend ONNX Runtime: taille du graphe exporté (poids compris)
+        return getattr(getattr(component, 'backend', None), 'size_bytes', 0)
+    if not hasattr(model, 'parameters'):
+        return 0
+    tensors = list(model.parameters()) + list(model.buffers())
+    if not tensors:
+        # Modèle TorchScript gelé: les poids sont des constantes du graphe
+        from .compiled import compiled_bytes
+        return compiled_bytes(model)
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class _ManagedModel:
+    """État d'un modèle géré"""
+
+    def __init__(self, name: str, factory: Callable[[], Any], ttl_s: Optional[float]):
+        self.name = name
+        self.factory = factory
+        self.ttl_s = ttl_s
+        self.instance = None
+        self.error: Optional[str] = None
+        self.size_bytes = 0
+        self.loaded_at: Optional[float] = None
+        self.last_used: Optional[float] = None
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.lock = threading.Lock()  # Un seul chargement à la fois par modèle
+
+
+class ModelManager:
+    """
+    Modèles chargés à la demande
+
+    `get(name)` construit le modèle au premier appel puis le garde en mémoire.
+    Un modèle inutilisé depuis plus de `idle_ttl_s` est déchargé ; si la taille
+    des modèles résidents dépasse `memory_budget_mb`, les modèles utilisés le
+    moins récemment sont déchargés d'abord. Une requête en cours garde sa
+    référence : le déchargement ne libère la mémoire qu'à la fin de son usage.
+    """
+
+    def __init__(self, idle_ttl_s: Optional[float] = 600.0, memory_budget_mb: Optional[float] = None,
+                 reap_interval_s: Optional[float] = 60.0):
+        """
+        Args:
+            idle_ttl_s: Inactivité avant déchargement (None ou 0: jamais)
+            memory_budget_mb: Budget des modèles résidents par worker (None ou 0: illimité)
+            reap_interval_s: Période du thread de déchargement (None ou 0: à chaque get seulement)
+        """
+        self.idle_ttl_s = idle_ttl_s or None
+        self.memory_budget_bytes = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        self._models: Dict[str, _ManagedModel] = {}
+        self._lock = threading.RLock()
+
+        self._stop = threading.Event()
+        self._reaper: Optional[threading.Thread] = None
+        if reap_interval_s:
+            self._reaper = threading.Thread(target=self._reap_loop, args=(reap_interval_s,),
+                                            name='model-reaper', daemon=True)
+            self._reaper.start()
+
+    def register(self, name: str, factory: Callable[[], Any], ttl_s: Optional[float] = None,
+                 preload: bool = False):
+        """
+        Déclare un modèle
+
+        Args:
+            name: Nom du modèle (ex: 'segmentation')
+            factory: Construction du modèle (appelée au premier usage)
+            ttl_s: Inactivité avant déchargement, à la place de idle_ttl_s
+            preload: Charger tout de suite au lieu d'attendre le premier usage
+        """
+        with self._lock:
+            self._models[name] = _ManagedModel(name, factory, ttl_s if ttl_s is not None else self.idle_ttl_s)
+        if preload:
+            self.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._models
+
+    def get(self, name: str) -> Any:
+        """Modèle prêt à l'emploi, chargé si besoin (None si inconnu ou en échec de chargement)"""
+        entry = self._models.get(name)
+        if entry is None:
+            return None
+        if self._reaper is None:
+            self.collect_idle()
+
+        with entry.lock:
+            if entry.instance is None and entry.error is None:
+                self._load(entry)
+            entry.last_used = time.time()
+            instance = entry.instance
+
+        if instance is not None:
+            self._enforce_budget(keep=name)
+        return instance
+
+    def unload(self, name: str) -> bool:
+        """Décharge un modèle (rechargé au prochain get)"""
+        entry = self._models.get(name)
+        if entry is None:
+            return False
+        with entry.lock:
+            if entry.instance is None:
+                return False
+            entry.instance = None
+            entry.size_bytes = 0
+            entry.loaded_at = None
+        self._release_memory()
+        logger.info(f"Modèle déchargé: {name}")
+        return True
+
+    def collect_idle(self) -> List[str]:
+        """Décharge les modèles inactifs depuis plus de leur TTL"""
+        now = time.time()
+        unloaded = []
+        for entry in list(self._models.values()):
+            if entry.instance is not None and entry.ttl_s and now - entry.last_used > entry.ttl_s:
+                if self.unload(entry.name):
+                    unloaded.append(entry.name)
+        return unloaded
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(entry.size_bytes for entry in self._models.values() if entry.instance is not None)
+
+    def status(self) -> Dict:
+        """État des modèles (résidents ou non), pour /api/models"""
+        now = time.time()
+        models = {}
+        for entry in self._models.values():
+            resident = entry.instance is not None
+            models[entry.name] = {
+                'resident': resident,
+                'size_mb': round(entry.size_bytes / 1024 / 1024, 1) if resident else 0.0,
+                'idle_s': round(now - entry.last_used, 1) if entry.last_used else None,
+                'ttl_s': entry.ttl_s,
+                'loads': entry.loads,
+                'last_load_s': round(entry.load_seconds, 3) if entry.loads else None,
+                'error': entry.error
+            }
+        return {
+            'models': models,
+            'resident_mb': round(self.resident_bytes / 1024 / 1024, 1),
+            'memory_budget_mb': round(self.memory_budget_bytes / 1024 / 1024, 1) if self.memory_budget_bytes else None
+        }
+
+    def close(self):
+        """Arrête le thread de déchargement"""
+        self._stop.set()
+
+    def _load(self, entry: _ManagedModel):
+        """Construit le modèle (verrou de l'entrée tenu par l'appelant)"""
+        start = time.perf_counter()
+        try:
+            entry.instance = entry.factory()
+        except Exception as e:
+            # Pas de nouvel essai à chaque requête: le modèle reste indisponible
+            entry.error = str(e)
+            print(f"⚠️  Erreur lors du chargement du modèle '{entry.name}': {e}")
+            return
+        entry.load_seconds = time.perf_counter() - start
+        entry.loads += 1
+        entry.loaded_at = time.time()
+        entry.size_bytes = footprint_bytes(entry.instance)
+        logger.info(f"Modèle chargé à la demande: {entry.name} "
+                    f"({entry.size_bytes / 1024 / 1024:.0f} MB, {entry.load_seconds:.2f} s)")
+
+    def _enforce_budget(self, keep: str):
+        """Décharge les modèles les moins récemment utilisés tant que le budget est dépassé"""
+        if not self.memory_budget_bytes:
+            return
+        with self._lock:
+            candidates = sorted((entry for entry in self._models.values()
+                                 if entry.instance is not None and entry.name != keep),
+                                key=lambda entry: entry.last_used or 0.0)
+            for entry in candidates:
+                if self.resident_bytes <= self.memory_budget_bytes:
+                    break
+                self.unload(entry.name)
+
+    def _reap_loop(self, interval_s: float):
+        while not self._stop.wait(interval_s):
+            try:
+                self.collect_idle()
+            except Exception as e:
+                logger.warning(f"Erreur lors du déchargement des modèles inactifs: {e}")
+
+    @staticmethod
+    def _release_memory():
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
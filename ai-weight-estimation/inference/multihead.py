@@ -0,0 +1,236 @@
+"""
+Modèle multi-tête à backbone partagé
+Un seul passage ResNet50 par crop pour la Re-ID, le poids et les points clés
+"""
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torchvision import models
+from typing import Dict, List, Optional
+from pathlib import Path
+
+from .backends import load_backend
+from .embedding_cache import EmbeddingCache
+from .preprocessing import CropBatch
+from .startup import apply_state_dict, load_checkpoint, load_config
+
+
+class MultiHeadPigNet(nn.Module):
+    """
+    ResNet50 partagé + trois têtes
+
+    Les têtes ont la même forme que la couche `fc` des modèles séparés
+    (PigReID, WeightEstimator, KeypointDetector), ce qui permet de les
+    initialiser depuis les checkpoints existants avant le fine-tuning conjoint.
+    """
+
+    def __init__(self, feature_dim: int = 512, num_keypoints: int = 18, pretrained: bool = False):
+        super().__init__()
+        self.feature_dim = feature_dim
+        self.num_keypoints = num_keypoints
+
+        backbone = models.resnet50(pretrained=pretrained)
+        num_features = backbone.fc.in_features
+        backbone.fc = nn.Identity()
+        self.backbone = backbone
+
+        self.reid_head = nn.Linear(num_features, feature_dim)
+        self.weight_head = nn.Sequential(
+            nn.Linear(num_features, 512),
+            nn.ReLU(),
+            nn.Dropout(0.5),
+            nn.Linear(512, 256),
+            nn.ReLU(),
+            nn.Dropout(0.3),
+            nn.Linear(256, 1)  # Sortie: poids en kg
+        )
+        self.keypoint_head = nn.Linear(num_features, num_keypoints * 3)  # x, y, visibility
+
+    def forward(self, x: torch.Tensor) -> Dict[str, torch.Tensor]:
+        trunk = self.backbone(x)
+        return {
+            'reid': nn.functional.normalize(self.reid_head(trunk), p=2, dim=1),
+            'weight': self.weight_head(trunk).squeeze(1),
+            'keypoints': self.keypoint_head(trunk)
+        }
+
+    def load_separate_checkpoints(self, reid_path: Optional[str] = None, weight_path: Optional[str] = None,
+                                  keypoints_path: Optional[str] = None,
+                                  backbone_from: str = 'reid') -> List[str]:
+        """
+        Initialise les têtes (et le backbone) depuis les modèles séparés
+
+        Args:
+            reid_path, weight_path, keypoints_path: Checkpoints des modèles séparés
+            backbone_from: Modèle dont on reprend le backbone ('reid', 'weight' ou 'keypoints')
+
+        Returns:
+            Liste des checkpoints effectivement chargés
+        """
+        sources = {'reid': (reid_path, self.reid_head), 'weight': (weight_path, self.weight_head),
+                   'keypoints': (keypoints_path, self.keypoint_head)}
+        loaded = []
+        for name, (path, head) in sources.items():
+            if not path or not Path(path).exists():
+                continue
+            checkpoint = torch.load(path, map_location='cpu')
+            state_dict = checkpoint.get('model_state_dict', checkpoint)
+
+            head.load_state_dict({key[len('fc.'):]: value for key, value in state_dict.items()
+                                  if key.startswith('fc.')})
+            if name == backbone_from:
+                self.backbone.load_state_dict({key: value for key, value in state_dict.items()
+                                               if not key.startswith('fc.')}, strict=False)
+            loaded.append(name)
+        return loaded
+
+
+class ConcatenatedHeads(nn.Module):
+    """
+    Sorties de MultiHeadPigNet concaténées [reid | poids | keypoints] (N, largeur)
+
+    Un seul tensor de sortie, comme les modèles séparés : le modèle multi-tête
+    passe par les mêmes backends (précision, TorchScript gelé, ONNX Runtime).
+    """
+
+    def __init__(self, net: MultiHeadPigNet):
+        super().__init__()
+        self.net = net
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        out = self.net(x)
+        return torch.cat([out['reid'], out['weight'][:, None], out['keypoints']], dim=1)
+
+
+class SharedBackboneModel:
+    """
+    Inférence du modèle multi-tête
+
+    Chaque crop (image, bbox) n'est passé qu'une fois dans le backbone : les
+    sorties des trois têtes sont mises en cache pour la durée de vie de l'image,
+    si bien que Re-ID, poids et points clés d'un même porc ne coûtent qu'un forward.
+    Backend, précision et compilation se règlent dans la section `multihead`
+    comme pour les modèles séparés (voir inference/backends.py).
+    """
+
+    def __init__(self, model_path: str, config_path: str = "config/model_config.yaml",
+                 config: Optional[Dict] = None):
+        """
+        Args:
+            model_path: Checkpoint du modèle multi-tête
+            config_path: Chemin vers la configuration
+            config: Configuration déjà chargée, à la place de config_path (copie modifiée
+                    par un script ; la configuration mise en cache reste en lecture seule)
+        """
+        self.config = config if config is not None else load_config(config_path)
+
+        multihead_config = self.config.get('models', {}).get('multihead', {})
+        self.input_size = multihead_config.get('input_size', [224, 224])
+        self.max_batch_size = multihead_config.get('max_batch_size', 32)
+        # Embeddings incompatibles avec ceux du ResNet50 dédié : galerie séparée
+        self.gallery_path = multihead_config.get('gallery_path', 'models/reid/gallery_multihead')
+
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+        # Poids mappés en mémoire, partagés entre workers (voir startup.mmap_weights)
+        mmap_weights = self.config.get('startup', {}).get('mmap_weights', False)
+        checkpoint = load_checkpoint(model_path, self.device, mmap=mmap_weights)
+        self.feature_dim = checkpoint.get('feature_dim', 512)
+        self.num_keypoints = checkpoint.get('num_keypoints', 18)
+        # Taille d'entrée utilisée à l'entraînement, prioritaire sur la configuration
+        self.input_size = list(checkpoint.get('input_size', self.input_size))
+
+        def load_model() -> nn.Module:
+            net = MultiHeadPigNet(feature_dim=self.feature_dim, num_keypoints=self.num_keypoints)
+            apply_state_dict(net, checkpoint, mmap=mmap_weights)
+            return ConcatenatedHeads(net).to(self.device)
+
+        # Backend torch (précision, compilation) ou ONNX Runtime, comme les modèles séparés
+        self.backend = load_backend(multihead_config, model_path, load_model, (3, *self.input_size),
+                                    self.device, self.config, name='multihead')
+        self.model = getattr(self.backend, 'model', None)
+
+        # Sorties concaténées [reid | poids | keypoints] par crop
+        self.cache = EmbeddingCache()
+
+    def infer(self, image: np.ndarray, bboxes: List[List[int]],
+              crops: Optional[CropBatch] = None) -> Dict[str, np.ndarray]:
+        """
+        Sorties des trois têtes pour des crops d'une image
+
+        Args:
+            image: Image complète (BGR)
+            bboxes: Bounding boxes [x1, y1, x2, y2]
+            crops: Crops de la frame déjà préparés (CropBatch), optionnel
+
+        Returns:
+            Dict avec 'reid' (N, feature_dim) normalisé L2, 'weight' (N,) en kg
+            et 'keypoints' (N, num_keypoints, 3) en coordonnées relatives au crop
+        """
+        width = self.feature_dim + 1 + self.num_keypoints * 3
+        outputs = np.zeros((len(bboxes), width), dtype=np.float32)
+        missing = []
+        for i, bbox in enumerate(bboxes):
+            cached = self.cache.get(image, bbox)
+            if cached is None:
+                missing.append(i)
+            else:
+                outputs[i] = cached
+
+        if missing:
+            computed = self._forward_crops(image, [bboxes[i] for i in missing], crops)
+            for i, row in zip(missing, computed):
+                outputs[i] = row
+                self.cache.put(image, bboxes[i], row)
+
+        return {
+            'reid': outputs[:, :self.feature_dim],
+            'weight': outputs[:, self.feature_dim],
+            'keypoints': outputs[:, self.feature_dim + 1:].reshape(-1, self.num_keypoints, 3)
+        }
+
+    def _forward_crops(self, image: np.ndarray, bboxes: List[List[int]],
+                       crops: Optional[CropBatch] = None) -> np.ndarray:
+        """Forward batché des crops, sorties concaténées (N, largeur)"""
+        # Crops déjà préparés pour la frame si disponibles, sinon batch local
+        rows = crops.rows(bboxes) if crops is not None else None
+        if rows is None:
+            crops = CropBatch(image, bboxes)
+        batch = crops.tensor(self.input_size, rows=rows).to(self.device)
+
+        with torch.inference_mode():
+            outputs = [self.backend(batch[start:start + self.max_batch_size])
+                       for start in range(0, batch.shape[0], self.max_batch_size)]
+        return torch.cat(outputs).cpu().numpy()
+
+
+def load_shared_model(config_path: str = "config/model_config.yaml",
+                      config: Optional[Dict] = None) -> Optional[SharedBackboneModel]:
+    """
+    Charge le modèle multi-tête s'il est activé et entraîné
+
+    `config` remplace la configuration lue depuis config_path (voir SharedBackboneModel)
+
+    Returns:
+        Le modèle partagé, ou None pour revenir aux modèles séparés
+        (PigReID, WeightEstimator, KeypointDetector)
+    """
+    config = config if config is not None else load_config(config_path)
+
+    multihead_config = config.get('models', {}).get('multihead', {})
+    if not multihead_config.get('enabled', False):
+        return None
+
+    model_path = multihead_config.get('path', 'models/multihead/pig_multihead_resnet50.pt')
+    if not Path(model_path).exists():
+        print(f"ℹ️  Modèle multi-tête non trouvé ({model_path}), utilisation des modèles séparés.")
+        return None
+
+    try:
+        model = SharedBackboneModel(model_path, config_path=config_path, config=config)
+        print(f"✅ Modèle multi-tête chargé: {model_path} (un backbone pour Re-ID, poids et points clés)")
+        return model
+    except Exception as e:
+        print(f"⚠️  Erreur lors du chargement du modèle multi-tête ({e}), utilisation des modèles séparés.")
+        return None
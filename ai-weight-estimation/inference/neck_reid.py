@@ -0,0 +1,231 @@
+"""
+Ré-identification à partir des features du détecteur
+Les cartes du neck YOLOv8 sont poolées dans chaque boîte (ROI-align) puis
+projetées par une petite tête apprise : aucun backbone supplémentaire par porc
+"""
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torchvision.ops import roi_align
+from typing import Dict, List, Optional, Sequence
+from pathlib import Path
+
+from .detections import DetectionBatch, boxes_of
+from .embedding_cache import EmbeddingCache
+from .startup import load_config
+
+
+class NeckEmbeddingHead(nn.Module):
+    """
+    ROI-align multi-échelle + projection vers l'espace Re-ID
+
+    Chaque niveau du neck (P3, P4, P5) est échantillonné dans la boîte sur une
+    grille `pool_size`, réduit par une convolution 1x1, puis les niveaux sont
+    concaténés et projetés en un embedding normalisé L2.
+    """
+
+    def __init__(self, in_channels: Sequence[int], strides: Sequence[int], feature_dim: int = 512,
+                 reduced_channels: int = 128, pool_size: Sequence[int] = (4, 4)):
+        super().__init__()
+        self.in_channels = list(in_channels)
+        self.strides = list(strides)
+        self.feature_dim = feature_dim
+        self.reduced_channels = reduced_channels
+        self.pool_size = tuple(pool_size)
+
+        self.reduce = nn.ModuleList([
+            nn.Sequential(nn.Conv2d(channels, reduced_channels, 1, bias=False),
+                          nn.BatchNorm2d(reduced_channels), nn.SiLU())
+            for channels in self.in_channels
+        ])
+        pooled_dim = len(self.in_channels) * reduced_channels * self.pool_size[0] * self.pool_size[1]
+        self.project = nn.Sequential(
+            nn.Flatten(),
+            nn.Linear(pooled_dim, feature_dim),
+            nn.BatchNorm1d(feature_dim)
+        )
+
+    def forward(self, maps: List[torch.Tensor], rois: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+            maps: Cartes du neck [(B, C_l, H_l, W_l)]
+            rois: Boîtes (K, 5) [index dans le batch, x1, y1, x2, y2] dans le repère letterboxé
+
+        Returns:
+            Embeddings (K, feature_dim) normalisés L2
+        """
+        return self.forward_pooled(self.pool(maps, rois))
+
+    def pool(self, maps: List[torch.Tensor], rois: torch.Tensor) -> List[torch.Tensor]:
+        """ROI-align de chaque niveau: [(K, C_l, *pool_size)] (sans paramètres appris)"""
+        return [
+            roi_align(level.float(), rois, self.pool_size, spatial_scale=1.0 / stride,
+                      sampling_ratio=2, aligned=True)
+            for level, stride in zip(maps, self.strides)
+        ]
+
+    def forward_pooled(self, pooled: List[torch.Tensor]) -> torch.Tensor:
+        """Projection des régions poolées (voir pool) en embeddings normalisés"""
+        reduced = [reduce(level) for level, reduce in zip(pooled, self.reduce)]
+        return nn.functional.normalize(self.project(torch.cat(reduced, dim=1)), p=2, dim=1)
+
+    @staticmethod
+    def letterbox_rois(bboxes: np.ndarray, letterbox: Dict, batch_index: int = 0) -> torch.Tensor:
+        """Boîtes de l'image originale -> ROIs (K, 5) dans le repère letterboxé"""
+        boxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4) * letterbox['scale']
+        boxes[:, [0, 2]] += letterbox['padding']['left']
+        boxes[:, [1, 3]] += letterbox['padding']['top']
+        index = np.full((len(boxes), 1), batch_index, dtype=np.float32)
+        return torch.from_numpy(np.hstack([index, boxes]))
+
+
+class NeckReID:
+    """
+    Fournisseur d'embeddings Re-ID basé sur le neck du détecteur
+
+    S'utilise comme `shared_model` de PigReID (même interface `infer` que
+    SharedBackboneModel). `detect` calcule les embeddings de toutes les boîtes
+    pendant la détection ; un crop absent du cache (image détectée ailleurs,
+    enregistrement) déclenche un forward du détecteur sur son image.
+    """
+
+    def __init__(self, detector, model_path: Optional[str] = None, config_path: str = "config/model_config.yaml",
+                 head: Optional[NeckEmbeddingHead] = None, config: Optional[Dict] = None):
+        """
+        Args:
+            detector: PigDetector (backend torch)
+            model_path: Checkpoint de la tête d'embedding (training/train_neck_reid.py)
+            config_path: Chemin vers la configuration
+            head: Tête déjà construite (à la place du checkpoint)
+            config: Configuration déjà chargée, à la place de config_path (copie modifiée
+                    par un script ; la configuration mise en cache reste en lecture seule)
+        """
+        self.config = config if config is not None else load_config(config_path)
+
+        neck_config = self.config.get('models', {}).get('reid', {}).get('neck', {})
+        self.gallery_path = neck_config.get('gallery_path', 'models/reid/gallery_neck')
+
+        self.detector = detector
+        self.device = next(detector.model.model.parameters()).device
+
+        if head is None:
+            checkpoint = torch.load(model_path, map_location=self.device)
+            head = NeckEmbeddingHead(
+                in_channels=checkpoint['in_channels'],
+                strides=checkpoint['strides'],
+                feature_dim=checkpoint.get('feature_dim', 512),
+                reduced_channels=checkpoint.get('reduced_channels', 128),
+                pool_size=checkpoint.get('pool_size', (4, 4))
+            )
+            head.load_state_dict(checkpoint['model_state_dict'])
+        self.head = head
+        self.head.to(self.device)
+        self.head.eval()
+
+        self.cache = EmbeddingCache()
+
+    @property
+    def feature_dim(self) -> int:
+        return self.head.feature_dim
+
+    def embed(self, features: Dict, bboxes: Sequence[Sequence[int]]) -> np.ndarray:
+        """Embeddings (N, feature_dim) des boîtes à partir des features d'une image"""
+        if not len(bboxes):
+            return np.zeros((0, self.feature_dim), dtype=np.float32)
+        rois = NeckEmbeddingHead.letterbox_rois(np.asarray(bboxes), features['letterbox']).to(self.device)
+        with torch.no_grad():
+            return self.head(features['maps'], rois).cpu().numpy()
+
+    def detect(self, image: np.ndarray) -> DetectionBatch:
+        """Détecte les porcs et met en cache leurs embeddings (un seul forward)"""
+        return self.detect_many([image])[0]
+
+    def detect_many(self, images: List[np.ndarray]) -> List[DetectionBatch]:
+        """
+        Détection batchée + embeddings de toutes les boîtes détectées
+
+        Même découpage en tuiles que le pipeline (PigDetector.should_tile) : les
+        boîtes des tuiles sont embeddées dans les features de l'image entière.
+        """
+        detections: List[Optional[DetectionBatch]] = [None] * len(images)
+        features: List[Optional[Dict]] = [None] * len(images)
+        regular = []
+        for i, image in enumerate(images):
+            if self.detector.should_tile(image):
+                detections[i], features[i] = self.detector.detect_tiled(image, return_features=True)
+            else:
+                regular.append(i)
+
+        if regular:
+            batches, maps = self.detector.detect_with_features([images[i] for i in regular])
+            for i, batch, image_features in zip(regular, batches, maps):
+                detections[i], features[i] = batch, image_features
+
+        for image, batch, image_features in zip(images, detections, features):
+            bboxes = boxes_of(batch).tolist()
+            for bbox, vector in zip(bboxes, self.embed(image_features, bboxes)):
+                self.cache.put(image, bbox, vector)
+        return detections
+
+    def infer(self, image: np.ndarray, bboxes: List[List[int]], crops=None) -> Dict[str, np.ndarray]:
+        """
+        Embeddings des crops d'une image (interface de SharedBackboneModel)
+
+        `crops` est ignoré : les embeddings viennent du neck du détecteur.
+
+        Returns:
+            Dict avec 'reid' (N, feature_dim) normalisé L2
+        """
+        embeddings = np.zeros((len(bboxes), self.feature_dim), dtype=np.float32)
+        missing = []
+        for i, bbox in enumerate(bboxes):
+            cached = self.cache.get(image, bbox)
+            if cached is None:
+                missing.append(i)
+            else:
+                embeddings[i] = cached
+
+        if missing:
+            _, features = self.detector.detect_with_features([image])
+            computed = self.embed(features[0], [bboxes[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                embeddings[i] = vector
+                self.cache.put(image, bboxes[i], vector)
+
+        return {'reid': embeddings}
+
+
+def load_neck_reid(detector, config_path: str = "config/model_config.yaml",
+                   config: Optional[Dict] = None) -> Optional[NeckReID]:
+    """
+    Charge le mode Re-ID « neck » s'il est activé et entraîné
+
+    `config` remplace la configuration lue depuis config_path (voir NeckReID)
+
+    Returns:
+        Le fournisseur d'embeddings, ou None pour garder PigReID (ResNet50 par crop)
+    """
+    config = config if config is not None else load_config(config_path)
+
+    neck_config = config.get('models', {}).get('reid', {}).get('neck', {})
+    if not neck_config.get('enabled', False):
+        return None
+
+    if detector is None or detector.model is None:
+        print("⚠️  Re-ID neck indisponible: le détecteur doit utiliser le backend torch.")
+        return None
+
+    model_path = neck_config.get('path', 'models/reid/neck_reid_head.pt')
+    if not Path(model_path).exists():
+        print(f"ℹ️  Tête Re-ID neck non trouvée ({model_path}), utilisation de PigReID pour la vidéo.")
+        print("💡 Entraînez-la avec training/train_neck_reid.py")
+        return None
+
+    try:
+        neck_reid = NeckReID(detector, model_path, config_path=config_path, config=config)
+        print(f"✅ Re-ID neck chargée: {model_path} (embeddings tirés du détecteur)")
+        return neck_reid
+    except Exception as e:
+        print(f"⚠️  Erreur lors du chargement de la Re-ID neck ({e}), utilisation de PigReID.")
+        return None
@@ -0,0 +1,119 @@
+"""
+Backend ONNX Runtime (CPU) pour le détecteur YOLOv8
+Décodage des boîtes et NMS faits en NumPy vectorisé, sans torch ni ultralytics
+"""
+
+import ast
+import numpy as np
+from typing import List, Dict
+
+from .postprocessing import ResultPostprocessor
+
+# Décalage par classe pour une NMS par classe en un seul appel (comme ultralytics)
+MAX_WH = 7680
+
+
+class OnnxYoloRunner:
+    """Exécute un graphe YOLOv8 exporté en ONNX sur le CPU"""
+
+    def __init__(self, onnx_path: str, confidence_threshold: float = 0.5,
+                 iou_threshold: float = 0.45, max_detections: int = 300,
+                 num_threads: int = 0):
+        """
+        Args:
+            onnx_path: Chemin vers le modèle exporté (`yolo export format=onnx`)
+            confidence_threshold: Seuil de confiance minimum
+            iou_threshold: Seuil IoU pour la NMS
+            max_detections: Nombre maximum de détections par image
+            num_threads: Threads intra-op (0 = choix d'onnxruntime)
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        self.session = ort.InferenceSession(onnx_path, sess_options=options,
+                                            providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_shape = model_input.shape  # [batch, 3, H, W], dims dynamiques en str
+
+        self.confidence_threshold = confidence_threshold
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+        self.names = self._read_names()
+
+    @property
+    def static_batch(self) -> bool:
+        """True si le graphe a été exporté avec un batch fixe"""
+        return isinstance(self.input_shape[0], int)
+
+    @property
+    def dynamic_shape(self) -> bool:
+        """True si la hauteur et la largeur d'entrée sont dynamiques"""
+        return not all(isinstance(dim, int) for dim in self.input_shape[2:])
+
+    def _read_names(self) -> Dict[int, str]:
+        """Lit les noms de classes écrits par ultralytics dans les métadonnées ONNX"""
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        try:
+            return ast.literal_eval(metadata['names'])
+        except (KeyError, ValueError, SyntaxError):
+            return {0: 'pig'}
+
+    def __call__(self, batch: np.ndarray) -> List[np.ndarray]:
+        """
+        Args:
+            batch: Tensor (B, 3, H, W) float32 RGB dans [0, 1]
+
+        Returns:
+            Pour chaque image, un tableau (N, 6) [x1, y1, x2, y2, conf, cls]
+            dans le repère du tensor d'entrée
+        """
+        if self.static_batch and batch.shape[0] != self.input_shape[0]:
+            # Graphe exporté sans axe batch dynamique : une image à la fois
+            outputs = np.concatenate([
+                self.session.run(None, {self.input_name: batch[i:i + 1]})[0]
+                for i in range(batch.shape[0])
+            ])
+        else:
+            outputs = self.session.run(None, {self.input_name: batch})[0]
+
+        # Sortie YOLOv8: (B, 4 + nc, A) avec boîtes en cx, cy, w, h
+        height, width = batch.shape[2:]
+        return [self._postprocess(prediction, width, height) for prediction in outputs]
+
+    def _postprocess(self, prediction: np.ndarray, width: int, height: int) -> np.ndarray:
+        """Décode les ancres d'une image et applique la NMS par classe"""
+        prediction = prediction.T  # (A, 4 + nc)
+        class_scores = prediction[:, 4:]
+        classes = class_scores.argmax(axis=1)
+        confidences = class_scores[np.arange(len(classes)), classes]
+
+        mask = confidences > self.confidence_threshold
+        if not mask.any():
+            return np.zeros((0, 6), dtype=np.float32)
+
+        xywh = prediction[mask, :4]
+        confidences = confidences[mask]
+        classes = classes[mask].astype(np.float32)
+
+        boxes = np.empty_like(xywh)
+        boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+        boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+
+        # Décaler chaque classe pour qu'une NMS unique reste par classe
+        keep = ResultPostprocessor.nms_indices(
+            boxes + classes[:, None] * MAX_WH, confidences, self.iou_threshold
+        )[:self.max_detections]
+        boxes = boxes[keep]
+
+        # Borner à l'image après la NMS, comme ultralytics
+        np.clip(boxes[:, 0::2], 0, width, out=boxes[:, 0::2])
+        np.clip(boxes[:, 1::2], 0, height, out=boxes[:, 1::2])
+
+        return np.concatenate([
+            boxes, confidences[keep, None], classes[keep, None]
+        ], axis=1).astype(np.float32)
@@ -7,12 +7,13 @@ import cv2
 import numpy as np
 from typing import List, Dict, Optional, Literal
 from pathlib import Path
-import yaml
 from datetime import datetime
 
 from .detector import PigDetector
 from .reid import PigReID
 from .weight_estimator import WeightEstimator
+from .multihead import load_shared_model
+from .startup import StartupTimer, load_config
 
 class WeightEstimationPipeline:
     """Pipeline complet pour la pesée automatique des porcs"""
@@ -25,14 +26,22 @@ class WeightEstimationPipeline:
             config_path: Chemin vers le fichier de configuration
         """
         # Charger la configuration
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        self.config = load_config(config_path)
         
         # Initialiser les composants
         print("Chargement des modèles...")
-        self.detector = PigDetector(config_path=config_path)
-        self.reid = PigReID(config_path=config_path)
-        self.weight_estimator = WeightEstimator(config_path=config_path)
+        timer = StartupTimer()
+        with timer.measure('detector'):
+            self.detector = PigDetector(config_path=config_path)
+        with timer.measure('multihead'):
+            self.shared_model = load_shared_model(config_path=config_path)  # None -> modèles séparés
+        with timer.measure('reid'):
+            self.reid = PigReID(config_path=config_path, shared_model=self.shared_model)
+        with timer.measure('weight_cnn'):
+            self.weight_estimator = WeightEstimator(config_path=config_path, shared_model=self.shared_model)
+        if self.config.get('startup', {}).get('timing_report', True):
+            timer.report()
+        self.startup_report = timer.summary()
         print("Modèles chargés avec succès!")
         
     def process_image(self, image_path: str, mode: Literal['individual', 'group'] = 'group',
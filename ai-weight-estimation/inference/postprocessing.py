@@ -3,15 +3,16 @@ Module de post-traitement des résultats
 """
 
 import numpy as np
-from typing import List, Dict, Tuple
-import yaml
+from typing import List, Dict, Optional, Tuple
+
+from .detections import DetectionBatch
+from .startup import load_config
 
 class ResultPostprocessor:
     """Post-traitement des résultats de l'inférence"""
     
     def __init__(self, config_path: str = "config/inference_config.yaml"):
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        self.config = load_config(config_path)
     
     def apply_nms(self, detections: List[Dict], iou_threshold: float = 0.45) -> List[Dict]:
         """
@@ -27,22 +28,127 @@ class ResultPostprocessor:
         if not detections:
             return []
         
-        # Trier par confiance décroissante
-        sorted_dets = sorted(detections, key=lambda x: x['confidence'], reverse=True)
+        boxes = np.array([det['bbox'] for det in detections], dtype=np.float32)
+        scores = np.array([det['confidence'] for det in detections], dtype=np.float32)
+        keep = self.nms_indices(boxes, scores, iou_threshold)
+        
+        return [detections[i] for i in keep]
+    
+    @staticmethod
+    def nms_indices(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float = 0.45,
+                    metric: str = 'iou', groups: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Non-Maximum Suppression vectorisée
+        
+        Args:
+            boxes: Boîtes (N, 4) [x1, y1, x2, y2]
+            scores: Scores (N,)
+            iou_threshold: Seuil de recouvrement au-delà duquel une boîte est supprimée
+            metric: 'iou' (intersection / union) ou 'ios' (intersection / plus petite
+                    surface, adapté aux boîtes tronquées par un bord de tuile)
+            groups: Groupe (N,) de chaque boîte ; deux boîtes du même groupe ne se
+                    suppriment jamais (déjà filtrées entre elles, ex. même tuile)
+            
+        Returns:
+            Indices des boîtes conservées, par score décroissant
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        if boxes.shape[0] == 0:
+            return np.zeros(0, dtype=np.int64)
+        
+        x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+        areas = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        order = np.argsort(-scores, kind='stable')
         
         keep = []
-        while sorted_dets:
-            # Prendre la détection avec la plus haute confiance
-            current = sorted_dets.pop(0)
-            keep.append(current)
+        while order.size > 0:
+            i = order[0]
+            keep.append(i)
+            rest = order[1:]
+            
+            # IoU de la meilleure boîte contre toutes les restantes en une opération
+            w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+            h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+            intersection = w * h
+            if metric == 'ios':
+                denominator = np.minimum(areas[i], areas[rest])
+            else:
+                denominator = areas[i] + areas[rest] - intersection
+            overlap = np.where(denominator > 0, intersection / np.maximum(denominator, 1e-9), 0.0)
+            
+            suppressed = overlap >= iou_threshold
+            if groups is not None:
+                suppressed &= groups[rest] != groups[i]
+            order = rest[~suppressed]
+        
+        return np.array(keep, dtype=np.int64)
+    
+    @staticmethod
+    def merge_tiled_detections(batches: List[DetectionBatch], offsets: List[Tuple[int, int]],
+                               iou_threshold: float = 0.5, names=None,
+                               tile_sizes: Optional[List[Tuple[int, int]]] = None,
+                               image_size: Optional[Tuple[int, int]] = None,
+                               border_weight: float = 0.5, border_margin: float = 2.0) -> DetectionBatch:
+        """
+        Fusionne les détections de tuiles qui se chevauchent
+        
+        Le recouvrement intersection / plus petite boîte n'est appliqué qu'entre
+        boîtes de tuiles différentes : dans une même tuile, la NMS du détecteur a
+        déjà séparé les porcs collés. Une boîte qui touche un bord intérieur de sa
+        tuile est probablement un porc coupé : son score est pondéré par
+        `border_weight` pour l'ordre de fusion, la boîte complète d'une tuile
+        voisine (ou de l'image entière) l'emporte donc.
+        
+        Args:
+            batches: Détections de chaque tuile (repère de la tuile)
+            offsets: Position (x, y) du coin haut-gauche de chaque tuile dans l'image
+            iou_threshold: Seuil de recouvrement (intersection / plus petite boîte)
+            names: Noms des classes
+            tile_sizes: Taille (width, height) de chaque tuile (avec image_size,
+                active la pondération des bords intérieurs)
+            image_size: Taille (width, height) de l'image complète
+            border_weight: Poids du score des boîtes coupées par un bord intérieur
+            border_margin: Distance (px) au bord en dessous de laquelle une boîte le touche
             
-            # Supprimer les détections qui chevauchent trop
-            sorted_dets = [
-                det for det in sorted_dets
-                if self._calculate_iou(current['bbox'], det['bbox']) < iou_threshold
-            ]
+        Returns:
+            Détections dans le repère de l'image complète, doublons supprimés
+            (confiances d'origine)
+        """
+        tiles = [
+            (batch, offset, tile_sizes[i] if tile_sizes else None, i)
+            for i, (batch, offset) in enumerate(zip(batches, offsets)) if len(batch)
+        ]
+        if not tiles:
+            return DetectionBatch.empty(names)
+        
+        boxes = np.concatenate([
+            batch.boxes + np.array([x, y, x, y], dtype=np.float32) for batch, (x, y), _, _ in tiles
+        ])
+        confidences = np.concatenate([batch.confidences for batch, _, _, _ in tiles])
+        classes = np.concatenate([batch.classes for batch, _, _, _ in tiles])
+        groups = np.concatenate([np.full(len(batch), i) for batch, _, _, i in tiles])
+        
+        ranking = confidences
+        if tile_sizes is not None and image_size is not None:
+            width, height = image_size
+            weights = []
+            for batch, (x, y), (tile_w, tile_h), _ in tiles:
+                local = batch.boxes
+                # Bords de la tuile qui ne sont pas des bords de l'image
+                cut = ((x > 0) & (local[:, 0] <= border_margin)) | \
+                      ((y > 0) & (local[:, 1] <= border_margin)) | \
+                      ((x + tile_w < width) & (local[:, 2] >= tile_w - border_margin)) | \
+                      ((y + tile_h < height) & (local[:, 3] >= tile_h - border_margin))
+                weights.append(np.where(cut, border_weight, 1.0))
+            ranking = confidences * np.concatenate(weights).astype(np.float32)
+        
+        # Décaler chaque classe pour qu'une NMS unique reste par classe
+        class_offset = classes[:, None].astype(np.float32) * (boxes.max() + 1)
+        keep = ResultPostprocessor.nms_indices(boxes + class_offset, ranking, iou_threshold,
+                                               metric='ios', groups=groups)
         
-        return keep
+        return DetectionBatch(boxes[keep], confidences[keep], classes[keep], names)
     
     def _calculate_iou(self, bbox1: List[int], bbox2: List[int]) -> float:
         """Calcule l'IoU entre deux bounding boxes"""
@@ -78,23 +184,37 @@ class ResultPostprocessor:
         Returns:
             Bounding box dans l'image originale
         """
-        x1, y1, x2, y2 = bbox
+        return self.transform_boxes(np.array([bbox], dtype=np.float32), metadata)[0].astype(int).tolist()
+    
+    @staticmethod
+    def transform_boxes(boxes: np.ndarray, metadata: Dict) -> np.ndarray:
+        """
+        Version vectorisée de transform_bbox pour toutes les boîtes d'une image
+        
+        Args:
+            boxes: Boîtes (N, 4) dans l'image letterboxée
+            metadata: Métadonnées du prétraitement (scale, padding, original_size)
+            
+        Returns:
+            Boîtes (N, 4) float32 dans l'image originale, bornées à l'image
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
         scale = metadata.get('scale', 1.0)
         padding = metadata.get('padding', {})
+        left = padding.get('left', 0)
+        top = padding.get('top', 0)
         
-        # Retirer le padding
-        x1 = x1 - padding.get('left', 0)
-        y1 = y1 - padding.get('top', 0)
-        x2 = x2 - padding.get('left', 0)
-        y2 = y2 - padding.get('top', 0)
+        # Retirer le padding puis appliquer l'inverse du scale
+        offset = np.array([left, top, left, top], dtype=np.float32)
+        transformed = (boxes - offset) / scale
         
-        # Appliquer l'inverse du scale
-        x1 = int(x1 / scale)
-        y1 = int(y1 / scale)
-        x2 = int(x2 / scale)
-        y2 = int(y2 / scale)
+        original_size = metadata.get('original_size')
+        if original_size:
+            w, h = original_size
+            np.clip(transformed[:, 0::2], 0, w, out=transformed[:, 0::2])
+            np.clip(transformed[:, 1::2], 0, h, out=transformed[:, 1::2])
         
-        return [x1, y1, x2, y2]
+        return transformed
     
     def calculate_confidence_interval(self, weight: float, confidence: float, 
                                      weight_class: str = 'croissance') -> Dict[str, float]:
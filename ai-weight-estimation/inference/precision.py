@@ -0,0 +1,140 @@
+"""
+Précision d'inférence CPU par modèle
+bfloat16 via l'autocast CPU et format mémoire channels_last, activés
+seulement si la calibration du checkpoint (scripts/calibrate_precision.py)
+a validé la perte de précision
+"""
+
+import json
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, Optional
+
+import torch
+
+DTYPES = ('fp32', 'bf16')
+MEMORY_FORMATS = ('contiguous', 'channels_last')
+
+
+def calibration_path(model_path: str) -> Path:
+    """Rapport de calibration d'un checkpoint (lié à son empreinte: un nouveau checkpoint doit être recalibré)"""
+    from .compiled import checkpoint_digest
+    return Path(model_path).parent / 'calibration' / f"{Path(model_path).stem}-{checkpoint_digest(model_path)[:16]}.json"
+
+
+def load_calibration(model_path: Optional[str]) -> Dict:
+    """Résultats de calibration par mode ({} si le checkpoint n'a jamais été calibré)"""
+    if not model_path or not Path(model_path).exists():
+        return {}
+    path = calibration_path(model_path)
+    if not path.exists():
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_calibration(model_path: str, dtype: str, result: Dict) -> Path:
+    """Ajoute (ou remplace) le résultat d'un mode dans le rapport du checkpoint"""
+    report = load_calibration(model_path)
+    report[dtype] = result
+    path = calibration_path(model_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def bf16_supported() -> bool:
+    """bfloat16 rapide sur ce CPU (AVX512-BF16 / AMX ou émulation efficace oneDNN)"""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+class InferencePrecision:
+    """
+    Précision et format mémoire d'un modèle
+
+    `prepare` convertit les poids au format mémoire demandé, `run` exécute le
+    forward sous autocast bfloat16 (CPU) et rend toujours des sorties float32.
+    Le mode bf16 retombe sur fp32 si le device n'est pas un CPU, si le CPU ne
+    gère pas bf16 ou si la calibration du checkpoint ne l'a pas validé.
+    """
+
+    def __init__(self, settings: Optional[Dict], device: torch.device, model_path: Optional[str] = None,
+                 calibration_settings: Optional[Dict] = None, name: str = 'model'):
+        """
+        Args:
+            settings: Section `precision` du modèle (dtype: fp32|bf16, memory_format: contiguous|channels_last)
+            device: Device du modèle
+            model_path: Checkpoint du modèle (clé du rapport de calibration)
+            calibration_settings: Section `precision_calibration` de model_config.yaml
+            name: Nom du modèle pour les messages
+        """
+        settings = settings or {}
+        calibration_settings = calibration_settings or {}
+        self.name = name
+        self.device = torch.device(device)
+        self.dtype = settings.get('dtype', 'fp32')
+        self.memory_format = settings.get('memory_format', 'contiguous')
+        if self.dtype not in DTYPES:
+            raise ValueError(f"Précision inconnue pour {name}: {self.dtype} (attendu: {', '.join(DTYPES)})")
+        if self.memory_format not in MEMORY_FORMATS:
+            raise ValueError(f"Format mémoire inconnu pour {name}: {self.memory_format} "
+                             f"(attendu: {', '.join(MEMORY_FORMATS)})")
+
+        if self.dtype == 'bf16':
+            reason = self._bf16_blocker(model_path, calibration_settings.get('require', True))
+            if reason:
+                print(f"⚠️  {name}: bf16 désactivé ({reason}), inférence en fp32.")
+                self.dtype = 'fp32'
+            else:
+                print(f"✅ {name}: inférence bf16 (autocast CPU), {self.memory_format}")
+
+    def _bf16_blocker(self, model_path: Optional[str], require_calibration: bool) -> Optional[str]:
+        """Raison d'empêcher le mode bf16 (None si autorisé)"""
+        if self.device.type != 'cpu':
+            return "autocast bf16 réservé au CPU"
+        if not bf16_supported():
+            return "CPU sans support bf16"
+        if not require_calibration:
+            return None
+        result = load_calibration(model_path).get('bf16')
+        if result is None:
+            return "aucune calibration pour ce checkpoint, lancer scripts/calibrate_precision.py"
+        if not result.get('approved', False):
+            return f"calibration refusée: {result.get('reason', 'écart trop important')}"
+        return None
+
+    @property
+    def channels_last(self) -> bool:
+        return self.memory_format == 'channels_last'
+
+    @property
+    def tag(self) -> str:
+        """Suffixe distinguant les variantes compilées (voir compile_for_inference)"""
+        return 'cl' if self.channels_last else ''
+
+    def prepare(self, model: torch.nn.Module) -> torch.nn.Module:
+        """Poids au format mémoire choisi"""
+        if self.channels_last:
+            model = model.to(memory_format=torch.channels_last)
+        return model
+
+    def inputs(self, tensor: torch.Tensor) -> torch.Tensor:
+        """Batch (N, C, H, W) au format mémoire choisi"""
+        if self.channels_last and tensor.dim() == 4:
+            return tensor.contiguous(memory_format=torch.channels_last)
+        return tensor
+
+    def autocast(self):
+        """Contexte autocast bf16 (ou contexte neutre en fp32)"""
+        if self.dtype == 'bf16':
+            return torch.autocast('cpu', dtype=torch.bfloat16)
+        return nullcontext()
+
+    def run(self, model, batch: torch.Tensor) -> torch.Tensor:
+        """Forward dans la précision choisie, sortie float32"""
+        with self.autocast():
+            return model(self.inputs(batch)).float()
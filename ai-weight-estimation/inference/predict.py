@@ -6,10 +6,11 @@ import cv2
 import numpy as np
 from typing import List, Dict, Optional, Literal
 from pathlib import Path
-import yaml
 from datetime import datetime
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
@@ -18,100 +19,143 @@ from .segmentation import PigSegmenter
 from .reid import PigReID
 from .keypoints import KeypointDetector
 from .weight_estimator import WeightEstimator
+from .multihead import load_shared_model
+from .neck_reid import load_neck_reid
 from .ensemble import WeightEnsemble
-from .preprocessing import ImagePreprocessor
+from .preprocessing import ImagePreprocessor, CropBatch
 from .postprocessing import ResultPostprocessor
 from .calibration import CalibrationSystem
 from .backend_sync import BackendSync
 from .auto_register import AutoRegister
 from .video_tracker import VideoTracker
+from .detections import DetectionBatch, boxes_of
+from .startup import StartupTimer, load_config
+from .model_manager import ModelManager
+from .cpu_budget import apply_thread_budget
+
+# Configuration des modèles partagée par tous les composants
+MODEL_CONFIG_PATH = "config/model_config.yaml"
 
 class WeightEstimationPipeline:
     """Pipeline complet pour la pesée automatique selon le README"""
     
-    def __init__(self, config_path: str = "config/inference_config.yaml"):
+    def __init__(self, config_path: str = "config/inference_config.yaml", model_config: Optional[Dict] = None):
         """
         Initialise le pipeline complet avec tous les modules
         
         Args:
             config_path: Chemin vers le fichier de configuration
+            model_config: Configuration des modèles déjà chargée, à la place de
+                          config/model_config.yaml (copie modifiée par un script)
         """
-        # Charger la configuration
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        # Configurations lues une seule fois, partagées par tous les composants
+        self.config = load_config(config_path)
+        self.model_config = model_config if model_config is not None else load_config(MODEL_CONFIG_PATH)
+        inference_config = self.config.get('inference', {})
+        startup_config = self.model_config.get('startup', {})
         
-        with open("config/model_config.yaml", 'r') as f:
-            self.model_config = yaml.safe_load(f)
+        # Threads torch/OpenCV répartis entre les workers de la machine (avant tout calcul)
+        self.thread_budget = apply_thread_budget(inference_config.get('performance', {}))
         
-        # Initialiser les composants
+        # Initialiser les composants: les modèles indépendants sont chargés en parallèle
         print("Chargement des modèles...")
-        try:
-            self.detector = PigDetector(config_path="config/model_config.yaml")
-        except Exception as e:
-            print(f"⚠️  Erreur lors du chargement du détecteur: {e}")
-            raise
-        
-        self.preprocessor = ImagePreprocessor(config_path=config_path)
-        self.postprocessor = ResultPostprocessor(config_path=config_path)
-        self.calibration = CalibrationSystem()
-        
-        # Initialiser la synchronisation avec le backend
-        try:
-            self.backend_sync = BackendSync(config_path="config/api_config.yaml")
-        except Exception as e:
-            print(f"⚠️  Erreur lors de l'initialisation de la synchronisation backend: {e}")
-            self.backend_sync = None
-        
-        # Initialiser le système d'enregistrement automatique
-        self.auto_register = None
-        
-        try:
-            self.reid = PigReID(config_path="config/model_config.yaml")
+        timer = StartupTimer()
+        
+        def load(component, factory, *args, **kwargs):
+            with timer.measure(component):
+                return factory(*args, **kwargs)
+        
+        with ThreadPoolExecutor(max_workers=startup_config.get('load_workers', 4),
+                                thread_name_prefix='model-load') as pool:
+            detector = pool.submit(load, 'detector', PigDetector, config_path=MODEL_CONFIG_PATH,
+                                   config=self.model_config)
+            # Modèle multi-tête optionnel: un seul backbone pour Re-ID, poids et points clés
+            # (None -> modèles séparés)
+            shared_model = pool.submit(load, 'multihead', load_shared_model, config_path=MODEL_CONFIG_PATH,
+                                       config=self.model_config)
+            backend_sync = pool.submit(load, 'backend_sync', BackendSync, config_path="config/api_config.yaml")
             
-            # Synchroniser les animaux depuis le backend si disponible
-            if self.backend_sync:
-                try:
-                    # Récupérer projet_id et user_id depuis les métadonnées si disponibles
-                    projet_id = self.config.get('backend', {}).get('default_projet_id')
-                    user_id = self.config.get('backend', {}).get('default_user_id')
-                    self.backend_sync.sync_animals_to_reid(self.reid, projet_id, user_id)
-                except Exception as e:
-                    print(f"⚠️  Erreur lors de la synchronisation des animaux: {e}")
+            # Modèles par porc, construits sur le modèle multi-tête s'il est disponible
+            self.shared_model = shared_model.result()
+            reid = pool.submit(load, 'reid', PigReID, config_path=MODEL_CONFIG_PATH,
+                               shared_model=self.shared_model, config=self.model_config)
+            weight_estimator = pool.submit(load, 'weight_cnn', WeightEstimator, config_path=MODEL_CONFIG_PATH,
+                                           shared_model=self.shared_model, config=self.model_config)
+            
+            # Modèles optionnels (segmentation, points clés): chargés au premier usage,
+            # déchargés après inactivité ou pour tenir le budget mémoire du worker
+            manager_config = startup_config.get('model_manager', {})
+            self.models = ModelManager(idle_ttl_s=manager_config.get('idle_ttl_s', 600),
+                                       memory_budget_mb=manager_config.get('memory_budget_mb', 0),
+                                       reap_interval_s=manager_config.get('reap_interval_s', 60))
+            if inference_config.get('use_segmentation', False):
+                self.models.register('segmentation', lambda: PigSegmenter(config_path=MODEL_CONFIG_PATH,
+                                                                          config=self.model_config))
+            if inference_config.get('use_keypoints', False):
+                self.models.register('keypoints', lambda: KeypointDetector(config_path=MODEL_CONFIG_PATH,
+                                                                           config=self.model_config,
+                                                                           shared_model=self.shared_model))
+            preloaded = []
+            if not manager_config.get('lazy_loading', True):
+                preloaded = [pool.submit(load, name, self.models.get, name)
+                             for name in ('segmentation', 'keypoints') if name in self.models]
+            
+            try:
+                self.detector = detector.result()
+            except Exception as e:
+                print(f"⚠️  Erreur lors du chargement du détecteur: {e}")
+                raise
+            
+            # Re-ID vidéo optionnelle à partir des features du détecteur (sans ResNet50 par crop)
+            neck_reid = pool.submit(load, 'neck_reid', self._load_neck_video_reid)
+            
+            self.preprocessor = ImagePreprocessor(config_path=config_path)
+            self.postprocessor = ResultPostprocessor(config_path=config_path)
+            self.calibration = CalibrationSystem()
+            
+            # Initialiser la synchronisation avec le backend
+            try:
+                self.backend_sync = backend_sync.result()
+            except Exception as e:
+                print(f"⚠️  Erreur lors de l'initialisation de la synchronisation backend: {e}")
+                self.backend_sync = None
             
             # Initialiser le système d'enregistrement automatique
-            if self.reid:
-                self.auto_register = AutoRegister(self.reid)
-        except Exception as e:
-            print(f"⚠️  Erreur lors du chargement du Re-ID: {e}")
-            # Re-ID peut être optionnel pour le démarrage
-            self.reid = None
-        
-        try:
-            self.weight_estimator_cnn = WeightEstimator(config_path="config/model_config.yaml")
-        except Exception as e:
-            print(f"⚠️  Erreur lors du chargement de l'estimateur de poids: {e}")
-            # L'estimateur peut être optionnel pour le démarrage
-            self.weight_estimator_cnn = None
-        
-        # Modules optionnels selon config
-        try:
-            if self.config.get('inference', {}).get('use_segmentation', False):
-                self.segmenter = PigSegmenter(config_path="config/model_config.yaml")
-            else:
-                self.segmenter = None
-        except:
-            self.segmenter = None
-        
-        try:
-            if self.config.get('inference', {}).get('use_keypoints', False):
-                self.keypoint_detector = KeypointDetector(config_path="config/model_config.yaml")
-            else:
-                self.keypoint_detector = None
-        except:
-            self.keypoint_detector = None
+            self.auto_register = None
+            
+            try:
+                self.neck_reid, neck_video_reid = neck_reid.result()
+            except Exception as e:
+                print(f"⚠️  Erreur lors du chargement de la Re-ID neck ({e}), utilisation de PigReID.")
+                self.neck_reid, neck_video_reid = None, None
+            
+            try:
+                self.reid = reid.result()
+                # Galerie séparée pour la vidéo si la Re-ID neck est active
+                self.video_reid = neck_video_reid or self.reid
+                
+                # Initialiser le système d'enregistrement automatique
+                if self.reid:
+                    mirrors = [self.video_reid] if self.video_reid is not self.reid else []
+                    self.auto_register = AutoRegister(self.reid, mirror_systems=mirrors)
+            except Exception as e:
+                print(f"⚠️  Erreur lors du chargement du Re-ID: {e}")
+                # Re-ID peut être optionnel pour le démarrage
+                self.reid = None
+                self.video_reid = None
+            
+            try:
+                self.weight_estimator_cnn = weight_estimator.result()
+            except Exception as e:
+                print(f"⚠️  Erreur lors du chargement de l'estimateur de poids: {e}")
+                # L'estimateur peut être optionnel pour le démarrage
+                self.weight_estimator_cnn = None
+            
+            for future in preloaded:
+                future.result()
         
         try:
-            if self.config.get('inference', {}).get('use_ensemble', False):
+            if inference_config.get('use_ensemble', False):
                 self.ensemble = WeightEnsemble(config_path=config_path)
             else:
                 self.ensemble = None
@@ -125,13 +169,59 @@ class WeightEstimationPipeline:
             iou_threshold=self.config.get('inference', {}).get('tracking', {}).get('iou_threshold', 0.3)
         )
         
+        # Temps de chargement par composant (aussi exposé par /api/health)
+        if self.model_config.get('startup', {}).get('timing_report', True):
+            timer.report()
+        self.startup_report = timer.summary()
+        
         print("✅ Pipeline initialisé avec succès!")
     
+    @property
+    def segmenter(self) -> Optional[PigSegmenter]:
+        """Segmentateur (chargé au premier usage), None si désactivé ou indisponible"""
+        return self.models.get('segmentation')
+    
+    @property
+    def keypoint_detector(self) -> Optional[KeypointDetector]:
+        """Détecteur de points clés (chargé au premier usage), None si désactivé ou indisponible"""
+        return self.models.get('keypoints')
+    
+    def _load_neck_video_reid(self):
+        """Re-ID neck et sa PigReID vidéo (galerie séparée), ou (None, None)"""
+        neck_reid = load_neck_reid(self.detector, config_path=MODEL_CONFIG_PATH, config=self.model_config)
+        if neck_reid is None:
+            return None, None
+        return neck_reid, PigReID(config_path=MODEL_CONFIG_PATH, shared_model=neck_reid, config=self.model_config)
+    
+    def sync_animals_in_background(self, projet_id: Optional[str] = None,
+                                   user_id: Optional[str] = None) -> threading.Thread:
+        """
+        Synchronise les animaux du backend vers la Re-ID sans bloquer l'appelant
+        
+        Lancé par le serveur après le chargement (backend.sync_on_startup de
+        api_config.yaml) : le pipeline est utilisable tout de suite, les porcs
+        apparaissent dans la galerie au fil de la synchronisation.
+        
+        Returns:
+            Le thread de synchronisation (démon)
+        """
+        def sync():
+            try:
+                count = self.backend_sync.sync_animals_to_reid(self.reid, projet_id, user_id)
+                print(f"✅ {count} animaux synchronisés depuis le backend")
+            except Exception as e:
+                print(f"⚠️  Erreur lors de la synchronisation des animaux: {e}")
+        
+        thread = threading.Thread(target=sync, name='backend-sync', daemon=True)
+        thread.start()
+        return thread
+    
     def predict(self, image: np.ndarray, metadata: Optional[Dict] = None,
                mode: Literal['individual', 'group'] = 'group',
                expected_pigs: Optional[List[str]] = None,
                projet_id: Optional[str] = None,
-               user_id: Optional[str] = None) -> Dict:
+               user_id: Optional[str] = None,
+               detections: Optional[DetectionBatch] = None) -> Dict:
         """
         Prédiction complète selon le README
         
@@ -142,6 +232,7 @@ class WeightEstimationPipeline:
             expected_pigs: Liste des IDs de porcs attendus (pour mode groupe)
             projet_id: ID du projet (pour synchronisation backend)
             user_id: ID de l'utilisateur (pour synchronisation backend)
+            detections: Détections déjà calculées (ex: micro-batching du serveur)
             
         Returns:
             Dict avec résultats complets
@@ -160,11 +251,9 @@ class WeightEstimationPipeline:
         scale_info = self.calibration.estimate_scale_from_aruco(image)
         capture_conditions = self.calibration.get_capture_conditions(image, scale_info)
         
-        # 2. Prétraiter l'image
-        processed_image, preprocess_metadata = self.preprocessor.preprocess_for_detection(image)
-        
-        # 3. Détecter les porcs
-        detections = self.detector.detect(processed_image)
+        # 2-3. Letterbox unique et détection des porcs (sauf si déjà faite)
+        if detections is None:
+            detections = self._detect(image)
         
         if not detections:
             return {
@@ -175,23 +264,24 @@ class WeightEstimationPipeline:
                 'processing_time_ms': int((time.time() - start_time) * 1000)
             }
         
-        # Transformer les bboxes vers l'image originale
-        for det in detections:
-            det['bbox'] = self.postprocessor.transform_bbox(det['bbox'], preprocess_metadata)
-        
         # 4. Segmentation (si activée)
         segments = []
-        if self.segmenter:
-            segments = self.segmenter.segment(image, detections)
+        segmenter = self.segmenter  # Chargé au premier usage
+        if segmenter:
+            segments = segmenter.segment(image, detections)
             # Associer les segments aux détections
             for i, det in enumerate(detections):
                 if i < len(segments):
                     det['mask'] = segments[i]['mask']
                     det['area_pixels'] = segments[i]['area_pixels']
         
+        # Crops des porcs préparés une fois pour la Re-ID, les points clés et le poids
+        crops = CropBatch(image, boxes_of(detections))
+        
         # 5. Ré-identification
         if self.reid:
-            identified_detections = self.reid.identify_batch(image, detections)
+            identified_detections = self.reid.identify_batch(image, detections, expected_pigs=expected_pigs,
+                                                             crops=crops)
             
             # Si un porc est identifié mais n'a pas de métadonnées, les récupérer depuis le backend
             if self.backend_sync:
@@ -205,7 +295,7 @@ class WeightEstimationPipeline:
                             det['metadata'] = self.reid.pig_database[pig_id].get('metadata', {})
         else:
             # Si Re-ID non disponible, utiliser les détections telles quelles
-            identified_detections = detections
+            identified_detections = detections.to_dicts()
             for det in identified_detections:
                 det['pig_id'] = None
                 det['similarity'] = 0.0
@@ -232,21 +322,28 @@ class WeightEstimationPipeline:
         
         # 6. Détection des points clés (si activée)
         keypoints_data = []
-        if self.keypoint_detector:
-            for det in identified_detections:
-                kp_result = self.keypoint_detector.detect(image, det['bbox'])
+        keypoint_detector = self.keypoint_detector  # Chargé au premier usage
+        if keypoint_detector:
+            keypoints_data = keypoint_detector.detect_batch(
+                image, [det['bbox'] for det in identified_detections], crops)
+            for det, kp_result in zip(identified_detections, keypoints_data):
                 det['keypoints'] = kp_result
-                keypoints_data.append(kp_result)
         
         # 7. Estimation de poids - Approche multi-modale
         all_predictions = []
         
-        for det in identified_detections:
+        # CNN: tous les porcs de l'image en un seul forward
+        cnn_results = []
+        if self.weight_estimator_cnn:
+            cnn_results = self.weight_estimator_cnn.estimate_boxes(
+                image, [det['bbox'] for det in identified_detections], crops)
+        
+        for i, det in enumerate(identified_detections):
             pig_predictions = {}
             
             # CNN
             if self.weight_estimator_cnn:
-                cnn_result = self.weight_estimator_cnn.estimate_from_image(image, det['bbox'])
+                cnn_result = cnn_results[i]
                 pig_predictions['cnn'] = {
                     'weight_kg': cnn_result['weight_kg'],
                     'confidence': det.get('confidence', 0.8)
@@ -264,7 +361,7 @@ class WeightEstimationPipeline:
                 }
             
             # Géométrique (si keypoints disponibles)
-            if self.keypoint_detector and 'keypoints' in det:
+            if keypoint_detector and 'keypoints' in det:
                 geometric_weight = self._estimate_weight_geometric(
                     det['keypoints'], scale_info
                 )
@@ -316,7 +413,7 @@ class WeightEstimationPipeline:
                         metadata = self.backend_sync.format_animal_metadata(animal_data)
                         # Mettre à jour dans Re-ID pour la prochaine fois
                         if self.reid and pig_id in self.reid.pig_database:
-                            self.reid.pig_database[pig_id]['metadata'] = metadata
+                            self.reid.update_metadata(pig_id, metadata)
                 
                 # Si le porc n'est pas identifié, récupérer la liste des animaux possibles
                 possible_animals = det.get('possible_animals', [])
@@ -417,9 +514,9 @@ class WeightEstimationPipeline:
             writer = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
         
         # Synchroniser les animaux au début
-        if self.backend_sync and self.reid and (projet_id or user_id):
+        if self.backend_sync and self.video_reid and (projet_id or user_id):
             try:
-                self.backend_sync.sync_animals_to_reid(self.reid, projet_id, user_id)
+                self.backend_sync.sync_animals_to_reid(self.video_reid, projet_id, user_id)
             except Exception as e:
                 logger.warning(f"Erreur lors de la synchronisation: {e}")
         
@@ -435,24 +532,29 @@ class WeightEstimationPipeline:
             
             # Traiter seulement certaines frames (pour performance)
             if frame_count % (frame_skip + 1) == 0:
-                # Détecter les porcs dans cette frame
-                detections = self.detector.detect(frame)
+                # Détecter les porcs dans cette frame (Re-ID neck: embeddings calculés au passage)
+                detections = self.neck_reid.detect(frame) if self.neck_reid else self._detect(frame)
                 
                 if detections:
+                    crops = CropBatch(frame, boxes_of(detections))
+                    
                     # Identifier les porcs
-                    if self.reid:
-                        identified_detections = self.reid.identify_batch(frame, detections)
+                    if self.video_reid:
+                        identified_detections = self.video_reid.identify_batch(frame, detections, crops=crops)
                     else:
-                        identified_detections = detections
+                        identified_detections = detections.to_dicts()
                         for det in identified_detections:
                             det['pig_id'] = None
                             det['metadata'] = {}
                     
-                    # Estimer le poids pour chaque détection
-                    for det in identified_detections:
+                    # Estimer le poids de toutes les détections en un seul forward
+                    weight_infos = []
+                    if self.weight_estimator_cnn:
+                        weight_infos = self.weight_estimator_cnn.estimate_boxes(
+                            frame, [det['bbox'] for det in identified_detections], crops)
+                    for i, det in enumerate(identified_detections):
                         if self.weight_estimator_cnn:
-                            weight_info = self.weight_estimator_cnn.estimate_from_image(frame, det['bbox'])
-                            det['weight'] = weight_info
+                            det['weight'] = weight_infos[i]
                         else:
                             # Estimation basique
                             bbox = det['bbox']
@@ -566,6 +668,36 @@ class WeightEstimationPipeline:
             'timestamp': datetime.now().isoformat()
         }
     
+    def _detect(self, image: np.ndarray) -> DetectionBatch:
+        """Détecte les porcs d'une seule image (voir detect_many)"""
+        return self.detect_many([image])[0]
+    
+    def detect_many(self, images: List[np.ndarray]) -> List[DetectionBatch]:
+        """
+        Détecte les porcs de plusieurs images en un seul forward, avec un seul letterbox
+        
+        Chaque image letterboxée par le préprocesseur est envoyée directement au
+        modèle (pas de second redimensionnement dans ultralytics), puis les boîtes
+        sont ramenées dans le repère de l'image originale en une opération vectorisée
+        (voir PigDetector.detect_resized, qui regroupe aussi les formes rectangulaires).
+        Utilisé tel quel par le micro-batching du serveur (DetectionBatcher).
+        Les vues d'ensemble haute résolution passent par la détection par tuiles.
+        """
+        results: List[Optional[DetectionBatch]] = [None] * len(images)
+        regular = []
+        for i, image in enumerate(images):
+            if self.detector.should_tile(image):
+                results[i] = self.detector.detect_tiled(image)
+            else:
+                regular.append(i)
+        
+        if regular:
+            batches = self.detector.detect_resized([images[i] for i in regular])
+            for i, detections in zip(regular, batches):
+                results[i] = detections
+        
+        return results
+    
     def _estimate_weight_geometric(self, keypoints: Dict, scale_info: Optional[Dict]) -> Optional[Dict]:
         """Estime le poids via l'approche géométrique"""
         if not self.keypoint_detector or not keypoints:
@@ -4,18 +4,25 @@ Module de prétraitement des images/vidéos
 
 import cv2
 import numpy as np
-from typing import Tuple, Optional, Dict
-import yaml
+import torch
+from PIL import Image
+from typing import Tuple, Optional, Dict, List, Sequence
 from pathlib import Path
 
+from .startup import load_config
+
+# Normalisation ImageNet commune aux modèles par porc (Re-ID, poids, points clés)
+IMAGENET_MEAN = torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1)
+IMAGENET_STD = torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1)
+
 class ImagePreprocessor:
     """Prétraitement des images pour l'inférence"""
     
     def __init__(self, config_path: str = "config/inference_config.yaml"):
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        self.config = load_config(config_path)
     
-    def preprocess_for_detection(self, image: np.ndarray, target_size: Tuple[int, int] = (640, 640)) -> Tuple[np.ndarray, Dict]:
+    @staticmethod
+    def preprocess_for_detection(image: np.ndarray, target_size: Tuple[int, int] = (640, 640)) -> Tuple[np.ndarray, Dict]:
         """
         Prétraite une image pour la détection
         
@@ -57,6 +64,31 @@ class ImagePreprocessor:
         
         return padded, metadata
     
+    @staticmethod
+    def select_inference_shape(image_size: Tuple[int, int], shapes: List[Tuple[int, int]]) -> Tuple[int, int]:
+        """
+        Choisit la plus petite forme d'inférence qui contient l'image réduite
+        
+        L'échelle est celle de la plus grande forme (comme le letterbox carré) :
+        seule la quantité de padding change, pas la résolution des porcs.
+        
+        Args:
+            image_size: Taille de l'image (width, height)
+            shapes: Formes disponibles (width, height), multiples du stride
+            
+        Returns:
+            Forme retenue (width, height)
+        """
+        w, h = image_size
+        largest = max(shapes, key=lambda shape: shape[0] * shape[1])
+        scale = min(largest[0] / w, largest[1] / h)
+        new_w, new_h = int(w * scale), int(h * scale)
+        
+        fits = [shape for shape in shapes if shape[0] >= new_w and shape[1] >= new_h]
+        if not fits:
+            return largest
+        return min(fits, key=lambda shape: shape[0] * shape[1])
+    
     def preprocess_for_segmentation(self, image: np.ndarray, target_size: Tuple[int, int] = (800, 800)) -> Tuple[np.ndarray, Dict]:
         """Prétraite pour la segmentation"""
         return self.preprocess_for_detection(image, target_size)
@@ -176,3 +208,80 @@ class ImagePreprocessor:
         
         return float(occlusion_percent)
 
+
+class CropBatch:
+    """
+    Crops des porcs d'une frame, préparés une fois pour tous les modèles par porc
+    
+    La frame est convertie en RGB une seule fois ; chaque crop n'est redimensionné
+    qu'une fois par (taille d'entrée, méthode) : les modèles de même taille
+    d'entrée partagent le même batch. Chaque batch est normalisé (ImageNet) en
+    une opération et consommé tel quel par les modèles, tensor (N, 3, H, W).
+    
+    Méthodes de redimensionnement (identiques aux chemins crop par crop) :
+    - 'cv2' : cv2.resize bilinéaire (Re-ID, poids)
+    - 'pil' : PIL bilinéaire avec antialiasing (points clés, transforms.Resize)
+    """
+    
+    def __init__(self, image: np.ndarray, bboxes):
+        """
+        Args:
+            image: Frame BGR
+            bboxes: Bounding boxes [x1, y1, x2, y2] (N, 4)
+        """
+        self.image = image
+        self.boxes = np.asarray(bboxes, dtype=int).reshape(-1, 4)
+        self._index = {tuple(box): i for i, box in enumerate(self.boxes.tolist())}
+        self._rgb: Optional[np.ndarray] = None
+        self._batches: Dict[Tuple[int, int, str], torch.Tensor] = {}
+    
+    def __len__(self) -> int:
+        return len(self.boxes)
+    
+    @property
+    def rgb(self) -> np.ndarray:
+        """Frame RGB, convertie au premier accès seulement"""
+        if self._rgb is None:
+            self._rgb = cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB)
+        return self._rgb
+    
+    def rows(self, bboxes) -> Optional[List[int]]:
+        """Lignes du batch correspondant à ces boîtes, ou None si l'une manque"""
+        rows = [self._index.get(tuple(int(v) for v in bbox)) for bbox in bboxes]
+        return None if any(row is None for row in rows) else rows
+    
+    def tensor(self, size: Sequence[int], resize: str = 'cv2', rows: Optional[List[int]] = None) -> torch.Tensor:
+        """
+        Batch normalisé des crops à la taille d'entrée d'un modèle
+        
+        Args:
+            size: Taille d'entrée (height, width)
+            resize: 'cv2' ou 'pil'
+            rows: Sous-ensemble de lignes (voir rows), toutes par défaut
+            
+        Returns:
+            Tensor float (N, 3, height, width) sur CPU
+        """
+        key = (int(size[0]), int(size[1]), resize)
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._normalize(self._resize_all(*key))
+            self._batches[key] = batch
+        return batch if rows is None else batch[rows]
+    
+    def _resize_all(self, height: int, width: int, resize: str) -> np.ndarray:
+        """Crops RGB redimensionnés (N, height, width, 3) uint8"""
+        crops = np.empty((len(self.boxes), height, width, 3), dtype=np.uint8)
+        for i, (x1, y1, x2, y2) in enumerate(self.boxes.tolist()):
+            roi = self.rgb[y1:y2, x1:x2]
+            if resize == 'pil':
+                crops[i] = np.asarray(Image.fromarray(roi).resize((width, height), Image.BILINEAR))
+            else:
+                crops[i] = cv2.resize(roi, (width, height))
+        return crops
+    
+    @staticmethod
+    def _normalize(crops: np.ndarray) -> torch.Tensor:
+        """(N, H, W, 3) uint8 -> (N, 3, H, W) float normalisé ImageNet"""
+        batch = torch.from_numpy(crops).permute(0, 3, 1, 2).float().div_(255.0)
+        return (batch - IMAGENET_MEAN) / IMAGENET_STD
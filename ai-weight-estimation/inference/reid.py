@@ -3,48 +3,98 @@ Module de ré-identification des porcs individuels
 Identifie chaque porc via ses caractéristiques visuelles uniques
 """
 
+import functools
+import threading
+import time
+
 import cv2
 import numpy as np
 import torch
 import torch.nn as nn
 from torchvision import transforms
-from typing import List, Dict, Optional, Tuple
+from scipy.optimize import linear_sum_assignment
+from typing import List, Dict, Optional, Tuple, Union
 from pathlib import Path
-import yaml
+
+try:
+    import fcntl
+except ImportError:  # Windows: pas de coordination entre workers
+    fcntl = None
+
+from .backends import load_backend
+from .detections import DetectionBatch, as_records, boxes_of
+from .gallery import FeatureGallery, PersistentFeatureGallery
+from .ann_index import IVFPQIndex
+from .embedding_cache import EmbeddingCache
+from .multihead import SharedBackboneModel
+from .neck_reid import NeckReID
+from .preprocessing import CropBatch
+from .startup import apply_state_dict, load_checkpoint, load_config
+
+
+def serialized(method):
+    """Exécute la méthode sous le verrou Re-ID de l'instance (voir PigReID.lock)"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class PigReID:
     """Système de ré-identification des porcs"""
     
-    def __init__(self, model_path: Optional[str] = None, config_path: str = "config/config.yaml"):
+    def __init__(self, model_path: Optional[str] = None, config_path: str = "config/config.yaml",
+                 shared_model: Optional[Union[SharedBackboneModel, NeckReID]] = None,
+                 config: Optional[Dict] = None):
         """
         Initialise le système de ré-identification
         
         Args:
             model_path: Chemin vers le modèle de ré-identification
             config_path: Chemin vers le fichier de configuration
+            shared_model: Fournisseur d'embeddings remplaçant le ResNet50 dédié
+                          (SharedBackboneModel multi-tête ou NeckReID)
+            config: Configuration déjà chargée, à la place de config_path (copie modifiée
+                    par un script ; la configuration mise en cache reste en lecture seule)
         """
         # Charger la configuration
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        self.config = config if config is not None else load_config(config_path)
+        
+        # L'API exécute plusieurs prédictions en parallèle (threadpool) : la galerie,
+        # pig_database et l'index approché ne sont pas thread-safe, l'étape Re-ID
+        # (identification, enregistrement, mise à jour) est donc sérialisée
+        self.lock = threading.RLock()
         
         # Paramètres
         reid_config = self.config.get('models', {}).get('reid', {})
         self.input_size = reid_config.get('input_size', [256, 128])
         self.feature_dim = reid_config.get('feature_dim', 512)
+        self.max_batch_size = reid_config.get('max_batch_size', 32)
         
         # Charger le modèle
         if model_path is None:
             model_path = reid_config.get('path', 'models/reid/pig_reid_resnet50.pt')
         
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        # Poids mappés en mémoire, partagés entre workers (voir startup.mmap_weights)
+        self.mmap_weights = self.config.get('startup', {}).get('mmap_weights', False)
         
-        # Vérifier si le modèle existe
-        if not Path(model_path).exists():
-            print(f"⚠️  Modèle Re-ID non trouvé: {model_path}")
-            print("📝 Le modèle sera créé avec des poids aléatoires. Entraînez-le avec vos données.")
-        
-        self.model = self._load_model(model_path)
-        self.model.eval()
+        self.shared_model = shared_model
+        if shared_model is not None:
+            # Embeddings fournis par la tête Re-ID du modèle multi-tête
+            self.feature_dim = shared_model.feature_dim
+            self.model = None
+        else:
+            # Vérifier si le modèle existe
+            if not Path(model_path).exists():
+                print(f"⚠️  Modèle Re-ID non trouvé: {model_path}")
+                print("📝 Le modèle sera créé avec des poids aléatoires. Entraînez-le avec vos données.")
+            
+            # Backend torch (précision, compilation) ou ONNX Runtime, voir inference/backends.py
+            self.backend = load_backend(reid_config, model_path, lambda: self._load_model(model_path),
+                                        (3, *self.input_size), self.device, self.config, name='reid')
+            self.model = getattr(self.backend, 'model', None)
         
         # Transformations pour les images
         self.transform = transforms.Compose([
@@ -54,8 +104,43 @@ class PigReID:
             transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
         ])
         
+        # Embeddings déjà calculés pour les images en cours de traitement
+        # (partagés entre identification, suggestion et enregistrement)
+        self.embedding_cache = EmbeddingCache()
+        
         # Base de données des porcs connus (features + metadata)
         self.pig_database: Dict[str, Dict] = {}
+        # Index de recherche: features normalisées en une seule matrice contiguë
+        gallery_config = reid_config.get('gallery', {})
+        # Multi-vues: centroïde + réservoir borné d'embeddings par porc
+        multi_shot = {
+            'reservoir_size': gallery_config.get('reservoir_size', 8),
+            'ambiguity_margin': gallery_config.get('ambiguity_margin', 0.05),
+            'max_ambiguous': gallery_config.get('max_ambiguous', 3)
+        }
+        gallery_path = gallery_config.get('path', 'models/reid/gallery')
+        if shared_model is not None:
+            # Les embeddings d'un autre modèle ne sont pas comparables à ceux
+            # du ResNet50 dédié : galerie séparée
+            gallery_path = shared_model.gallery_path
+        if gallery_config.get('persistent', False):
+            self.gallery = PersistentFeatureGallery(
+                self.feature_dim,
+                gallery_path,
+                compact_ratio=gallery_config.get('compact_ratio', 0.5),
+                min_compact_rows=gallery_config.get('min_compact_rows', 256),
+                **multi_shot
+            )
+            self._sync_from_gallery(self.gallery.ids)
+        else:
+            self.gallery = FeatureGallery(self.feature_dim, **multi_shot)
+        
+        # Index approché (IVF-PQ) devant la galerie, pour les très grandes galeries
+        self.ann_config = reid_config.get('ann', {})
+        self.ann_index: Optional[IVFPQIndex] = None
+        self._ann_thread: Optional[threading.Thread] = None
+        self._ann_mtime: Optional[int] = None  # Version de l'index installé (fichier)
+        self._update_ann_index(self.gallery.ids)
         
     def _load_model(self, model_path: str) -> nn.Module:
         """Charge le modèle de ré-identification"""
@@ -67,11 +152,8 @@ class PigReID:
         model.fc = nn.Linear(model.fc.in_features, self.feature_dim)
         
         if Path(model_path).exists():
-            checkpoint = torch.load(model_path, map_location=self.device)
-            if 'model_state_dict' in checkpoint:
-                model.load_state_dict(checkpoint['model_state_dict'])
-            else:
-                model.load_state_dict(checkpoint)
+            checkpoint = load_checkpoint(model_path, self.device, mmap=self.mmap_weights)
+            apply_state_dict(model, checkpoint, mmap=self.mmap_weights)
         else:
             print("⚠️  Modèle Re-ID non entraîné. Utilisation de poids aléatoires.")
         
@@ -89,6 +171,15 @@ class PigReID:
         Returns:
             Vecteur de features (feature_dim,)
         """
+        cached = self.embedding_cache.get(image, bbox)
+        if cached is not None:
+            return cached
+        
+        if self.shared_model is not None:
+            features = self.shared_model.infer(image, [bbox])['reid'][0]
+            self.embedding_cache.put(image, bbox, features)
+            return features
+        
         # Extraire la région du porc
         x1, y1, x2, y2 = bbox
         pig_roi = image[y1:y2, x1:x2]
@@ -103,31 +194,295 @@ class PigReID:
         tensor = self.transform(pig_roi).unsqueeze(0).to(self.device)
         
         # Extraire les features
-        with torch.no_grad():
-            features = self.model(tensor)
-            features = nn.functional.normalize(features, p=2, dim=1)
+        with torch.inference_mode():
+            features = self._forward(tensor)
         
-        return features.cpu().numpy().flatten()
+        features = features.cpu().numpy().flatten()
+        self.embedding_cache.put(image, bbox, features)
+        return features
     
+    def extract_features_batch(self, image: np.ndarray, bboxes: List[List[int]],
+                               crops: Optional[CropBatch] = None) -> np.ndarray:
+        """
+        Extrait les features de plusieurs porcs d'une image en un seul forward
+        
+        Les crops sont redimensionnés puis empilés en un tensor (N, 3, H, W),
+        normalisé directement en torch, et passé au modèle par blocs de
+        `max_batch_size`. En cas d'échec, retour au chemin crop par crop.
+        Les crops déjà présents dans le cache de la requête ne sont pas recalculés.
+        
+        Args:
+            image: Image complète
+            bboxes: Bounding boxes [x1, y1, x2, y2]
+            crops: Crops de la frame déjà préparés (CropBatch), optionnel
+            
+        Returns:
+            Matrice de features (N, feature_dim)
+        """
+        features = np.zeros((len(bboxes), self.feature_dim), dtype=np.float32)
+        missing = []
+        for i, bbox in enumerate(bboxes):
+            cached = self.embedding_cache.get(image, bbox)
+            if cached is None:
+                missing.append(i)
+            else:
+                features[i] = cached
+        
+        if missing:
+            computed = self._embed_crops(image, [bboxes[i] for i in missing], crops)
+            for i, vector in zip(missing, computed):
+                features[i] = vector
+                self.embedding_cache.put(image, bboxes[i], vector)
+        
+        return features
+    
+    def _embed_crops(self, image: np.ndarray, bboxes: List[List[int]],
+                     crops: Optional[CropBatch] = None) -> np.ndarray:
+        """Forward batché des crops (voir extract_features_batch)"""
+        if self.shared_model is not None:
+            return self.shared_model.infer(image, bboxes, crops)['reid']
+        
+        try:
+            # Crops déjà préparés pour la frame si disponibles, sinon batch local
+            rows = crops.rows(bboxes) if crops is not None else None
+            if rows is None:
+                crops = CropBatch(image, bboxes)
+            batch = crops.tensor(self.input_size, rows=rows).to(self.device)
+            
+            with torch.inference_mode():
+                features = torch.cat([
+                    self._forward(batch[start:start + self.max_batch_size])
+                    for start in range(0, batch.shape[0], self.max_batch_size)
+                ])
+            
+            return features.cpu().numpy()
+        except Exception as e:
+            print(f"⚠️  Extraction batchée impossible ({e}), extraction crop par crop.")
+            return np.stack([self.extract_features(image, bbox) for bbox in bboxes])
+    
+    def _forward(self, tensor: torch.Tensor) -> torch.Tensor:
+        """Forward du modèle et normalisation L2 des features"""
+        features = self.backend(tensor)
+        return nn.functional.normalize(features, p=2, dim=1)
+    
+    @serialized
     def register_pig(self, pig_id: str, image: np.ndarray, bbox: List[int], 
                      metadata: Optional[Dict] = None):
         """
-        Enregistre un porc dans la base de données
+        Enregistre une vue d'un porc dans la base de données
+        
+        Un porc déjà enregistré n'est pas écrasé : la vue met à jour son
+        centroïde et peut entrer dans son réservoir d'embeddings.
         
         Args:
             pig_id: Identifiant unique du porc (ex: "PORC001")
             image: Image contenant le porc
             bbox: Bounding box du porc
-            metadata: Métadonnées (nom, code, etc.)
+            metadata: Métadonnées (nom, code, etc.) ; None conserve celles déjà connues
         """
         features = self.extract_features(image, bbox)
+        previous = self.pig_database.get(pig_id, {})
+        if metadata is None and pig_id not in self.gallery:
+            # Première image d'un animal synchronisé depuis le backend (entrée en attente)
+            metadata = previous.get('metadata')
+        self.gallery.add(pig_id, features, metadata, bbox)
         
+        record = getattr(self.gallery, 'records', {}).get(pig_id)
+        if metadata is None:
+            metadata = record['metadata'] if record else previous.get('metadata') or {}
         self.pig_database[pig_id] = {
-            'features': features,
-            'metadata': metadata or {},
+            'features': self.gallery.get(pig_id),  # Centroïde de toutes les vues
+            'metadata': metadata,
             'bbox': bbox
         }
+        self._update_ann_index([pig_id])
+    
+    @serialized
+    def unregister_pig(self, pig_id: str) -> bool:
+        """
+        Retire un porc de la base de données et de la galerie
+        
+        Returns:
+            True si le porc était enregistré
+        """
+        self.gallery.remove(pig_id)
+        if self.ann_index is not None:
+            self.ann_index.remove(pig_id)
+        return self.pig_database.pop(pig_id, None) is not None
+    
+    def _update_ann_index(self, pig_ids: List[str]):
+        """
+        Tient l'index approché à jour après des changements de la galerie (sous self.lock)
+        
+        L'index n'est jamais entraîné ici : les k-means prennent de l'ordre de
+        la minute sur une grande galerie. Il est chargé depuis le fichier
+        sauvegardé à côté de la galerie, ou entraîné par un thread
+        d'arrière-plan quand la galerie atteint `min_gallery_size` puis quand
+        elle a grossi de `retrain_growth`. D'ici là, la recherche reste exacte.
+        Entre deux entraînements, les porcs sont ajoutés incrémentalement.
+        """
+        if not self.ann_config.get('enabled', False):
+            return
+        
+        size = len(self.gallery)
+        if size < self.ann_config.get('min_gallery_size', 20000):
+            self.ann_index = None
+            return
+        
+        if self._load_ann_index():
+            return
+        
+        index = self.ann_index
+        if index is None or size >= index.trained_size * self.ann_config.get('retrain_growth', 2.0):
+            self._start_ann_training()
+        if index is not None and pig_ids:
+            pig_ids = [pig_id for pig_id in pig_ids if pig_id in self.gallery]
+            index.add(pig_ids, self.gallery.vectors(pig_ids))
+    
+    def _ann_index_file(self) -> Optional[Path]:
+        """Quantificateurs de l'index approché, à côté de la galerie persistante"""
+        path = getattr(self.gallery, 'path', None)
+        return None if path is None else Path(path) / 'ann_index.npz'
+    
+    def _load_ann_index(self) -> bool:
+        """Installe l'index sauvegardé s'il a changé depuis le dernier chargement (sous self.lock)"""
+        path = self._ann_index_file()
+        if path is None:
+            return False
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._ann_mtime:
+            return False
+        
+        self._ann_mtime = mtime
+        try:
+            index = IVFPQIndex.load(path, self.feature_dim, n_probe=self.ann_config.get('n_probe', 16),
+                                    rerank_k=self.ann_config.get('rerank_k', 50))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️  Index approché illisible ({path}: {e}), recherche exacte.")
+            return False
+        self._install_ann_index(index)
+        return True
     
+    def _install_ann_index(self, index: IVFPQIndex):
+        """Encode les porcs actuels puis remplace l'index en une affectation (sous self.lock)"""
+        pig_ids = self.gallery.ids
+        index.add(pig_ids, self.gallery.vectors(pig_ids))
+        self.ann_index = index
+    
+    def _start_ann_training(self):
+        """Lance l'entraînement de l'index en arrière-plan (un seul à la fois)"""
+        if self._ann_thread is not None and self._ann_thread.is_alive():
+            return
+        vectors = np.array(self.gallery.vectors(self.gallery.ids))
+        self._ann_thread = threading.Thread(target=self._train_ann_index, args=(vectors,),
+                                            name='reid-ann-index', daemon=True)
+        self._ann_thread.start()
+    
+    def _train_ann_index(self, vectors: np.ndarray):
+        """
+        Entraîne l'index hors du verrou Re-ID puis l'installe (thread d'arrière-plan)
+        
+        Entre workers, un seul entraîne (verrou sur ann_index.lock) ; les autres
+        attendent puis chargent l'index qu'il a sauvegardé.
+        """
+        path = self._ann_index_file()
+        lock_file = open(path.with_suffix('.lock'), 'a') if path is not None else None
+        try:
+            if lock_file is not None and fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            
+            growth = self.ann_config.get('retrain_growth', 2.0)
+            if path is not None and path.exists():
+                with self.lock:
+                    self._load_ann_index()
+                    if self.ann_index is not None and len(vectors) < self.ann_index.trained_size * growth:
+                        return  # Entraîné entre-temps par un autre worker
+            
+            start = time.perf_counter()
+            index = IVFPQIndex(
+                self.feature_dim,
+                n_lists=self.ann_config.get('n_lists', 256),
+                n_subvectors=self.ann_config.get('n_subvectors', 64),
+                n_probe=self.ann_config.get('n_probe', 16),
+                rerank_k=self.ann_config.get('rerank_k', 50)
+            )
+            index.train(vectors)
+            if path is not None:
+                index.save(path)
+            
+            with self.lock:
+                if path is not None:
+                    self._ann_mtime = path.stat().st_mtime_ns
+                self._install_ann_index(index)
+            print(f"✅ Index approché entraîné sur {len(vectors)} porcs ({time.perf_counter() - start:.0f} s)")
+        except Exception as e:
+            print(f"⚠️  Entraînement de l'index approché impossible ({e}), recherche exacte.")
+            with self.lock:
+                # Pas de nouvelle tentative à chaque requête
+                self.ann_config = {**self.ann_config, 'enabled': False}
+        finally:
+            if lock_file is not None:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+    
+    def _search(self, queries: np.ndarray, threshold: float) -> List[Optional[Tuple[str, float]]]:
+        """Recherche dans la galerie : index approché si disponible, sinon exacte"""
+        if self.ann_index is not None:
+            return self.ann_index.search(queries, self.gallery, threshold)
+        return self.gallery.search(queries, threshold)
+    
+    @serialized
+    def update_metadata(self, pig_id: str, metadata: Dict):
+        """Met à jour les métadonnées d'un porc enregistré (et dans la galerie persistante)"""
+        if pig_id in self.pig_database:
+            self.pig_database[pig_id]['metadata'] = metadata
+        self.gallery.update_metadata(pig_id, metadata)
+    
+    @serialized
+    def sync_metadata(self, pig_id: str, metadata: Dict) -> bool:
+        """
+        Métadonnées d'un animal du backend (BackendSync, threads d'arrière-plan)
+        
+        Un porc enregistré est mis à jour par update_metadata (persisté). Sinon
+        une entrée en attente de sa première image est créée (features None,
+        mémoire du worker) ; elle ne remplace jamais un porc enregistré.
+        
+        Returns:
+            True si le porc était déjà enregistré
+        """
+        if pig_id in self.gallery:
+            self.update_metadata(pig_id, metadata)
+            return True
+        self.pig_database[pig_id] = {'features': None, 'metadata': metadata, 'bbox': None}
+        return False
+    
+    @serialized
+    def refresh_gallery(self):
+        """Récupère les porcs enregistrés par les autres workers (galerie persistante)"""
+        changed = self.gallery.refresh()
+        if changed:
+            self._sync_from_gallery(changed)
+        # Aussi sans changement : index sauvegardé entre-temps par un autre worker
+        self._update_ann_index(changed)
+    
+    def _sync_from_gallery(self, pig_ids: List[str]):
+        """Reporte les entrées de la galerie persistante dans pig_database"""
+        records = getattr(self.gallery, 'records', {})
+        for pig_id in set(pig_ids):
+            record = records.get(pig_id)
+            if record is None:
+                continue
+            self.pig_database[pig_id] = {
+                'features': self.gallery.get(pig_id),
+                'metadata': record['metadata'],
+                'bbox': record['bbox']
+            }
+    
+    @serialized
     def identify(self, image: np.ndarray, bbox: List[int], 
                 threshold: float = 0.7) -> Optional[Tuple[str, float]]:
         """
@@ -141,65 +496,87 @@ class PigReID:
         Returns:
             Tuple (pig_id, similarity_score) ou None si non identifié
         """
-        if not self.pig_database:
+        self.refresh_gallery()
+        if not len(self.gallery):
             return None
         
         # Extraire les features du porc
         query_features = self.extract_features(image, bbox)
         
-        # Comparer avec tous les porcs enregistrés
-        best_match = None
-        best_score = 0.0
-        
-        for pig_id, pig_data in self.pig_database.items():
-            # Ignorer les animaux sans features (pas encore enregistrés avec une image)
-            if pig_data.get('features') is None:
-                continue
-            
-            # Calculer la similarité cosinus
-            similarity = np.dot(query_features, pig_data['features']) / (
-                np.linalg.norm(query_features) * np.linalg.norm(pig_data['features'])
-            )
-            
-            if similarity > best_score and similarity >= threshold:
-                best_score = similarity
-                best_match = pig_id
-        
-        if best_match:
-            return (best_match, best_score)
-        
-        return None
+        # Comparer avec tous les porcs enregistrés en un seul produit matriciel
+        return self._search(query_features[None], threshold)[0]
     
-    def identify_batch(self, image: np.ndarray, detections: List[dict],
-                     threshold: float = 0.7) -> List[dict]:
+    @serialized
+    def identify_batch(self, image: np.ndarray, detections: Union[DetectionBatch, List[dict]],
+                     threshold: float = 0.7, expected_pigs: Optional[List[str]] = None,
+                     crops: Optional[CropBatch] = None) -> List[dict]:
         """
         Identifie plusieurs porcs dans une image
         
+        Sans `expected_pigs`, chaque détection est cherchée dans toute la galerie.
+        Avec `expected_pigs` (porcs de l'enclos), la recherche est restreinte à ces
+        porcs et une affectation un-à-un (algorithme hongrois) est résolue sur
+        toutes les détections à la fois : deux porcs ne reçoivent jamais le même
+        identifiant. Un seul porc attendu pour une seule détection lui est
+        attribué directement, sans Re-ID.
+        
         Args:
             image: Image complète
-            detections: Liste de détections avec bounding boxes
+            detections: Détections (DetectionBatch ou liste de dicts avec bounding boxes)
             threshold: Seuil de similarité minimum
+            expected_pigs: IDs des porcs attendus dans l'image (optionnel)
+            crops: Crops de la frame déjà préparés (CropBatch), optionnel
             
         Returns:
             Liste de détections avec identification ajoutée
         """
-        identified_detections = []
+        identified_detections = as_records(detections)
+        if not identified_detections:
+            return identified_detections
         
-        for det in detections:
-            bbox = det['bbox']
-            identification = self.identify(image, bbox, threshold)
-            
-            det_with_id = det.copy()
+        if expected_pigs and len(expected_pigs) == 1 and len(identified_detections) == 1:
+            identifications = [(expected_pigs[0], 1.0)]
+        else:
+            self.refresh_gallery()
+            if expected_pigs:
+                identifications = self._assign_expected(image, detections, expected_pigs, threshold, crops)
+            elif len(self.gallery):
+                # Une matrice (détections × galerie), argmax et seuil vectorisés
+                queries = self.extract_features_batch(image, boxes_of(detections).tolist(), crops)
+                identifications = self._search(queries, threshold)
+            else:
+                identifications = [None] * len(identified_detections)
+        
+        for det_with_id, identification in zip(identified_detections, identifications):
             if identification:
                 pig_id, similarity = identification
                 det_with_id['pig_id'] = pig_id
                 det_with_id['similarity'] = similarity
-                det_with_id['metadata'] = self.pig_database[pig_id].get('metadata', {})
+                det_with_id['metadata'] = self.pig_database.get(pig_id, {}).get('metadata', {})
             else:
                 det_with_id['pig_id'] = None
                 det_with_id['similarity'] = 0.0
-            
-            identified_detections.append(det_with_id)
         
         return identified_detections
-
+    
+    def _assign_expected(self, image: np.ndarray, detections: Union[DetectionBatch, List[dict]],
+                         expected_pigs: List[str], threshold: float,
+                         crops: Optional[CropBatch] = None) -> List[Optional[Tuple[str, float]]]:
+        """Affectation un-à-un des détections aux porcs attendus (hongrois)"""
+        candidates = [pig_id for pig_id in dict.fromkeys(expected_pigs) if pig_id in self.gallery]
+        identifications: List[Optional[Tuple[str, float]]] = [None] * len(detections)
+        if not candidates:
+            return identifications
+        
+        queries = self.extract_features_batch(image, boxes_of(detections).tolist(), crops)
+        scores = self.gallery.score_matrix(queries, candidates)  # (détections, porcs attendus)
+        
+        # Seuil appliqué avant l'affectation : un couple sous le seuil ne doit pas
+        # priver une autre détection de son porc (maximise d'abord le nombre d'identifiés)
+        feasible = np.where(scores >= threshold, scores, -1e6)
+        rows, columns = linear_sum_assignment(feasible, maximize=True)
+        for row, column in zip(rows.tolist(), columns.tolist()):
+            if scores[row, column] >= threshold:
+                identifications[row] = (candidates[column], float(scores[row, column]))
+        
+        return identifications
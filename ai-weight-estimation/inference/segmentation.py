@@ -5,26 +5,28 @@ Module de segmentation d'instance (Mask R-CNN)
 import cv2
 import numpy as np
 import torch
-import torchvision
-from torchvision.models.detection import maskrcnn_resnet50_fpn
 from torchvision.transforms import functional as F
 from typing import List, Dict, Optional
-import yaml
 from pathlib import Path
 
+from .precision import InferencePrecision
+from .startup import apply_state_dict, load_checkpoint, load_config
+
 class PigSegmenter:
     """Segmentateur de porcs basé sur Mask R-CNN"""
     
-    def __init__(self, model_path: Optional[str] = None, config_path: str = "config/model_config.yaml"):
+    def __init__(self, model_path: Optional[str] = None, config_path: str = "config/model_config.yaml",
+                 config: Optional[Dict] = None):
         """
         Initialise le segmentateur
         
         Args:
             model_path: Chemin vers le modèle pré-entraîné
             config_path: Chemin vers la configuration
+            config: Configuration déjà chargée, à la place de config_path (copie modifiée
+                    par un script ; la configuration mise en cache reste en lecture seule)
         """
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        self.config = config if config is not None else load_config(config_path)
         
         seg_config = self.config['models']['segmentation']
         self.confidence_threshold = seg_config['confidence_threshold']
@@ -35,20 +37,26 @@ class PigSegmenter:
             model_path = seg_config['path']
         
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model = self._load_model(model_path)
+        # Poids mappés en mémoire, partagés entre workers (voir startup.mmap_weights)
+        self.mmap_weights = self.config.get('startup', {}).get('mmap_weights', False)
+        # Précision (fp32/bf16) et format mémoire, bf16 soumis à la calibration du checkpoint
+        self.precision = InferencePrecision(seg_config.get('precision', {}), self.device, model_path,
+                                            self.config.get('precision_calibration', {}), name='segmentation')
+        self.model = self.precision.prepare(self._load_model(model_path))
         self.model.eval()
     
     def _load_model(self, model_path: str):
         """Charge le modèle Mask R-CNN"""
+        # Import différé: torchvision.models.detection n'est chargé que si la segmentation est activée
+        from torchvision.models.detection import maskrcnn_resnet50_fpn
+        
         # Créer le modèle
-        model = maskrcnn_resnet50_fpn(pretrained=False, num_classes=2)  # Background + Pig
+        # Pas de backbone ImageNet: il serait téléchargé puis écrasé par le checkpoint
+        model = maskrcnn_resnet50_fpn(pretrained=False, pretrained_backbone=False, num_classes=2)  # Background + Pig
         
         if Path(model_path).exists():
-            checkpoint = torch.load(model_path, map_location=self.device)
-            if 'model_state_dict' in checkpoint:
-                model.load_state_dict(checkpoint['model_state_dict'])
-            else:
-                model.load_state_dict(checkpoint)
+            checkpoint = load_checkpoint(model_path, self.device, mmap=self.mmap_weights)
+            apply_state_dict(model, checkpoint, mmap=self.mmap_weights)
         
         model.to(self.device)
         return model
@@ -71,14 +79,14 @@ class PigSegmenter:
         image_tensor = F.to_tensor(image_rgb).to(self.device)
         
         # Inférence
-        with torch.no_grad():
+        with torch.inference_mode(), self.precision.autocast():
             predictions = self.model([image_tensor])
         
         segments = []
         for i, pred in enumerate(predictions):
-            masks = pred['masks'].cpu().numpy()
-            boxes = pred['boxes'].cpu().numpy()
-            scores = pred['scores'].cpu().numpy()
+            masks = pred['masks'].float().cpu().numpy()
+            boxes = pred['boxes'].float().cpu().numpy()
+            scores = pred['scores'].float().cpu().numpy()
             labels = pred['labels'].cpu().numpy()
             
             for j in range(len(scores)):
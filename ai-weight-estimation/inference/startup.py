@@ -0,0 +1,129 @@
+"""
+Démarrage des services d'inférence
+Construction des backbones sans téléchargement réseau et rapport des temps
+de chargement par composant
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+from pathlib import Path
+import yaml
+
+_configs: Dict[str, Dict] = {}
+_configs_lock = threading.Lock()
+
+
+def load_config(config_path: str) -> Dict:
+    """
+    Configuration YAML lue une seule fois par processus
+
+    Tous les composants construits avec le même fichier partagent le même
+    dict (à traiter en lecture seule), y compris lorsqu'ils sont chargés en
+    parallèle par le pipeline.
+    """
+    key = str(Path(config_path).resolve())
+    with _configs_lock:
+        if key not in _configs:
+            with open(config_path, 'r') as f:
+                _configs[key] = yaml.safe_load(f) or {}
+        return _configs[key]
+
+
+def build_resnet50(model_path: Optional[str], offline: bool = False):
+    """
+    ResNet50 torchvision prêt à recevoir nos poids
+
+    Les poids ImageNet ne sont utiles que si aucun checkpoint n'existe : ils
+    sont écrasés sinon. Ils ne sont donc téléchargés qu'en l'absence de
+    checkpoint et hors mode hors-ligne ; un échec du téléchargement (serveur
+    sans réseau) retombe sur une initialisation aléatoire au lieu d'échouer.
+
+    Args:
+        model_path: Checkpoint qui sera chargé ensuite (peut ne pas exister)
+        offline: Ne jamais télécharger les poids ImageNet
+
+    Returns:
+        Le modèle torchvision (couche `fc` d'origine)
+    """
+    from torchvision import models
+
+    if (model_path and Path(model_path).exists()) or offline:
+        return models.resnet50(pretrained=False)
+
+    try:
+        return models.resnet50(pretrained=True)
+    except Exception as e:
+        print(f"⚠️  Poids ImageNet indisponibles ({e}), initialisation aléatoire.")
+        return models.resnet50(pretrained=False)
+
+
+def load_checkpoint(model_path: str, device, mmap: bool = False) -> Dict:
+    """
+    torch.load d'un checkpoint, mappé en mémoire en mode `mmap` (CPU uniquement)
+
+    Le fichier n'est alors pas lu en mémoire privée : ses pages viennent du
+    cache du système, communes à tous les processus qui mappent le même fichier.
+    """
+    import torch
+
+    if mmap and torch.device(device).type == 'cpu':
+        try:
+            return torch.load(model_path, map_location='cpu', mmap=True)
+        except (RuntimeError, TypeError) as e:
+            # Ancien format (non zip) ou torch < 2.1
+            print(f"⚠️  Chargement mmap impossible pour {model_path} ({e}), chargement classique.")
+    return torch.load(model_path, map_location=device)
+
+
+def apply_state_dict(model, checkpoint: Dict, mmap: bool = False):
+    """
+    Charge les poids d'un checkpoint (dict complet ou state_dict) dans le modèle
+
+    En mode `mmap`, les tenseurs mappés remplacent les paramètres au lieu d'y
+    être copiés (assign=True) et le modèle est gelé : les poids restent
+    partagés entre workers tant qu'ils ne sont pas modifiés (inférence).
+    """
+    state_dict = checkpoint['model_state_dict'] if 'model_state_dict' in checkpoint else checkpoint
+    if mmap:
+        model.load_state_dict(state_dict, assign=True)
+        model.requires_grad_(False)
+    else:
+        model.load_state_dict(state_dict)
+
+
+class StartupTimer:
+    """Temps de chargement de chaque composant du pipeline"""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def measure(self, component: str):
+        """Mesure le bloc (les exceptions sont propagées, la durée est conservée)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[component] = self.timings.get(component, 0.0) + time.perf_counter() - start
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self._start
+
+    def summary(self) -> Dict:
+        """Durées en secondes: total et par composant"""
+        return {'total_s': round(self.total, 3),
+                'components_s': {name: round(seconds, 3) for name, seconds in self.timings.items()}}
+
+    def report(self):
+        """Affiche les durées, du composant le plus lent au plus rapide"""
+        total = self.total
+        print(f"⏱️  Démarrage en {total:.2f} s")
+        for component, seconds in sorted(self.timings.items(), key=lambda item: -item[1]):
+            print(f"   {component:<22}{seconds:>8.2f} s")
+        other = total - sum(self.timings.values())
+        if other > 0.01:
+            print(f"   {'autres':<22}{other:>8.2f} s")
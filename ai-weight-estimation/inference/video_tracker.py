@@ -5,10 +5,12 @@ Utilise un système de tracking multi-objets pour suivre chaque porc individuell
 
 import cv2
 import numpy as np
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Union
 from collections import defaultdict
 import logging
 
+from .detections import DetectionBatch, boxes_of
+
 logger = logging.getLogger(__name__)
 
 class VideoTracker:
@@ -34,12 +36,12 @@ class VideoTracker:
         # Historique des poids estimés par track
         self.weight_history: Dict[int, List[Dict]] = defaultdict(list)
     
-    def update(self, detections: List[Dict], frame_number: int) -> List[Dict]:
+    def update(self, detections: Union[DetectionBatch, List[Dict]], frame_number: int) -> List[Dict]:
         """
         Met à jour les tracks avec de nouvelles détections
         
         Args:
-            detections: Liste de détections avec bbox, confidence, etc.
+            detections: Détections (DetectionBatch ou liste de dicts avec bbox, confidence, etc.)
             frame_number: Numéro de la frame actuelle
             
         Returns:
@@ -56,8 +58,8 @@ class VideoTracker:
         # Calculer les IoU entre les tracks existantes et les nouvelles détections
         if self.tracks:
             track_ids = list(self.tracks.keys())
-            track_boxes = [self.tracks[tid].bbox for tid in track_ids]
-            detection_boxes = [det['bbox'] for det in detections]
+            track_boxes = np.array([self.tracks[tid].bbox for tid in track_ids], dtype=np.float32)
+            detection_boxes = boxes_of(detections)
             
             # Matrice IoU
             iou_matrix = self._compute_iou_matrix(track_boxes, detection_boxes)
@@ -148,18 +150,25 @@ class VideoTracker:
         
         return confirmed_tracks
     
-    def _compute_iou_matrix(self, boxes1: List[List[int]], boxes2: List[List[int]]) -> np.ndarray:
-        """Calcule la matrice IoU entre deux listes de bounding boxes"""
-        if not boxes1 or not boxes2:
+    def _compute_iou_matrix(self, boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
+        """Calcule la matrice IoU entre deux ensembles de bounding boxes (N, 4) et (M, 4)"""
+        boxes1 = np.asarray(boxes1, dtype=np.float32).reshape(-1, 4)
+        boxes2 = np.asarray(boxes2, dtype=np.float32).reshape(-1, 4)
+        if len(boxes1) == 0 or len(boxes2) == 0:
             return np.array([])
         
-        iou_matrix = np.zeros((len(boxes1), len(boxes2)))
+        # Intersection par broadcasting (N, 1) x (1, M)
+        x1 = np.maximum(boxes1[:, None, 0], boxes2[None, :, 0])
+        y1 = np.maximum(boxes1[:, None, 1], boxes2[None, :, 1])
+        x2 = np.minimum(boxes1[:, None, 2], boxes2[None, :, 2])
+        y2 = np.minimum(boxes1[:, None, 3], boxes2[None, :, 3])
+        intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
         
-        for i, box1 in enumerate(boxes1):
-            for j, box2 in enumerate(boxes2):
-                iou_matrix[i, j] = self._compute_iou(box1, box2)
+        area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+        area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+        union = area1[:, None] + area2[None, :] - intersection
         
-        return iou_matrix
+        return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
     
     def _compute_iou(self, box1: List[int], box2: List[int]) -> float:
         """Calcule l'IoU entre deux bounding boxes"""
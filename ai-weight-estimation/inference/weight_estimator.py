@@ -6,29 +6,38 @@ import cv2
 import numpy as np
 import torch
 import torch.nn as nn
-from torchvision import transforms, models
-from typing import List, Dict, Optional, Tuple
+from torchvision import transforms
+from typing import List, Dict, Optional, Tuple, Union
 from pathlib import Path
-import yaml
+
+from .backends import load_backend
+from .detections import DetectionBatch, as_records, boxes_of
+from .multihead import SharedBackboneModel
+from .preprocessing import CropBatch
+from .startup import apply_state_dict, build_resnet50, load_checkpoint, load_config
 
 class WeightEstimator:
     """Estimateur de poids basé sur l'analyse visuelle"""
     
-    def __init__(self, model_path: Optional[str] = None, config_path: str = "config/config.yaml"):
+    def __init__(self, model_path: Optional[str] = None, config_path: str = "config/config.yaml",
+                 shared_model: Optional[SharedBackboneModel] = None, config: Optional[Dict] = None):
         """
         Initialise l'estimateur de poids
         
         Args:
             model_path: Chemin vers le modèle d'estimation de poids
             config_path: Chemin vers le fichier de configuration
+            shared_model: Modèle multi-tête (backbone partagé) remplaçant le ResNet50 dédié
+            config: Configuration déjà chargée, à la place de config_path (copie modifiée
+                    par un script ; la configuration mise en cache reste en lecture seule)
         """
         # Charger la configuration
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        self.config = config if config is not None else load_config(config_path)
         
         # Paramètres
         weight_config = self.config.get('models', {}).get('weight', {}).get('cnn', {})
         self.input_size = weight_config.get('input_size', [224, 224])
+        self.max_batch_size = weight_config.get('max_batch_size', 32)
         self.weight_range = [5, 300]  # Plage par défaut
         self.error_margin = 0.005  # 0.5% par défaut
         
@@ -37,14 +46,25 @@ class WeightEstimator:
             model_path = weight_config.get('path', 'models/weight/efficientnet_b4_weight.pt')
         
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        # Poids mappés en mémoire, partagés entre workers (voir startup.mmap_weights)
+        self.mmap_weights = self.config.get('startup', {}).get('mmap_weights', False)
+        # Hors-ligne: jamais de téléchargement des poids ImageNet
+        self.offline = self.config.get('startup', {}).get('offline', False)
         
-        # Vérifier si le modèle existe
-        if not Path(model_path).exists():
-            print(f"⚠️  Modèle d'estimation de poids non trouvé: {model_path}")
-            print("📝 Le modèle sera créé avec des poids pré-entraînés ImageNet. Entraînez-le avec vos données.")
-        
-        self.model = self._load_model(model_path)
-        self.model.eval()
+        self.shared_model = shared_model
+        if shared_model is not None:
+            # Poids fourni par la tête de régression du modèle multi-tête
+            self.model = None
+        else:
+            # Vérifier si le modèle existe
+            if not Path(model_path).exists():
+                print(f"⚠️  Modèle d'estimation de poids non trouvé: {model_path}")
+                print("📝 Le modèle sera créé avec des poids pré-entraînés ImageNet. Entraînez-le avec vos données.")
+            
+            # Backend torch (précision, compilation) ou ONNX Runtime, voir inference/backends.py
+            self.backend = load_backend(weight_config, model_path, lambda: self._load_model(model_path),
+                                        (3, *self.input_size), self.device, self.config, name='weight_cnn')
+            self.model = getattr(self.backend, 'model', None)
         
         # Transformations pour les images
         self.transform = transforms.Compose([
@@ -57,7 +77,8 @@ class WeightEstimator:
     def _load_model(self, model_path: str) -> nn.Module:
         """Charge le modèle d'estimation de poids"""
         # Architecture basée sur ResNet50 avec régression
-        model = models.resnet50(pretrained=True)
+        # Poids ImageNet seulement sans checkpoint (écrasés sinon)
+        model = build_resnet50(model_path, offline=self.offline)
         
         # Remplacer la dernière couche par une régression
         num_features = model.fc.in_features
@@ -72,14 +93,11 @@ class WeightEstimator:
         )
         
         if Path(model_path).exists():
-            checkpoint = torch.load(model_path, map_location=self.device)
-            if 'model_state_dict' in checkpoint:
-                model.load_state_dict(checkpoint['model_state_dict'])
-            else:
-                model.load_state_dict(checkpoint)
+            checkpoint = load_checkpoint(model_path, self.device, mmap=self.mmap_weights)
+            apply_state_dict(model, checkpoint, mmap=self.mmap_weights)
         else:
             print("⚠️  Modèle d'estimation de poids non entraîné. Utilisation de poids ImageNet pré-entraînés.")
-            # Les poids ImageNet sont déjà chargés avec pretrained=True
+            # Les poids ImageNet sont déjà chargés par build_resnet50 (sauf hors-ligne)
         
         model.to(self.device)
         return model
@@ -103,19 +121,23 @@ class WeightEstimator:
         height_pixels = y2 - y1
         width_pixels = x2 - x1
         
-        # Redimensionner pour le modèle
-        pig_roi_resized = cv2.resize(pig_roi, (self.input_size[1], self.input_size[0]))
-        
-        # Convertir BGR vers RGB
-        pig_roi_rgb = cv2.cvtColor(pig_roi_resized, cv2.COLOR_BGR2RGB)
-        
-        # Appliquer les transformations
-        tensor = self.transform(pig_roi_rgb).unsqueeze(0).to(self.device)
-        
-        # Estimer le poids
-        with torch.no_grad():
-            weight_pred = self.model(tensor)
-            weight_kg = float(weight_pred.cpu().numpy()[0][0])
+        if self.shared_model is not None:
+            # Sortie déjà calculée si le crop est passé par la Re-ID
+            weight_kg = float(self.shared_model.infer(image, [bbox])['weight'][0])
+        else:
+            # Redimensionner pour le modèle
+            pig_roi_resized = cv2.resize(pig_roi, (self.input_size[1], self.input_size[0]))
+            
+            # Convertir BGR vers RGB
+            pig_roi_rgb = cv2.cvtColor(pig_roi_resized, cv2.COLOR_BGR2RGB)
+            
+            # Appliquer les transformations
+            tensor = self.transform(pig_roi_rgb).unsqueeze(0).to(self.device)
+            
+            # Estimer le poids
+            with torch.inference_mode():
+                weight_pred = self.backend(tensor)
+                weight_kg = float(weight_pred.cpu().numpy()[0][0])
         
         # S'assurer que le poids est dans la plage valide
         weight_kg = np.clip(weight_kg, self.weight_range[0], self.weight_range[1])
@@ -135,27 +157,88 @@ class WeightEstimator:
             }
         }
     
-    def estimate_batch(self, image: np.ndarray, detections: List[dict]) -> List[dict]:
+    def estimate_boxes(self, image: np.ndarray, bboxes: Union[np.ndarray, List[List[int]]],
+                       crops: Optional[CropBatch] = None) -> List[Dict]:
         """
-        Estime le poids de plusieurs porcs dans une image
+        Estime le poids de plusieurs porcs d'une image en un seul forward
+        
+        Même résultat que estimate_from_image boîte par boîte : chaque crop est
+        redimensionné par cv2 comme dans le chemin unitaire (voir CropBatch), mais
+        la normalisation, le forward, le clipping et les intervalles sont
+        calculés pour toutes les boîtes à la fois.
         
         Args:
             image: Image complète
-            detections: Liste de détections avec bounding boxes
+            bboxes: Bounding boxes [x1, y1, x2, y2]
+            crops: Crops de la frame déjà préparés (CropBatch), optionnel
             
         Returns:
-            Liste de détections avec poids estimé ajouté
+            Un dictionnaire par boîte (voir estimate_from_image)
         """
-        results = []
+        boxes = np.asarray(bboxes, dtype=int).reshape(-1, 4)
+        if not len(boxes):
+            return []
         
-        for det in detections:
-            bbox = det['bbox']
-            weight_info = self.estimate_from_image(image, bbox)
-            
-            det_with_weight = det.copy()
-            det_with_weight['weight'] = weight_info
+        if self.shared_model is not None:
+            predictions = self.shared_model.infer(image, boxes.tolist(), crops)['weight']
+        else:
+            predictions = self._predict_crops(image, boxes, crops)
+        
+        weights = np.clip(predictions.astype(np.float64), self.weight_range[0], self.weight_range[1])
+        intervals = weights * self.error_margin
+        widths = (boxes[:, 2] - boxes[:, 0]).tolist()
+        heights = (boxes[:, 3] - boxes[:, 1]).tolist()
+        
+        weight_kg = np.round(weights, 2)
+        weight_min = np.round(weights - intervals, 2)
+        weight_max = np.round(weights + intervals, 2)
+        interval_kg = np.round(intervals, 2)
+        
+        return [
+            {
+                'weight_kg': weight_kg[i],
+                'weight_min': weight_min[i],
+                'weight_max': weight_max[i],
+                'confidence_interval': interval_kg[i],
+                'dimensions_pixels': {
+                    'width': widths[i],
+                    'height': heights[i]
+                }
+            }
+            for i in range(len(boxes))
+        ]
+    
+    def _predict_crops(self, image: np.ndarray, boxes: np.ndarray,
+                       crops: Optional[CropBatch] = None) -> np.ndarray:
+        """Poids bruts (N,) : crops empilés en un tensor (N, 3, H, W), forward par blocs"""
+        # Crops déjà préparés pour la frame si disponibles, sinon batch local
+        rows = crops.rows(boxes.tolist()) if crops is not None else None
+        if rows is None:
+            crops = CropBatch(image, boxes)
+        batch = crops.tensor(self.input_size, rows=rows).to(self.device)
+        
+        with torch.inference_mode():
+            predictions = torch.cat([
+                self.backend(batch[start:start + self.max_batch_size])[:, 0]
+                for start in range(0, batch.shape[0], self.max_batch_size)
+            ])
+        return predictions.cpu().numpy()
+    
+    def estimate_batch(self, image: np.ndarray, detections: Union[DetectionBatch, List[dict]]) -> List[dict]:
+        """
+        Estime le poids de plusieurs porcs dans une image (un seul forward)
+        
+        Args:
+            image: Image complète
+            detections: Détections (DetectionBatch ou liste de dicts avec bounding boxes)
             
-            results.append(det_with_weight)
+        Returns:
+            Liste de détections avec poids estimé ajouté
+        """
+        results = as_records(detections)
+        
+        for det_with_weight, weight in zip(results, self.estimate_boxes(image, boxes_of(detections))):
+            det_with_weight['weight'] = weight
         
         return results
     
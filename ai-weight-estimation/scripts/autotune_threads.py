@@ -0,0 +1,189 @@
+"""
+Réglage automatique des threads par worker
+Mesure WeightEstimationPipeline.predict pour plusieurs valeurs de
+`threads_per_worker`, avec `num_workers` processus en parallèle comme les
+workers de l'API, puis écrit la meilleure dans config/inference_config.yaml
+"""
+
+import argparse
+import copy
+import multiprocessing as mp
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Ajouter le répertoire parent au path
+sys.path.append(str(Path(__file__).parent.parent))
+
+INFERENCE_CONFIG_PATH = "config/inference_config.yaml"
+
+
+def load_frames(images_dir: str, limit: int = 16):
+    """Images réelles [(image, None)] d'un dossier"""
+    import cv2
+    frames = []
+    for path in sorted(Path(images_dir).glob('*')):
+        if path.suffix.lower() in ('.jpg', '.jpeg', '.png'):
+            image = cv2.imread(str(path))
+            if image is not None:
+                frames.append((image, None))
+        if len(frames) >= limit:
+            break
+    return frames
+
+
+def synthetic_frames(n_frames: int, pigs_per_frame: int, size=(1280, 720), seed: int = 0):
+    """Frames aléatoires avec des boîtes plausibles [(image, boxes)]"""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    frames = []
+    for _ in range(n_frames):
+        image = rng.integers(0, 255, (h, w, 3), dtype=np.uint8)
+        x1 = rng.integers(0, w - 300, pigs_per_frame)
+        y1 = rng.integers(0, h - 200, pigs_per_frame)
+        boxes = np.stack([x1, y1, x1 + rng.integers(150, 300, pigs_per_frame),
+                          y1 + rng.integers(100, 200, pigs_per_frame)], axis=1)
+        frames.append((image, boxes))
+    return frames
+
+
+def worker(threads_per_worker: int, args, ready, start, results):
+    """Un worker de l'API: budget de threads, pipeline, puis requêtes chronométrées"""
+    from inference.cpu_budget import apply_thread_budget
+    from inference.startup import load_config
+    # Copie: la configuration mise en cache est partagée et en lecture seule. Le budget
+    # n'est appliqué qu'une fois par processus, le pipeline reprend donc celui-ci
+    performance = copy.deepcopy(load_config(INFERENCE_CONFIG_PATH)['inference'].get('performance', {}))
+    performance.update(threads_per_worker=threads_per_worker, num_workers=args.workers)
+    apply_thread_budget(performance)
+
+    from inference.predict import WeightEstimationPipeline
+    from inference.detections import DetectionBatch
+    pipeline = WeightEstimationPipeline(config_path=INFERENCE_CONFIG_PATH)
+
+    frames = load_frames(args.images) if args.images else synthetic_frames(8, args.pigs_per_frame)
+
+    def request(image, boxes):
+        detections = pipeline._detect(image)
+        if not detections and boxes is not None:
+            # Frames synthétiques: le détecteur ne trouve rien, on mesure quand même les étapes par porc
+            detections = DetectionBatch(boxes, np.full(len(boxes), 0.9), np.zeros(len(boxes)), pipeline.detector.names)
+        pipeline.predict(image, detections=detections)
+
+    for i in range(args.warmup):
+        request(*frames[i % len(frames)])
+
+    ready.put(True)
+    start.wait()
+    latencies = []
+    for i in range(args.requests):
+        begin = time.perf_counter()
+        request(*frames[i % len(frames)])
+        latencies.append((time.perf_counter() - begin) * 1000)
+    results.put(latencies)
+
+
+def collect(queue, processes, count: int, timeout_s: float) -> list:
+    """`count` messages de la file, en échouant tout de suite si un worker s'arrête"""
+    import queue as queue_module
+    items, deadline = [], time.time() + timeout_s
+    while len(items) < count:
+        try:
+            items.append(queue.get(timeout=1.0))
+        except queue_module.Empty:
+            if any(process.exitcode not in (None, 0) for process in processes):
+                raise RuntimeError("Un worker s'est arrêté en erreur (voir la trace ci-dessus)")
+            if time.time() > deadline:
+                raise TimeoutError("Workers trop lents")
+    return items
+
+
+def run_candidate(threads_per_worker: int, args) -> dict:
+    """Latences agrégées de `workers` processus en parallèle"""
+    context = mp.get_context('spawn')
+    ready, start, results = context.Queue(), context.Event(), context.Queue()
+    processes = [context.Process(target=worker, args=(threads_per_worker, args, ready, start, results))
+                 for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+
+    try:
+        collect(ready, processes, len(processes), timeout_s=900)
+        begin = time.perf_counter()
+        start.set()
+        latencies = sum(collect(results, processes, len(processes), timeout_s=1800), [])
+        elapsed = time.perf_counter() - begin
+    finally:
+        for process in processes:
+            if process.is_alive() and not start.is_set():
+                process.terminate()
+            process.join()
+
+    return {
+        'threads': threads_per_worker,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'throughput': len(latencies) / elapsed
+    }
+
+
+def write_threads_per_worker(value: int, config_path: str = INFERENCE_CONFIG_PATH):
+    """Met à jour `threads_per_worker` sans réécrire le reste du fichier (commentaires conservés)"""
+    text = Path(config_path).read_text(encoding='utf-8')
+    updated, count = re.subn(r'^(\s*threads_per_worker:\s*)\d+', rf'\g<1>{value}', text, count=1, flags=re.M)
+    if not count:
+        updated = re.sub(r'^(\s*)(num_workers:.*)$', rf'\g<1>\g<2>\n\g<1>threads_per_worker: {value}',
+                         text, count=1, flags=re.M)
+    Path(config_path).write_text(updated, encoding='utf-8')
+
+
+def main():
+    from inference.cpu_budget import available_cpus
+    from inference.startup import load_config
+
+    performance = load_config(INFERENCE_CONFIG_PATH)['inference'].get('performance', {})
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=performance.get('num_workers', 4),
+                        help="Workers simultanés (défaut: inference.performance.num_workers)")
+    parser.add_argument('--candidates', default=None,
+                        help="Valeurs de threads_per_worker à tester, ex: 1,2,4 (défaut: automatique)")
+    parser.add_argument('--requests', type=int, default=20, help="Requêtes chronométrées par worker")
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--images', default=None, help="Dossier d'images réelles (défaut: frames synthétiques)")
+    parser.add_argument('--pigs-per-frame', type=int, default=4)
+    parser.add_argument('--metric', choices=['p99', 'throughput'], default='p99')
+    parser.add_argument('--dry-run', action='store_true', help="Ne pas modifier la configuration")
+    args = parser.parse_args()
+
+    cpus = len(available_cpus())
+    if args.candidates:
+        candidates = sorted({int(value) for value in args.candidates.split(',')})
+    else:
+        candidates = sorted({1, 2, max(1, cpus // args.workers), cpus})
+    print(f"🧪 {cpus} cœurs, {args.workers} workers, threads par worker testés: {candidates}")
+
+    rows = [run_candidate(threads, args) for threads in candidates]
+
+    print("=" * 64)
+    print(f"{'threads':>8}{'p50 (ms)':>14}{'p99 (ms)':>14}{'req/s':>12}")
+    for row in rows:
+        print(f"{row['threads']:>8}{row['p50_ms']:>14.1f}{row['p99_ms']:>14.1f}{row['throughput']:>12.2f}")
+    print("=" * 64)
+
+    if args.metric == 'p99':
+        best = min(rows, key=lambda row: row['p99_ms'])
+    else:
+        best = max(rows, key=lambda row: row['throughput'])
+    print(f"✅ Meilleur réglage ({args.metric}): threads_per_worker = {best['threads']}")
+
+    if not args.dry_run:
+        write_threads_per_worker(best['threads'])
+        print(f"📝 {INFERENCE_CONFIG_PATH} mis à jour")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Gain du chemin compilé (TorchScript gelé, CPU) par modèle
+Compare le forward eager (torch.no_grad) et le forward compilé
+(torch.inference_mode) de PigReID, WeightEstimator et KeypointDetector sur
+un batch de crops, et mesure la compilation puis le rechargement du cache
+"""
+
+import argparse
+import copy
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+# Ajouter le répertoire parent au path
+sys.path.append(str(Path(__file__).parent.parent))
+
+MODEL_CONFIG_PATH = "config/model_config.yaml"
+
+
+def time_forward(model, batch: torch.Tensor, context, repeats: int, warmup: int) -> float:
+    """Latence médiane d'un forward, en ms"""
+    timings = []
+    with context():
+        for i in range(warmup + repeats):
+            start = time.perf_counter()
+            model(batch)
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def build_components(config: dict):
+    """(nom, modèle eager, checkpoint, forme d'entrée) des modèles concernés"""
+    from inference.keypoints import KeypointDetector
+    from inference.reid import PigReID
+    from inference.weight_estimator import WeightEstimator
+
+    reid = PigReID(config_path=MODEL_CONFIG_PATH, config=config)
+    weight = WeightEstimator(config_path=MODEL_CONFIG_PATH, config=config)
+    keypoints = KeypointDetector(config_path=MODEL_CONFIG_PATH, config=config)
+    weight_path = config['models']['weight']['cnn']['path']
+    return [
+        ('reid', reid.model, config['models']['reid']['path'], (3, *reid.input_size)),
+        ('weight_cnn', weight.model, weight_path, (3, *weight.input_size)),
+        ('keypoints', keypoints.model, config['models']['weight']['geometric']['keypoints_model'], (3, 256, 256))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--batch-size', type=int, default=8, help="Crops par forward (porcs par frame)")
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--optimize', action='store_true', help="Ajouter torch.jit.optimize_for_inference")
+    args = parser.parse_args()
+
+    from inference.compiled import compile_for_inference, compiled_cache_path
+    from inference.cpu_budget import apply_thread_budget
+    from inference.startup import load_config
+
+    apply_thread_budget(load_config("config/inference_config.yaml")['inference'].get('performance', {}))
+    # Copie (la configuration mise en cache reste en lecture seule) pour des composants
+    # construits en torch eager: la compilation est appliquée ci-dessous, modèle par modèle
+    config = copy.deepcopy(load_config(MODEL_CONFIG_PATH))
+    settings = dict(config.get('compilation', {}), enabled=True, optimize_for_inference=args.optimize)
+    config['compilation'] = {'enabled': False}
+    for section in (config['models']['reid'], config['models']['weight']['cnn'], config['models']['weight']['geometric']):
+        section['backend'] = 'torch'
+
+    device = torch.device('cpu')
+    rows = []
+    for name, model, model_path, input_shape in build_components(config):
+        model = model.to(device)
+        batch = torch.randn(args.batch_size, *input_shape)
+
+        if Path(model_path).exists():
+            cache_path = compiled_cache_path(model_path, input_shape, settings.get('cache_dir') or None)
+            for path in cache_path.parent.glob(cache_path.stem + '*'):
+                path.unlink()
+
+        start = time.perf_counter()
+        compiled = compile_for_inference(model, model_path, input_shape, device, settings, name=name)
+        compile_s = time.perf_counter() - start
+        if compiled is model:
+            print(f"⚠️  {name}: pas de version compilée, ignoré.")
+            continue
+        start = time.perf_counter()
+        compile_for_inference(model, model_path, input_shape, device, settings, name=name)
+        cached_s = time.perf_counter() - start if Path(model_path).exists() else None
+
+        eager_ms = time_forward(model, batch, torch.no_grad, args.repeats, args.warmup)
+        compiled_ms = time_forward(compiled, batch, torch.inference_mode, args.repeats, args.warmup)
+        rows.append((name, eager_ms, compiled_ms, compile_s, cached_s))
+
+    print("=" * 78)
+    print(f"batch {args.batch_size}, {torch.get_num_threads()} threads torch")
+    print(f"{'modèle':<12}{'eager (ms)':>12}{'compilé (ms)':>14}{'gain':>8}{'compilation (s)':>17}{'cache (s)':>11}")
+    for name, eager_ms, compiled_ms, compile_s, cached_s in rows:
+        cached = f"{cached_s:>11.2f}" if cached_s is not None else f"{'-':>11}"
+        print(f"{name:<12}{eager_ms:>12.1f}{compiled_ms:>14.1f}{eager_ms / compiled_ms:>7.2f}x{compile_s:>17.2f}{cached}")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Re-ID neck face à PigReID : précision d'identification et latence par frame
+Galerie = annotations train_reid.csv, requêtes = val_reid.csv ; la latence
+d'une frame comprend la détection et l'embedding de toutes ses boîtes
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+# Ajouter le répertoire parent au path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from inference.detector import PigDetector
+from inference.gallery import FeatureGallery
+from inference.neck_reid import NeckEmbeddingHead, NeckReID
+
+
+class PigReIDPath:
+    """Chemin actuel : détection puis ResNet50 sur chaque crop"""
+
+    name = 'pigreid'
+
+    def __init__(self, detector: PigDetector, config_path: str):
+        from inference.reid import PigReID
+        self.detector = detector
+        self.reid = PigReID(config_path=config_path)
+        self.feature_dim = self.reid.feature_dim
+
+    def frame(self, image: np.ndarray, bboxes: list) -> np.ndarray:
+        self.detector.detect_resized([image])
+        # Pas de cache entre passes: chaque frame est mesurée embeddings compris
+        self.reid.embedding_cache.clear()
+        return self.reid.extract_features_batch(image, bboxes)
+
+
+class NeckPath:
+    """Mode neck : détection avec capture du neck puis ROI-align + projection"""
+
+    name = 'neck'
+
+    def __init__(self, detector: PigDetector, neck: NeckReID):
+        self.detector = detector
+        self.neck = neck
+        self.feature_dim = neck.feature_dim
+
+    def frame(self, image: np.ndarray, bboxes: list) -> np.ndarray:
+        _, features = self.detector.detect_with_features([image])
+        return self.neck.embed(features[0], bboxes)
+
+
+def random_head_neck(detector: PigDetector, config_path: str) -> NeckReID:
+    """Tête non entraînée (mesure de latence uniquement)"""
+    with open(config_path, 'r') as f:
+        reid_config = yaml.safe_load(f)['models']['reid']
+    neck_config = reid_config.get('neck', {})
+
+    _, probe = detector.detect_with_features([np.zeros((64, 64, 3), dtype=np.uint8)])
+    head = NeckEmbeddingHead([level.shape[1] for level in probe[0]['maps']], probe[0]['strides'],
+                             feature_dim=reid_config.get('feature_dim', 512),
+                             reduced_channels=neck_config.get('reduced_channels', 128),
+                             pool_size=neck_config.get('pool_size', [4, 4]))
+    return NeckReID(detector, config_path=config_path, head=head)
+
+
+def load_frames(annotations_file: Path, images_dir: str):
+    """[(image, bboxes, pig_ids)] groupés par image"""
+    import pandas as pd
+    annotations = pd.read_csv(annotations_file)
+    frames = []
+    for image_path, rows in annotations.groupby('image_path'):
+        image = cv2.imread(str(Path(images_dir) / image_path))
+        if image is None:
+            continue
+        bboxes = rows[['bbox_x1', 'bbox_y1', 'bbox_x2', 'bbox_y2']].astype(int).values.tolist()
+        frames.append((image, bboxes, rows['pig_id'].astype(str).tolist()))
+    return frames
+
+
+def synthetic_frames(n_frames: int, pigs_per_frame: int, size=(1280, 720), seed: int = 0):
+    """Frames aléatoires avec des boîtes plausibles (latence uniquement)"""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    frames = []
+    for _ in range(n_frames):
+        image = rng.integers(0, 255, (h, w, 3), dtype=np.uint8)
+        x1 = rng.integers(0, w - 300, pigs_per_frame)
+        y1 = rng.integers(0, h - 200, pigs_per_frame)
+        bboxes = np.stack([x1, y1, x1 + rng.integers(150, 300, pigs_per_frame),
+                           y1 + rng.integers(100, 200, pigs_per_frame)], axis=1).tolist()
+        frames.append((image, bboxes, None))
+    return frames
+
+
+def evaluate(path, gallery_frames, query_frames, warmup: int = 3):
+    """Précision top-1 (si étiquettes) et latence par frame des requêtes"""
+    for image, bboxes, _ in query_frames[:warmup]:
+        path.frame(image, bboxes)
+
+    latencies, correct, total = [], 0, 0
+    gallery = None
+    if gallery_frames:
+        gallery = FeatureGallery(path.feature_dim)
+        for image, bboxes, pig_ids in gallery_frames:
+            for pig_id, vector in zip(pig_ids, path.frame(image, bboxes)):
+                gallery.add(pig_id, vector)
+
+    for image, bboxes, pig_ids in query_frames:
+        start = time.perf_counter()
+        embeddings = path.frame(image, bboxes)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        if gallery is not None and pig_ids is not None:
+            for pig_id, match in zip(pig_ids, gallery.search(embeddings)):
+                correct += int(match is not None and match[0] == pig_id)
+                total += 1
+
+    return {
+        'top1': correct / total * 100 if total else None,
+        'mean_ms': float(np.mean(latencies)),
+        'p95_ms': float(np.percentile(latencies, 95))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--config', default='config/model_config.yaml')
+    parser.add_argument('--train-config', default='config/config.yaml', help="Chemins des annotations")
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help="N frames aléatoires au lieu des annotations (latence uniquement)")
+    parser.add_argument('--pigs-per-frame', type=int, default=8)
+    parser.add_argument('--random-head', action='store_true',
+                        help="Tête neck non entraînée (latence uniquement)")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        neck_config = yaml.safe_load(f)['models']['reid'].get('neck', {})
+
+    detector = PigDetector(config_path=args.config)
+    if detector.model is None:
+        print("❌ Le mode neck nécessite le backend de détection torch")
+        return
+
+    if args.random_head:
+        neck = random_head_neck(detector, args.config)
+    else:
+        neck = NeckReID(detector, neck_config.get('path', 'models/reid/neck_reid_head.pt'), config_path=args.config)
+
+    if args.synthetic:
+        gallery_frames, query_frames = None, synthetic_frames(args.synthetic, args.pigs_per_frame)
+        print(f"🧪 {args.synthetic} frames synthétiques, {args.pigs_per_frame} porcs par frame (latence uniquement)")
+    else:
+        with open(args.train_config, 'r') as f:
+            paths_config = yaml.safe_load(f)['paths']
+        annotations_dir = Path(paths_config['annotations_dir'])
+        gallery_frames = load_frames(annotations_dir / 'train_reid.csv', paths_config['images_dir'])
+        query_frames = load_frames(annotations_dir / 'val_reid.csv', paths_config['images_dir'])
+        print(f"📂 Galerie: {len(gallery_frames)} images, requêtes: {len(query_frames)} images")
+
+    rows = []
+    for path in (PigReIDPath(detector, args.config), NeckPath(detector, neck)):
+        rows.append((path.name, evaluate(path, gallery_frames, query_frames)))
+
+    print("=" * 60)
+    print(f"{'mode':<10}{'top-1 (%)':>12}{'frame moy. (ms)':>18}{'frame p95 (ms)':>18}")
+    for name, result in rows:
+        top1 = f"{result['top1']:.2f}" if result['top1'] is not None else '-'
+        print(f"{name:<10}{top1:>12}{result['mean_ms']:>18.1f}{result['p95_ms']:>18.1f}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
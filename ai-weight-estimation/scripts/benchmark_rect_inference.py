@@ -0,0 +1,103 @@
+"""
+Benchmark du letterbox carré vs formes rectangulaires pour la détection
+Mesure le débit (images/s) sur des images extraites des vidéos d'exemple
+et vérifie que les deux modes retournent le même nombre de porcs
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+
+# Ajouter le répertoire parent au path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from inference.detector import PigDetector
+
+
+def load_frames(videos_dir: str, every: int = 30, max_frames: int = 64) -> list:
+    """Extrait une image toutes les `every` images des vidéos du dossier"""
+    frames = []
+    videos = sorted(p for p in Path(videos_dir).glob('*') if p.suffix.lower() in ('.mp4', '.avi', '.mov', '.mkv'))
+
+    for video_path in videos:
+        cap = cv2.VideoCapture(str(video_path))
+        index = 0
+        while len(frames) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if index % every == 0:
+                frames.append(frame)
+            index += 1
+        cap.release()
+        if len(frames) >= max_frames:
+            break
+
+    return frames
+
+
+def measure(detector: PigDetector, frames: list, batch_size: int, runs: int) -> tuple:
+    """Retourne (images/s, nombre total de détections)"""
+    batches = [frames[i:i + batch_size] for i in range(0, len(frames), batch_size)]
+    detector.detect_resized(batches[0])  # Préchauffage
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        detections = [d for batch in batches for d in detector.detect_resized(batch)]
+    elapsed = time.perf_counter() - start
+
+    return len(frames) * runs / elapsed, sum(len(d) for d in detections)
+
+
+def benchmark(videos_dir: str, config_path: str = "config/model_config.yaml",
+              batch_size: int = 8, runs: int = 3, every: int = 30, max_frames: int = 64):
+    """
+    Compare les deux modes sur les mêmes images
+
+    Args:
+        videos_dir: Dossier des vidéos d'exemple
+        config_path: Configuration des modèles
+        batch_size: Taille des batchs envoyés au détecteur
+        runs: Nombre de passages sur l'ensemble des images
+        every: Pas d'échantillonnage des images
+        max_frames: Nombre maximum d'images
+    """
+    frames = load_frames(videos_dir, every, max_frames)
+    if not frames:
+        print(f"❌ Aucune vidéo lisible dans {videos_dir}")
+        return
+
+    detector = PigDetector(config_path=config_path)
+    h, w = frames[0].shape[:2]
+
+    results = {}
+    for mode, rect in (('carré', False), ('rectangulaire', True)):
+        detector.rect_inference = rect
+        shape = detector.inference_shape(frames[0])
+        results[mode] = measure(detector, frames, batch_size, runs)
+        print(f"   • {mode}: entrée {shape[0]}x{shape[1]}, {results[mode][0]:.2f} images/s, "
+              f"{results[mode][1]} détections")
+
+    square_fps, square_count = results['carré']
+    rect_fps, rect_count = results['rectangulaire']
+    print("=" * 60)
+    print(f"📊 {len(frames)} images {w}x{h}, batch {batch_size}, backend {detector.backend}")
+    print(f"   • Gain de débit: x{rect_fps / square_fps:.2f}")
+    print(f"   • Écart de détections: {rect_count - square_count:+d}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--videos', default='data/videos', help="Dossier des vidéos d'exemple")
+    parser.add_argument('--config', default='config/model_config.yaml')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--every', type=int, default=30, help="Une image toutes les N images")
+    parser.add_argument('--max-frames', type=int, default=64)
+    args = parser.parse_args()
+
+    benchmark(args.videos, args.config, args.batch_size, args.runs, args.every, args.max_frames)
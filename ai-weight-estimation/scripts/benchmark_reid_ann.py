@@ -0,0 +1,89 @@
+"""
+Recall@1 et latence de l'index IVF-PQ face à la recherche exacte
+Utilise la galerie persistante si elle est assez grande, sinon des
+embeddings synthétiques (un centre par porc + bruit de prise de vue)
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+# Ajouter le répertoire parent au path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from inference.ann_index import IVFPQIndex, recall_report
+from inference.gallery import FeatureGallery, PersistentFeatureGallery
+
+
+def synthetic_gallery(n_pigs: int, dim: int, noise: float, n_queries: int, seed: int = 0):
+    """Galerie synthétique et requêtes bruitées autour de porcs tirés au hasard"""
+    rng = np.random.default_rng(seed)
+    centers = FeatureGallery.normalize(rng.normal(size=(n_pigs, dim)).astype(np.float32))
+
+    gallery = FeatureGallery(dim, initial_capacity=n_pigs)
+    for i, center in enumerate(centers):
+        gallery.add(f"PORC{i:06d}", center)
+
+    picked = rng.integers(0, n_pigs, n_queries)
+    queries = centers[picked] + rng.normal(scale=noise / np.sqrt(dim), size=(n_queries, dim))
+    return gallery, queries.astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--config', default='config/model_config.yaml')
+    parser.add_argument('--pigs', type=int, default=50000, help="Taille de la galerie synthétique")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--noise', type=float, default=0.5, help="Bruit des requêtes synthétiques")
+    parser.add_argument('--synthetic', action='store_true', help="Ignorer la galerie persistante")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        reid_config = yaml.safe_load(f)['models']['reid']
+    dim = reid_config.get('feature_dim', 512)
+    ann_config = reid_config.get('ann', {})
+    gallery_config = reid_config.get('gallery', {})
+
+    gallery, queries = None, None
+    gallery_path = Path(gallery_config.get('path', 'models/reid/gallery'))
+    if not args.synthetic and gallery_path.exists():
+        stored = PersistentFeatureGallery(dim, str(gallery_path))
+        if len(stored) >= ann_config.get('n_lists', 256):
+            rng = np.random.default_rng(0)
+            vectors = stored.vectors(stored.ids)
+            picked = rng.integers(0, len(vectors), args.queries)
+            gallery = stored
+            queries = vectors[picked] + rng.normal(scale=args.noise / np.sqrt(dim), size=(args.queries, dim))
+            print(f"📂 Galerie persistante: {len(stored)} porcs")
+
+    if gallery is None:
+        gallery, queries = synthetic_gallery(args.pigs, dim, args.noise, args.queries)
+        print(f"🧪 Galerie synthétique: {args.pigs} porcs, bruit {args.noise}")
+
+    index = IVFPQIndex(
+        dim,
+        n_lists=ann_config.get('n_lists', 256),
+        n_subvectors=ann_config.get('n_subvectors', 64),
+        n_probe=ann_config.get('n_probe', 16),
+        rerank_k=ann_config.get('rerank_k', 50)
+    )
+    print("⏳ Entraînement de l'index...")
+    ids = gallery.ids
+    vectors = gallery.vectors(ids)
+    index.train(vectors)
+    index.add(ids, vectors)
+
+    print("=" * 60)
+    print(f"{'méthode':<10}{'n_probe':>10}{'recall@1':>12}{'latence (ms)':>16}")
+    for row in recall_report(index, gallery, queries):
+        n_probe = '-' if row['n_probe'] is None else row['n_probe']
+        print(f"{row['method']:<10}{n_probe:>10}{row['recall@1']:>12.4f}{row['latency_ms']:>16.3f}")
+    print(f"Mémoire: {index.n_subvectors} octets/porc (codes PQ) vs {4 * dim} octets/porc (float32)")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
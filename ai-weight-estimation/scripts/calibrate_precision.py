@@ -0,0 +1,311 @@
+"""
+Calibration de la précision d'inférence (bf16) sur le jeu de validation
+Compare fp32 et le mode demandé pour chaque modèle puis écrit le rapport du
+checkpoint (calibration/ à côté du checkpoint) : sans rapport validé, le mode
+bf16 reste désactivé à l'exécution (voir precision_calibration)
+
+- Poids: écart d'erreur absolue moyenne (val_weights.csv)
+- Re-ID: écart de rank-1, galerie train_reid.csv, requêtes val_reid.csv
+- Points clés: écart moyen bf16/fp32 des coordonnées relatives au crop
+- Segmentation: IoU moyenne des masques bf16/fp32
+- Multi-tête: les trois critères ci-dessus sur ses têtes poids, Re-ID et points clés
+"""
+
+import argparse
+import copy
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+import yaml
+
+# Ajouter le répertoire parent au path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from inference.backends import TorchBackend
+from inference.precision import InferencePrecision, bf16_supported, save_calibration
+from inference.preprocessing import CropBatch
+from inference.startup import load_config
+
+MODEL_CONFIG_PATH = "config/model_config.yaml"
+MODELS = ('weight', 'reid', 'keypoints', 'segmentation', 'multihead')
+
+
+def load_frames(annotations_file: Path, images_dir: str, label: str, limit: int = 0):
+    """[(image, bboxes, labels)] groupés par image"""
+    import pandas as pd
+    if not annotations_file.exists():
+        return []
+    annotations = pd.read_csv(annotations_file)
+    frames = []
+    for image_path, rows in annotations.groupby('image_path'):
+        image = cv2.imread(str(Path(images_dir) / image_path))
+        if image is None:
+            continue
+        bboxes = rows[['bbox_x1', 'bbox_y1', 'bbox_x2', 'bbox_y2']].astype(int).values.tolist()
+        frames.append((image, bboxes, rows[label].tolist()))
+        if limit and len(frames) >= limit:
+            break
+    return frames
+
+
+def use_precision(component, precision: InferencePrecision):
+    """Applique un mode au modèle torch déjà chargé d'un composant"""
+    component.model = precision.prepare(component.model)
+    if hasattr(component, 'backend'):
+        component.backend = TorchBackend(component.model, precision)
+    else:
+        component.precision = precision
+
+
+def timed(function):
+    """(résultat, durée en s)"""
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def weight_mae(estimator, frames) -> float:
+    errors = []
+    for image, bboxes, weights in frames:
+        predictions = estimator.estimate_boxes(image, np.array(bboxes))
+        errors.extend(abs(p['weight_kg'] - float(w)) for p, w in zip(predictions, weights))
+    return float(np.mean(errors))
+
+
+def reid_rank1(reid, gallery_frames, query_frames) -> float:
+    def embed(image, bboxes):
+        reid.embedding_cache.clear()
+        return reid.extract_features_batch(image, bboxes)
+    return rank1(embed, gallery_frames, query_frames)
+
+
+def rank1(embed_frame, gallery_frames, query_frames) -> float:
+    """Rank-1 au plus proche voisin parmi les vues de la galerie"""
+    def embed(frames):
+        vectors, labels = [], []
+        for image, bboxes, pig_ids in frames:
+            vectors.append(embed_frame(image, bboxes))
+            labels.extend(str(pig_id) for pig_id in pig_ids)
+        return np.concatenate(vectors), np.array(labels)
+
+    gallery, gallery_ids = embed(gallery_frames)
+    queries, query_ids = embed(query_frames)
+    nearest = np.argmax(queries @ gallery.T, axis=1)
+    return float(np.mean(gallery_ids[nearest] == query_ids))
+
+
+def keypoint_outputs(detector, frames) -> np.ndarray:
+    """Sorties brutes (x, y relatifs au crop) de toutes les boîtes"""
+    outputs = []
+    for image, bboxes, _ in frames:
+        batch = CropBatch(image, bboxes).tensor((256, 256), resize='pil').to(detector.device)
+        with torch.inference_mode():
+            output = detector.backend(batch).cpu().numpy()
+        outputs.append(output.reshape(len(bboxes), detector.num_keypoints, 3)[:, :, :2])
+    return np.concatenate(outputs)
+
+
+def multihead_metrics(model, data) -> tuple:
+    """(MAE du poids, rank-1 Re-ID, points clés bruts) des têtes du modèle multi-tête"""
+    def infer(image, bboxes):
+        model.cache.clear()
+        return model.infer(image, bboxes)
+
+    errors = []
+    for image, bboxes, weights in data['weights']:
+        predictions = infer(image, bboxes)['weight']
+        errors.extend(abs(float(p) - float(w)) for p, w in zip(predictions, weights))
+    top1 = rank1(lambda image, bboxes: infer(image, bboxes)['reid'], data['reid_gallery'], data['reid_queries'])
+    keypoints = np.concatenate([infer(image, bboxes)['keypoints'][:, :, :2] for image, bboxes, _ in data['all']])
+    return float(np.mean(errors)), top1, keypoints
+
+
+def union_masks(segmenter, frames) -> list:
+    masks = []
+    for image, _, _ in frames:
+        mask = np.zeros(image.shape[:2], dtype=bool)
+        for segment in segmenter.segment(image):
+            mask |= segment['mask'] > 0
+        masks.append(mask)
+    return masks
+
+
+def mean_iou(reference: list, candidate: list) -> float:
+    ious = []
+    for a, b in zip(reference, candidate):
+        union = np.logical_or(a, b).sum()
+        ious.append(np.logical_and(a, b).sum() / union if union else 1.0)
+    return float(np.mean(ious))
+
+
+def calibrate(name: str, component, candidate: InferencePrecision, data, thresholds: dict) -> dict:
+    """Métriques fp32 puis candidat, et décision"""
+    reference = InferencePrecision({}, component.device, name=name)
+
+    if name == 'weight':
+        measure = lambda: weight_mae(component, data['weights'])
+    elif name == 'reid':
+        measure = lambda: reid_rank1(component, data['reid_gallery'], data['reid_queries'])
+    elif name == 'keypoints':
+        measure = lambda: keypoint_outputs(component, data['all'])
+    elif name == 'multihead':
+        measure = lambda: multihead_metrics(component, data)
+    else:
+        measure = lambda: union_masks(component, data['all'])
+
+    use_precision(component, reference)
+    fp32_value, fp32_s = timed(measure)
+    use_precision(component, candidate)
+    candidate_value, candidate_s = timed(measure)
+
+    if name == 'weight':
+        delta = candidate_value - fp32_value
+        metrics = {'mae_fp32_kg': fp32_value, 'mae_candidate_kg': candidate_value, 'mae_delta_kg': delta}
+        approved = delta <= thresholds.get('max_weight_mae_delta_kg', 0.5)
+        reason = f"MAE +{delta:.3f} kg"
+    elif name == 'reid':
+        drop = fp32_value - candidate_value
+        metrics = {'rank1_fp32': fp32_value, 'rank1_candidate': candidate_value, 'rank1_drop': drop}
+        approved = drop <= thresholds.get('max_rank1_drop', 0.01)
+        reason = f"rank-1 -{drop * 100:.2f} pts"
+    elif name == 'keypoints':
+        delta = float(np.mean(np.abs(candidate_value - fp32_value)))
+        metrics = {'mean_abs_delta': delta, 'max_abs_delta': float(np.max(np.abs(candidate_value - fp32_value)))}
+        approved = delta <= thresholds.get('max_keypoint_delta', 0.01)
+        reason = f"écart moyen {delta:.4f}"
+    elif name == 'multihead':
+        (mae_fp32, rank1_fp32, keypoints_fp32), (mae, top1, keypoints) = fp32_value, candidate_value
+        delta, drop = mae - mae_fp32, rank1_fp32 - top1
+        keypoint_delta = float(np.mean(np.abs(keypoints - keypoints_fp32)))
+        metrics = {'mae_fp32_kg': mae_fp32, 'mae_candidate_kg': mae, 'mae_delta_kg': delta,
+                   'rank1_fp32': rank1_fp32, 'rank1_candidate': top1, 'rank1_drop': drop,
+                   'keypoint_mean_abs_delta': keypoint_delta}
+        approved = (delta <= thresholds.get('max_weight_mae_delta_kg', 0.5)
+                    and drop <= thresholds.get('max_rank1_drop', 0.01)
+                    and keypoint_delta <= thresholds.get('max_keypoint_delta', 0.01))
+        reason = f"MAE +{delta:.3f} kg, rank-1 -{drop * 100:.2f} pts, points {keypoint_delta:.4f}"
+    else:
+        iou = mean_iou(fp32_value, candidate_value)
+        metrics = {'mean_mask_iou': iou}
+        approved = iou >= thresholds.get('min_mask_iou', 0.95)
+        reason = f"IoU {iou:.3f}"
+
+    metrics.update(seconds_fp32=round(fp32_s, 3), seconds_candidate=round(candidate_s, 3))
+    return {'approved': bool(approved), 'reason': reason, 'metrics': metrics}
+
+
+def eager_config() -> dict:
+    """
+    Copie de la configuration des modèles pour des composants torch fp32 eager
+
+    Le mode testé est appliqué ensuite ; la configuration mise en cache est
+    partagée et reste en lecture seule.
+    """
+    config = copy.deepcopy(load_config(MODEL_CONFIG_PATH))
+    config.setdefault('compilation', {})['enabled'] = False
+    models_config = config['models']
+    for section in (models_config['reid'], models_config['segmentation'], models_config['multihead'],
+                    models_config['weight']['cnn'], models_config['weight']['geometric']):
+        section['precision'] = {'dtype': 'fp32', 'memory_format': 'contiguous'}
+        section['backend'] = 'torch'
+    return config
+
+
+def build(name: str, config: dict):
+    """Composant chargé en fp32 (config de eager_config), et son checkpoint"""
+    models_config = config['models']
+    if name == 'weight':
+        from inference.weight_estimator import WeightEstimator
+        return WeightEstimator(config_path=MODEL_CONFIG_PATH, config=config), models_config['weight']['cnn']['path']
+    if name == 'reid':
+        from inference.reid import PigReID
+        return PigReID(config_path=MODEL_CONFIG_PATH, config=config), models_config['reid']['path']
+    if name == 'keypoints':
+        from inference.keypoints import KeypointDetector
+        return (KeypointDetector(config_path=MODEL_CONFIG_PATH, config=config),
+                models_config['weight']['geometric']['keypoints_model'])
+    if name == 'multihead':
+        from inference.multihead import SharedBackboneModel
+        model_path = models_config['multihead']['path']
+        model = (SharedBackboneModel(model_path, config_path=MODEL_CONFIG_PATH, config=config)
+                 if Path(model_path).exists() else None)
+        return model, model_path
+    from inference.segmentation import PigSegmenter
+    return PigSegmenter(config_path=MODEL_CONFIG_PATH, config=config), models_config['segmentation']['path']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', default=','.join(MODELS), help=f"Modèles à calibrer ({', '.join(MODELS)})")
+    parser.add_argument('--dtype', choices=['bf16'], default='bf16')
+    parser.add_argument('--memory-format', choices=['contiguous', 'channels_last'], default='channels_last')
+    parser.add_argument('--train-config', default='config/config.yaml', help="Chemins des annotations")
+    parser.add_argument('--limit', type=int, default=0, help="Images max par fichier d'annotations (0: toutes)")
+    parser.add_argument('--dry-run', action='store_true', help="Afficher sans écrire les rapports")
+    args = parser.parse_args()
+
+    if not bf16_supported():
+        print("❌ Ce CPU ne gère pas bf16: rien à calibrer.")
+        return
+
+    config = eager_config()
+    thresholds = config.get('precision_calibration', {})
+
+    with open(args.train_config, 'r') as f:
+        paths_config = yaml.safe_load(f)['paths']
+    annotations_dir = Path(paths_config['annotations_dir'])
+    images_dir = paths_config['images_dir']
+    data = {
+        'weights': load_frames(annotations_dir / 'val_weights.csv', images_dir, 'weight_kg', args.limit),
+        'reid_gallery': load_frames(annotations_dir / 'train_reid.csv', images_dir, 'pig_id', args.limit),
+        'reid_queries': load_frames(annotations_dir / 'val_reid.csv', images_dir, 'pig_id', args.limit)
+    }
+    data['all'] = data['weights'] + data['reid_queries']
+    required = {'weight': ['weights'], 'reid': ['reid_gallery', 'reid_queries'],
+                'keypoints': ['all'], 'segmentation': ['all'],
+                'multihead': ['weights', 'reid_gallery', 'reid_queries']}
+    print(f"📂 Validation: {len(data['weights'])} images poids, {len(data['reid_gallery'])} galerie / "
+          f"{len(data['reid_queries'])} requêtes Re-ID")
+
+    candidate_settings = {'dtype': args.dtype, 'memory_format': args.memory_format}
+    rows = []
+    for name in [model.strip() for model in args.models.split(',') if model.strip()]:
+        if name not in MODELS:
+            print(f"⚠️  Modèle inconnu: {name}")
+            continue
+        if not all(data[key] for key in required[name]):
+            print(f"⚠️  {name}: aucune donnée de validation, non calibré.")
+            continue
+        component, model_path = build(name, config)
+        if not Path(model_path).exists():
+            print(f"⚠️  {name}: checkpoint absent ({model_path}), non calibré.")
+            continue
+
+        candidate = InferencePrecision(candidate_settings, component.device, model_path,
+                                       {'require': False}, name=name)
+        result = calibrate(name, component, candidate, data, thresholds)
+        result.update(memory_format=args.memory_format, thresholds=thresholds,
+                      torch=torch.__version__, date=datetime.now().isoformat(timespec='seconds'))
+        rows.append((name, result))
+        if not args.dry_run:
+            path = save_calibration(model_path, args.dtype, result)
+            print(f"📝 Rapport écrit: {path}")
+
+    print("=" * 72)
+    print(f"{'modèle':<14}{'décision':<12}{'mesure':<24}{'fp32 (s)':>10}{args.dtype + ' (s)':>12}")
+    for name, result in rows:
+        decision = '✅ validé' if result['approved'] else '❌ refusé'
+        metrics = result['metrics']
+        print(f"{name:<14}{decision:<12}{result['reason']:<24}"
+              f"{metrics['seconds_fp32']:>10.2f}{metrics['seconds_candidate']:>12.2f}")
+    print("=" * 72)
+    print(f"💡 Activer ensuite precision.dtype: {args.dtype} pour les modèles validés (model_config.yaml).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Export ONNX du détecteur et comparaison des backends torch / onnxruntime
+Vérifie que les deux backends retournent les mêmes détections (à tolérance près)
+et mesure la latence de chacun sur CPU
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+# Ajouter le répertoire parent au path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from inference.detector import PigDetector
+from inference.video_tracker import VideoTracker
+
+
+def export_onnx(config_path: str = "config/model_config.yaml"):
+    """Exporte le modèle YOLOv8 configuré vers `models.detection.onnx_path`"""
+    from ultralytics import YOLO
+
+    with open(config_path, 'r') as f:
+        det_config = yaml.safe_load(f)['models']['detection']
+
+    model_path = det_config['path']
+    if not Path(model_path).exists():
+        print(f"❌ Modèle non trouvé: {model_path}")
+        return
+
+    print(f"📦 Export ONNX de {model_path}...")
+    exported = YOLO(model_path).export(
+        format='onnx',
+        imgsz=det_config.get('input_size', [640, 640]),
+        dynamic=True,  # Axe batch dynamique pour detect_batch
+        simplify=True
+    )
+
+    target = Path(det_config.get('onnx_path', Path(model_path).with_suffix('.onnx')))
+    target.parent.mkdir(parents=True, exist_ok=True)
+    Path(exported).replace(target)
+    print(f"✅ Modèle ONNX créé: {target}")
+
+
+def _make_detector(backend: str, config: dict) -> PigDetector:
+    """Crée un détecteur en forçant le backend"""
+    config = yaml.safe_load(yaml.safe_dump(config))
+    config['models']['detection']['backend'] = backend
+    return PigDetector(config=config)
+
+
+def compare_backends(images_dir: str, config_path: str = "config/model_config.yaml",
+                     iou_tolerance: float = 0.9, runs: int = 3):
+    """
+    Compare les détections et la latence des deux backends
+
+    Args:
+        images_dir: Dossier d'images de test
+        config_path: Configuration des modèles
+        iou_tolerance: IoU minimum pour considérer deux boîtes identiques
+        runs: Nombre de passages par image pour la latence
+    """
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+
+    images = sorted(p for p in Path(images_dir).glob('*') if p.suffix.lower() in ('.jpg', '.jpeg', '.png'))
+    if not images:
+        print(f"❌ Aucune image dans {images_dir}")
+        return
+
+    torch_detector = _make_detector('torch', config)
+    onnx_detector = _make_detector('onnxruntime', config)
+    if onnx_detector.backend != 'onnxruntime':
+        print("❌ Backend ONNX indisponible (exportez d'abord avec --export)")
+        return
+
+    iou_helper = VideoTracker()
+    latencies = {'torch': [], 'onnxruntime': []}
+    matched, total_torch, total_onnx, max_conf_delta = 0, 0, 0, 0.0
+
+    for image_path in images:
+        image = cv2.imread(str(image_path))
+        if image is None:
+            continue
+
+        results = {}
+        for name, detector in (('torch', torch_detector), ('onnxruntime', onnx_detector)):
+            detector.detect(image)  # Préchauffage
+            start = time.perf_counter()
+            for _ in range(runs):
+                results[name] = detector.detect(image)
+            latencies[name].append((time.perf_counter() - start) / runs * 1000)
+
+        reference, candidate = results['torch'], results['onnxruntime']
+        total_torch += len(reference)
+        total_onnx += len(candidate)
+        if len(reference) and len(candidate):
+            iou = iou_helper._compute_iou_matrix(reference.boxes, candidate.boxes)
+            best = iou.argmax(axis=1)
+            ok = iou[np.arange(len(reference)), best] >= iou_tolerance
+            matched += int(ok.sum())
+            if ok.any():
+                deltas = np.abs(reference.confidences[ok] - candidate.confidences[best[ok]])
+                max_conf_delta = max(max_conf_delta, float(deltas.max()))
+
+    print("=" * 60)
+    print(f"📊 {len(images)} images")
+    print(f"   • Détections torch: {total_torch} | onnxruntime: {total_onnx}")
+    print(f"   • Boîtes appariées (IoU >= {iou_tolerance}): {matched}/{total_torch}")
+    print(f"   • Écart de confiance max: {max_conf_delta:.4f}")
+    for name, values in latencies.items():
+        print(f"   • Latence {name}: {np.mean(values):.1f} ms (p95 {np.percentile(values, 95):.1f} ms)")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--export', action='store_true', help="Exporter le modèle en ONNX avant la comparaison")
+    parser.add_argument('--images', default='data/images/val', help="Dossier d'images de test")
+    parser.add_argument('--config', default='config/model_config.yaml')
+    args = parser.parse_args()
+
+    if args.export:
+        export_onnx(args.config)
+    compare_backends(args.images, args.config)
@@ -63,11 +63,15 @@ def convert_to_tflite(model_path: str, output_path: str):
     print("⚠️  Cette conversion nécessite TensorFlow. Implémentation à compléter.")
     # TODO: Implémenter la conversion PyTorch -> TensorFlow -> TFLite
 
-def convert_to_coreml(model_path: str, output_path: str, input_size: tuple = (1, 3, 640, 640)):
+def convert_to_coreml(model_path: str, output_path: str, input_size: tuple = (1, 3, 640, 640),
+                      model: torch.nn.Module = None):
     """
     Convertit un modèle PyTorch en CoreML (pour iOS)
     
     Note: Nécessite coremltools
+    
+    Args:
+        model: Modèle déjà construit (sinon chargé depuis model_path, modèle complet picklé)
     """
     try:
         import coremltools as ct
@@ -78,7 +82,8 @@ def convert_to_coreml(model_path: str, output_path: str, input_size: tuple = (1,
     print(f"Conversion de {model_path} vers CoreML...")
     
     # Charger le modèle
-    model = torch.load(model_path, map_location='cpu')
+    if model is None:
+        model = torch.load(model_path, map_location='cpu')
     model.eval()
     
     # Créer un exemple d'entrée
@@ -127,39 +132,25 @@ def convert_all_models():
         else:
             print(f"⚠️  Modèle non trouvé: {model_path}")
     
-    # Conversion Re-ID
-    if 'reid' in models_config:
-        reid_config = models_config['reid']
-        model_path = reid_config['path']
-        
-        if Path(model_path).exists():
-            input_size = (1, 3, *reid_config['input_size'])
-            
-            # ONNX
-            onnx_path = output_dir / f"{reid_config['name']}.onnx"
-            convert_to_onnx(model_path, str(onnx_path), input_size)
-            
-            # CoreML
-            coreml_path = output_dir / f"{reid_config['name']}.mlmodel"
-            convert_to_coreml(model_path, str(coreml_path), input_size)
-        else:
-            print(f"⚠️  Modèle non trouvé: {model_path}")
+    # Re-ID et estimation de poids: les checkpoints sont des state dicts, le
+    # modèle est reconstruit comme dans le pipeline (voir export_onnx.py)
+    from export_onnx import build_eager_model, export_model
     
-    # Conversion estimation de poids
-    if 'weight_estimation' in models_config:
-        weight_config = models_config['weight_estimation']
-        model_path = weight_config['path']
+    for name, model_config in (('reid', models_config.get('reid')),
+                               ('weight_cnn', models_config.get('weight', {}).get('cnn'))):
+        if not model_config:
+            continue
+        model_path = model_config['path']
         
         if Path(model_path).exists():
-            input_size = (1, 3, *weight_config['input_size'])
-            
-            # ONNX
-            onnx_path = output_dir / f"{weight_config['name']}.onnx"
-            convert_to_onnx(model_path, str(onnx_path), input_size)
+            # ONNX (parité vérifiée avec torch)
+            onnx_path = output_dir / f"{model_config['name']}.onnx"
+            export_model(name, output_path=str(onnx_path))
             
             # CoreML
-            coreml_path = output_dir / f"{weight_config['name']}.mlmodel"
-            convert_to_coreml(model_path, str(coreml_path), input_size)
+            model, _, input_shape, _ = build_eager_model(name)
+            coreml_path = output_dir / f"{model_config['name']}.mlmodel"
+            convert_to_coreml(model_path, str(coreml_path), (1, *input_shape), model=model)
         else:
             print(f"⚠️  Modèle non trouvé: {model_path}")
     
@@ -0,0 +1,152 @@
+"""
+Export ONNX des modèles par crop (Re-ID, poids, points clés, multi-tête) pour le backend onnxruntime
+Reconstruit chaque modèle depuis son checkpoint comme le fait le pipeline,
+exporte le graphe (axe batch dynamique), vérifie la parité des sorties avec
+torch puis compare les latences
+"""
+
+import argparse
+import copy
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+# Ajouter le répertoire parent au path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from inference.backends import ONNX_OPSET, OnnxRuntimeBackend, default_onnx_path, export_onnx, onnx_parity
+from inference.startup import load_config
+
+MODEL_CONFIG_PATH = "config/model_config.yaml"
+MODELS = ('reid', 'weight_cnn', 'keypoints', 'multihead')
+
+
+def model_section(config: dict, name: str) -> dict:
+    """Section de configuration d'un modèle"""
+    models_config = config['models']
+    return {
+        'reid': models_config['reid'],
+        'weight_cnn': models_config['weight']['cnn'],
+        'keypoints': models_config['weight']['geometric'],
+        'multihead': models_config['multihead']
+    }[name]
+
+
+def build_eager_model(name: str, config_path: str = MODEL_CONFIG_PATH):
+    """
+    Modèle torch eager fp32 construit depuis le checkpoint, comme dans le pipeline
+
+    Returns:
+        (modèle, checkpoint, forme d'entrée (C, H, W), section de configuration)
+    """
+    # Copie: la configuration mise en cache est partagée et en lecture seule
+    config = copy.deepcopy(load_config(config_path))
+    section = model_section(config, name)
+    # Composant construit en torch eager fp32
+    config.setdefault('compilation', {})['enabled'] = False
+    section['backend'] = 'torch'
+    section['precision'] = {'dtype': 'fp32', 'memory_format': 'contiguous'}
+    if name == 'reid':
+        from inference.reid import PigReID
+        component = PigReID(config_path=config_path, config=config)
+        return component.model, section['path'], (3, *component.input_size), section
+    if name == 'weight_cnn':
+        from inference.weight_estimator import WeightEstimator
+        component = WeightEstimator(config_path=config_path, config=config)
+        return component.model, section['path'], (3, *component.input_size), section
+    if name == 'multihead':
+        from inference.multihead import ConcatenatedHeads, MultiHeadPigNet, SharedBackboneModel
+        model_path = section.get('path', 'models/multihead/pig_multihead_resnet50.pt')
+        if not Path(model_path).exists():
+            # Même comportement que les autres modèles: export des poids aléatoires
+            model = ConcatenatedHeads(MultiHeadPigNet()).eval()
+            return model, model_path, (3, *section.get('input_size', [224, 224])), section
+        component = SharedBackboneModel(model_path, config_path=config_path, config=config)
+        return component.model, model_path, (3, *component.input_size), section
+    from inference.keypoints import KeypointDetector
+    component = KeypointDetector(config_path=config_path, config=config)
+    return component.model, section['keypoints_model'], (3, 256, 256), section
+
+
+def export_model(name: str, output_path: str = None, opset: int = ONNX_OPSET, tolerance: float = 1e-3,
+                 config_path: str = MODEL_CONFIG_PATH, benchmark_batch: int = 0) -> dict:
+    """
+    Exporte un modèle et vérifie la parité torch / ONNX Runtime
+
+    Le graphe est supprimé si l'écart dépasse `tolerance` (relatif à
+    l'amplitude des sorties) : le backend onnxruntime ne l'utilisera pas.
+    """
+    model, model_path, input_shape, section = build_eager_model(name, config_path)
+    if not Path(model_path).exists():
+        print(f"⚠️  {name}: checkpoint absent ({model_path}), export des poids aléatoires.")
+    output_path = output_path or section.get('onnx_path') or default_onnx_path(model_path)
+
+    start = time.perf_counter()
+    export_onnx(model, output_path, input_shape, checkpoint_path=model_path, opset=opset)
+    export_s = time.perf_counter() - start
+
+    parity = onnx_parity(model, output_path, input_shape)
+    parity_ok = parity['max_abs_error'] <= tolerance * max(1.0, parity['output_scale'])
+    result = {'name': name, 'path': output_path, 'export_s': export_s, 'parity_ok': parity_ok, **parity}
+    if not parity_ok:
+        Path(output_path).unlink()
+        print(f"❌ {name}: écart torch/ONNX {parity['max_abs_error']:.2e}, graphe supprimé")
+        return result
+    print(f"✅ {name}: {output_path} (écart max {parity['max_abs_error']:.1e})")
+
+    if benchmark_batch:
+        batch = torch.randn(benchmark_batch, *input_shape)
+        runner = OnnxRuntimeBackend(output_path, checkpoint_path=model_path, input_shape=input_shape)
+        with torch.inference_mode():
+            result['torch_ms'] = median_ms(lambda: model(batch))
+        result['onnx_ms'] = median_ms(lambda: runner(batch))
+    return result
+
+
+def median_ms(function, repeats: int = 5, warmup: int = 2) -> float:
+    timings = []
+    for i in range(warmup + repeats):
+        start = time.perf_counter()
+        function()
+        if i >= warmup:
+            timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--models', default=','.join(MODELS), help=f"Modèles à exporter ({', '.join(MODELS)})")
+    parser.add_argument('--opset', type=int, default=ONNX_OPSET)
+    parser.add_argument('--tolerance', type=float, default=1e-3,
+                        help="Écart max torch/ONNX, relatif à l'amplitude des sorties")
+    parser.add_argument('--benchmark-batch', type=int, default=8,
+                        help="Crops par forward pour comparer les latences (0: pas de mesure)")
+    args = parser.parse_args()
+
+    from inference.cpu_budget import apply_thread_budget
+    apply_thread_budget(load_config("config/inference_config.yaml")['inference'].get('performance', {}))
+
+    rows = []
+    for name in [model.strip() for model in args.models.split(',') if model.strip()]:
+        if name not in MODELS:
+            print(f"⚠️  Modèle inconnu: {name}")
+            continue
+        rows.append(export_model(name, opset=args.opset, tolerance=args.tolerance,
+                                 benchmark_batch=args.benchmark_batch))
+
+    print("=" * 76)
+    print(f"{'modèle':<12}{'parité':<10}{'écart max':>12}{'export (s)':>12}{'torch (ms)':>14}{'onnx (ms)':>12}")
+    for row in rows:
+        parity = '✅ ok' if row['parity_ok'] else '❌ échec'
+        timings = (f"{row['torch_ms']:>14.1f}{row['onnx_ms']:>12.1f}" if 'onnx_ms' in row
+                   else f"{'-':>14}{'-':>12}")
+        print(f"{row['name']:<12}{parity:<10}{row['max_abs_error']:>12.1e}{row['export_s']:>12.2f}{timings}")
+    print("=" * 76)
+    print("💡 Activer ensuite backend: onnxruntime pour ces modèles (model_config.yaml).")
+
+
+if __name__ == "__main__":
+    main()
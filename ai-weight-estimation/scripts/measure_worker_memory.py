@@ -0,0 +1,93 @@
+"""
+Mémoire des workers de l'API avec et sans poids partagés (startup.mmap_weights)
+Lance N processus (spawn, comme les workers uvicorn) qui construisent chacun le
+pipeline, puis relève RSS, PSS et USS de chaque worker dans /proc (Linux)
+"""
+
+import argparse
+import copy
+import multiprocessing as mp
+import sys
+from pathlib import Path
+
+# Ajouter le répertoire parent au path
+sys.path.append(str(Path(__file__).parent.parent))
+
+MODEL_CONFIG_PATH = "config/model_config.yaml"
+
+
+def memory_kb(pid: int) -> dict:
+    """RSS, PSS et USS (pages privées) d'un processus, en kB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1])
+    return {
+        'rss': values.get('Rss', 0),
+        'pss': values.get('Pss', 0),
+        'uss': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+    }
+
+
+def worker(mmap_weights: bool, ready, release):
+    """Construit le pipeline comme un worker de l'API puis attend la mesure"""
+    from inference.startup import load_config
+    # Copie: la configuration mise en cache est partagée et en lecture seule
+    model_config = copy.deepcopy(load_config(MODEL_CONFIG_PATH))
+    model_config.setdefault('startup', {})['mmap_weights'] = mmap_weights
+
+    from inference.predict import WeightEstimationPipeline
+    pipeline = WeightEstimationPipeline(model_config=model_config)
+    ready.put(mp.current_process().pid)
+    release.wait()
+    del pipeline
+
+
+def measure(n_workers: int, mmap_weights: bool) -> list:
+    """Mémoire de chaque worker une fois tous les pipelines chargés"""
+    context = mp.get_context('spawn')
+    ready, release = context.Queue(), context.Event()
+    processes = [context.Process(target=worker, args=(mmap_weights, ready, release)) for _ in range(n_workers)]
+    for process in processes:
+        process.start()
+
+    try:
+        pids = [ready.get(timeout=600) for _ in processes]
+        return [memory_kb(pid) for pid in pids]
+    finally:
+        release.set()
+        for process in processes:
+            process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=4, help="Nombre de workers (api.server.workers)")
+    parser.add_argument('--mode', choices=['both', 'copy', 'mmap'], default='both',
+                        help="copy: chargement classique, mmap: poids partagés")
+    args = parser.parse_args()
+
+    if not Path('/proc/self/smaps_rollup').exists():
+        print("❌ Mesure disponible uniquement sous Linux (/proc/<pid>/smaps_rollup)")
+        return
+
+    modes = {'both': [False, True], 'copy': [False], 'mmap': [True]}[args.mode]
+    rows = []
+    for mmap_weights in modes:
+        print(f"🧪 {args.workers} workers, mmap_weights={mmap_weights}...")
+        rows.append(('mmap' if mmap_weights else 'copy', measure(args.workers, mmap_weights)))
+
+    print("=" * 72)
+    print(f"{'mode':<8}{'RSS/worker (MB)':>18}{'PSS/worker (MB)':>18}{'USS/worker (MB)':>18}{'PSS total':>10}")
+    for name, workers in rows:
+        mean = {key: sum(w[key] for w in workers) / len(workers) / 1024 for key in ('rss', 'pss', 'uss')}
+        total_pss = sum(w['pss'] for w in workers) / 1024
+        print(f"{name:<8}{mean['rss']:>18.0f}{mean['pss']:>18.0f}{mean['uss']:>18.0f}{total_pss:>10.0f}")
+    print("=" * 72)
+    print("💡 PSS répartit les pages partagées entre processus: c'est la mémoire réellement consommée.")
+
+
+if __name__ == "__main__":
+    main()
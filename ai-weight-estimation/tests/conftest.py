@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Ajouter le répertoire parent au path (imports `inference.*` comme les scripts)
+sys.path.append(str(Path(__file__).parent.parent))
@@ -0,0 +1,195 @@
+"""
+Galerie Re-ID persistante : reprise après crash et accès concurrents
+(threads d'un worker, workers séparés pendant une compaction)
+"""
+
+import json
+import multiprocessing
+import threading
+
+import numpy as np
+import pytest
+
+from inference.gallery import FeatureGallery, PersistentFeatureGallery
+
+DIM = 16
+
+
+def random_vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+
+
+def ops_lines(gallery: PersistentFeatureGallery) -> list:
+    """Entrées du journal de la génération active (toutes doivent être complètes)"""
+    data = (gallery.path / f"ops.{gallery._generation}.jsonl").read_bytes()
+    assert data.endswith(b'\n')
+    return [json.loads(line) for line in data.splitlines()]
+
+
+def test_replay_after_crash(tmp_path):
+    vectors = random_vectors(8)
+    gallery = PersistentFeatureGallery(DIM, tmp_path, min_compact_rows=10_000)
+    for i in range(5):
+        gallery.add(f"PORC{i:03d}", vectors[i], {'name': f"porc {i}"}, [0, 0, 10, 10])
+    gallery.add("PORC000", vectors[5])  # Deuxième vue: centroïde réécrit sur place
+    gallery.remove("PORC003")
+    gallery.update_metadata("PORC001", {'name': "renommé"})
+    expected = {pig_id: gallery.get(pig_id) for pig_id in gallery.ids}
+    reservoir = gallery.reservoir("PORC000")
+
+    # Crash au milieu d'un ajout: centroïde partiel et entrée de journal incomplète
+    generation = gallery._generation
+    with open(tmp_path / f"embeddings.{generation}.f32", 'ab') as f:
+        f.write(b'\x00' * 6)
+    with open(tmp_path / f"ops.{generation}.jsonl", 'ab') as f:
+        f.write(b'{"op": "add", "id": "PORC0')
+    del gallery
+
+    reopened = PersistentFeatureGallery(DIM, tmp_path, min_compact_rows=10_000)
+    assert reopened.ids == list(expected)
+    for pig_id, vector in expected.items():
+        np.testing.assert_allclose(reopened.get(pig_id), vector)
+    np.testing.assert_allclose(reopened.reservoir("PORC000"), reservoir)
+    assert "PORC003" not in reopened
+    assert reopened.records["PORC001"]['metadata'] == {'name': "renommé"}
+    assert reopened.records["PORC000"]['metadata'] == {'name': "porc 0"}  # Deuxième vue sans métadonnées
+    assert reopened.records["PORC002"]['bbox'] == [0, 0, 10, 10]
+
+    # L'écriture suivante remplace l'entrée incomplète et la ligne partielle
+    reopened.add("PORC009", vectors[6])
+    again = PersistentFeatureGallery(DIM, tmp_path, min_compact_rows=10_000)
+    assert again.ids == list(expected) + ["PORC009"]
+    np.testing.assert_allclose(again.get("PORC009"), FeatureGallery.normalize(vectors[6]), rtol=1e-6)
+    assert [op['id'] for op in ops_lines(again)][-1] == "PORC009"
+
+
+def test_views_update_centroid_in_place(tmp_path):
+    """Les pesées d'un porc déjà enregistré ne font pas grossir la matrice des centroïdes"""
+    gallery = PersistentFeatureGallery(DIM, tmp_path, reservoir_size=2, min_compact_rows=10_000)
+    vectors = random_vectors(40, seed=7)
+    gallery.add("PORC000", vectors[0])
+    gallery.add("PORC001", vectors[1])
+    for vector in vectors[2:]:
+        gallery.add("PORC000", vector)
+
+    embeddings = tmp_path / f"embeddings.{gallery._generation}.f32"
+    shots = tmp_path / f"shots.{gallery._generation}.f32"
+    assert embeddings.stat().st_size == 2 * DIM * 4
+    assert shots.stat().st_size == 3 * DIM * 4  # Deux cases pour PORC000, une pour PORC001
+    assert gallery._rows == {"PORC000": 0, "PORC001": 1}
+
+    reopened = PersistentFeatureGallery(DIM, tmp_path, reservoir_size=2)
+    np.testing.assert_allclose(reopened.get("PORC000"), gallery.get("PORC000"))
+    np.testing.assert_allclose(reopened.reservoir("PORC000"), gallery.reservoir("PORC000"))
+    expected = FeatureGallery.normalize(np.mean([FeatureGallery.normalize(v) for v in np.delete(vectors, 1, 0)], 0))
+    np.testing.assert_allclose(reopened.get("PORC000"), expected, rtol=1e-4, atol=1e-6)
+
+
+def test_concurrent_writers_keep_log_intact(tmp_path):
+    """Deux workers (galeries distinctes) et plusieurs threads écrivent le même journal"""
+    workers = [PersistentFeatureGallery(DIM, tmp_path, min_compact_rows=10_000) for _ in range(2)]
+    vectors = random_vectors(64, seed=1)
+    errors = []
+
+    def write(thread: int):
+        try:
+            for i in range(thread, len(vectors), 4):
+                workers[i % 2].add(f"PORC{i:03d}", vectors[i])
+                workers[(i + 1) % 2].refresh()
+        except Exception as e:  # pragma: no cover - rapporté ci-dessous
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(t,)) for t in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    reopened = PersistentFeatureGallery(DIM, tmp_path, min_compact_rows=10_000)
+    assert sorted(reopened.ids) == [f"PORC{i:03d}" for i in range(len(vectors))]
+    assert len(ops_lines(reopened)) == len(vectors)
+    for worker in workers:
+        worker.refresh()
+        assert sorted(worker.ids) == sorted(reopened.ids)
+
+
+def test_refresh_during_compaction_threads(tmp_path):
+    """Recherches et refresh d'un thread pendant que l'autre ajoute, retire et compacte"""
+    gallery = PersistentFeatureGallery(DIM, tmp_path, compact_ratio=0.3, min_compact_rows=8,
+                                       reservoir_size=2, ambiguity_margin=1.0)
+    vectors = random_vectors(200, seed=2)
+    queries = random_vectors(6, seed=3)
+    for i in range(20):
+        gallery.add(f"PORC{i:03d}", vectors[i])
+
+    errors = []
+    done = threading.Event()
+
+    def write():
+        try:
+            for i, vector in enumerate(vectors):
+                gallery.add(f"PORC{i % 20:03d}", vector)
+                if i % 5 == 0:
+                    gallery.remove(f"PORC{(i * 7) % 20:03d}")
+        except Exception as e:  # pragma: no cover - rapporté ci-dessous
+            errors.append(e)
+        finally:
+            done.set()
+
+    def read():
+        try:
+            while not done.is_set():
+                gallery.refresh()
+                gallery.search(queries)
+                gallery.search(queries, candidate_ids=[f"PORC{i:03d}" for i in range(0, 20, 3)])
+        except Exception as e:  # pragma: no cover - rapporté ci-dessous
+            errors.append(e)
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors, errors
+    assert gallery._generation > 0  # Au moins une compaction pendant les lectures
+    reopened = PersistentFeatureGallery(DIM, tmp_path)
+    assert reopened.ids == gallery.ids
+    for pig_id in gallery.ids:
+        np.testing.assert_allclose(reopened.get(pig_id), gallery.get(pig_id))
+
+
+def _compact_repeatedly(path: str, rounds: int):
+    """Worker qui ajoute une vue puis compacte, en boucle"""
+    gallery = PersistentFeatureGallery(DIM, path, min_compact_rows=10_000)
+    for i, vector in enumerate(random_vectors(rounds, seed=4)):
+        gallery.add(f"PORC{i % 10:03d}", vector)
+        gallery.compact()
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason="fork requis")
+def test_refresh_during_compaction_processes(tmp_path):
+    """Un worker relit la galerie pendant qu'un autre processus la compacte"""
+    gallery = PersistentFeatureGallery(DIM, tmp_path, min_compact_rows=10_000)
+    for i, vector in enumerate(random_vectors(10, seed=5)):
+        gallery.add(f"PORC{i:03d}", vector)
+    queries = random_vectors(4, seed=6)
+
+    compactor = multiprocessing.get_context('fork').Process(target=_compact_repeatedly,
+                                                             args=(str(tmp_path), 60))
+    compactor.start()
+    refreshes = 0
+    while compactor.is_alive():
+        gallery.refresh()
+        gallery.search(queries)
+        refreshes += 1
+    compactor.join()
+
+    assert compactor.exitcode == 0
+    gallery.refresh()
+    assert gallery._generation == 60 and refreshes > 0
+    reopened = PersistentFeatureGallery(DIM, tmp_path)
+    assert sorted(reopened.ids) == sorted(gallery.ids)
+    for pig_id in gallery.ids:
+        np.testing.assert_allclose(reopened.get(pig_id), gallery.get(pig_id))
@@ -0,0 +1,37 @@
+"""
+Fusion des détections par tuiles
+"""
+
+import numpy as np
+
+from inference.detections import DetectionBatch
+from inference.postprocessing import ResultPostprocessor
+
+
+def batch(*rows) -> DetectionBatch:
+    """Boîtes [x1, y1, x2, y2, confiance] de la classe 0"""
+    data = np.array(rows, dtype=np.float32).reshape(-1, 5)
+    return DetectionBatch(data[:, :4], data[:, 4], np.zeros(len(data), dtype=np.int32))
+
+
+def test_boxes_of_the_same_tile_are_not_merged():
+    # Porcelet couché contre un porc : contenu dans sa boîte, mais la NMS du détecteur les a séparés
+    tile = batch([10, 10, 300, 200, 0.9], [20, 20, 90, 80, 0.8])
+    merged = ResultPostprocessor.merge_tiled_detections([tile], [(0, 0)], 0.5)
+    assert len(merged) == 2
+
+
+def test_box_cut_by_inner_border_loses_to_complete_box():
+    # Tuiles 640 px en x=0 et x=512 ; le porc (x 560-700) est coupé par le bord droit de la première
+    left = batch([560, 100, 640, 200, 0.9])
+    right = batch([48, 100, 188, 200, 0.8])
+    merged = ResultPostprocessor.merge_tiled_detections(
+        [left, right], [(0, 0), (512, 0)], 0.5,
+        tile_sizes=[(640, 640), (640, 640)], image_size=(1152, 640)
+    )
+    np.testing.assert_allclose(merged.boxes, [[560, 100, 700, 200]])
+    np.testing.assert_allclose(merged.confidences, [0.8])
+
+    # Sans tailles de tuiles : la boîte la plus confiante (coupée) l'emporte
+    unweighted = ResultPostprocessor.merge_tiled_detections([left, right], [(0, 0), (512, 0)], 0.5)
+    np.testing.assert_allclose(unweighted.boxes, [[560, 100, 640, 200]])
@@ -0,0 +1,129 @@
+"""
+Re-ID : index approché hors du chemin des requêtes, affectation aux porcs attendus
+"""
+
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch.nn as nn
+import yaml
+
+from inference.ann_index import IVFPQIndex
+from inference.reid import PigReID
+
+CONFIG_PATH = Path(__file__).parent.parent / "config" / "model_config.yaml"
+DIM = 512
+IMAGE = np.zeros((8, 8, 3), dtype=np.uint8)
+
+
+def make_reid(tmp_path: Path, monkeypatch, ann: dict = None) -> PigReID:
+    """PigReID sur une galerie persistante de test, petit modèle à la place du ResNet50"""
+    config_file = tmp_path / "model_config.yaml"
+    if not config_file.exists():
+        config = yaml.safe_load(CONFIG_PATH.read_text())
+        reid_config = config['models']['reid']
+        reid_config['path'] = str(tmp_path / "absent.pt")
+        reid_config['gallery'] = {'persistent': True, 'path': str(tmp_path / "gallery"),
+                                  'reservoir_size': 2, 'ambiguity_margin': 0.0}
+        reid_config['ann'] = {'enabled': False, **(ann or {})}
+        config['compilation']['enabled'] = False
+        config_file.write_text(yaml.safe_dump(config))
+
+    def small_model(self, model_path):
+        return nn.Sequential(nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(3, self.feature_dim))
+
+    monkeypatch.setattr(PigReID, '_load_model', small_model)
+    return PigReID(config_path=str(config_file))
+
+
+def use_vectors(monkeypatch, reid: PigReID, vectors: np.ndarray):
+    """La bbox [i, 0, 1, 1] a pour features vectors[i]"""
+    monkeypatch.setattr(reid, 'extract_features', lambda image, bbox: vectors[bbox[0]])
+    monkeypatch.setattr(reid, 'extract_features_batch',
+                        lambda image, bboxes, crops=None: np.stack([vectors[bbox[0]] for bbox in bboxes]))
+
+
+def test_register_pig_never_trains_ann_index(tmp_path, monkeypatch):
+    calls, release = [], threading.Event()
+    train = IVFPQIndex.train
+
+    def blocking_train(self, vectors):
+        calls.append(threading.current_thread())
+        release.wait(30)
+        train(self, vectors)
+
+    monkeypatch.setattr(IVFPQIndex, 'train', blocking_train)
+    ann = {'enabled': True, 'min_gallery_size': 64, 'n_lists': 4, 'n_subvectors': 8, 'n_probe': 4}
+    reid = make_reid(tmp_path, monkeypatch, ann)
+    vectors = np.random.default_rng(0).normal(size=(80, DIM)).astype(np.float32)
+    use_vectors(monkeypatch, reid, vectors)
+
+    for i in range(len(vectors)):
+        reid.register_pig(f"PORC{i:03d}", IMAGE, [i, 0, 1, 1])
+
+    # Entraînement en cours dans un autre thread : recherche exacte en attendant
+    assert calls and all(thread is not threading.main_thread() for thread in calls)
+    assert reid.ann_index is None
+    assert [match[0] for match in reid._search(vectors[:5], 0.5)] == [f"PORC{i:03d}" for i in range(5)]
+
+    release.set()
+    reid._ann_thread.join(60)
+    assert reid.ann_index is not None and len(reid.ann_index) == len(vectors)
+    assert (tmp_path / "gallery" / "ann_index.npz").exists()
+    assert reid._search(vectors[7:8], 0.5)[0][0] == "PORC007"
+
+    # Un autre worker charge l'index sauvegardé sans entraîner
+    calls.clear()
+    other = make_reid(tmp_path, monkeypatch)
+    assert other.ann_index is not None and len(other.ann_index) == len(vectors)
+    assert not calls
+
+
+def test_assign_expected_applies_threshold_before_matching(tmp_path, monkeypatch):
+    reid = make_reid(tmp_path, monkeypatch)
+    use_vectors(monkeypatch, reid, np.zeros((2, DIM), dtype=np.float32))
+    reid.gallery.add("PORC000", np.eye(DIM, dtype=np.float32)[0])
+    reid.gallery.add("PORC001", np.eye(DIM, dtype=np.float32)[1])
+    scores = np.array([[0.9, 0.1], [0.85, 0.0]], dtype=np.float32)
+    monkeypatch.setattr(reid.gallery, 'score_matrix', lambda queries, candidates: scores)
+    detections = [{'bbox': [0, 0, 1, 1]}, {'bbox': [1, 0, 1, 1]}]
+
+    # Sans seuil préalable, det0 -> PORC001 (0.1) et det1 -> PORC000 : aucun identifié
+    (pig_id, score), missing = reid._assign_expected(IMAGE, detections, ["PORC000", "PORC001"], 0.7)
+    assert pig_id == "PORC000" and score == pytest.approx(0.9) and missing is None
+
+
+def test_assign_expected_duplicate_and_missing_ids(tmp_path, monkeypatch):
+    reid = make_reid(tmp_path, monkeypatch)
+    vectors = np.eye(DIM, dtype=np.float32)[:3]
+    use_vectors(monkeypatch, reid, vectors)
+    for i in range(2):
+        reid.gallery.add(f"PORC{i:03d}", vectors[i])
+    detections = [{'bbox': [i, 0, 1, 1]} for i in range(3)]
+
+    # Doublons : un porc attendu n'est affecté qu'une fois ; absent de la galerie : ignoré
+    result = reid._assign_expected(IMAGE, detections, ["PORC001", "PORC000", "PORC001", "PORC404"], 0.5)
+    assert [match and match[0] for match in result] == ["PORC000", "PORC001", None]
+    assert reid._assign_expected(IMAGE, detections, ["PORC404"], 0.5) == [None, None, None]
+
+
+def test_backend_metadata_never_replaces_registered_pig(tmp_path, monkeypatch):
+    reid = make_reid(tmp_path, monkeypatch)
+    vectors = np.eye(DIM, dtype=np.float32)[:2]
+    use_vectors(monkeypatch, reid, vectors)
+    reid.register_pig("PORC000", IMAGE, [0, 0, 1, 1], {'name': "Rosie"})
+
+    # Animal enregistré : métadonnées mises à jour et persistées, features conservées
+    assert reid.sync_metadata("PORC000", {'name': "Rosie", 'race': "Large White"})
+    assert reid.pig_database["PORC000"]['features'] is not None
+    assert reid.gallery.records["PORC000"]['metadata']['race'] == "Large White"
+
+    # Animal sans image : entrée en attente, dont les métadonnées passent à la première vue
+    assert not reid.sync_metadata("PORC001", {'name': "Truffe"})
+    assert reid.pig_database["PORC001"]['features'] is None
+    reid.register_pig("PORC001", IMAGE, [1, 0, 1, 1])
+    reid.register_pig("PORC001", IMAGE, [1, 0, 1, 1])
+    assert reid.pig_database["PORC001"]['metadata'] == {'name': "Truffe"}
+    assert reid.gallery.records["PORC001"]['metadata'] == {'name': "Truffe"}
@@ -0,0 +1,255 @@
+"""
+Script d'entraînement du modèle multi-tête (backbone partagé)
+Fine-tuning conjoint des têtes Re-ID, poids et points clés sur un seul ResNet50
+"""
+
+import sys
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import Dataset, DataLoader
+from torchvision import transforms
+from pathlib import Path
+import yaml
+import numpy as np
+from PIL import Image
+import pandas as pd
+from tqdm import tqdm
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from inference.multihead import MultiHeadPigNet
+
+NUM_KEYPOINTS = 18
+
+
+class MultiTaskDataset(Dataset):
+    """
+    Dataset multi-tâches
+
+    Réunit les annotations existantes : chaque ligne n'a pas forcément toutes
+    les étiquettes, les pertes manquantes sont masquées.
+    """
+
+    def __init__(self, images_dir: str, reid_file: Path, weights_file: Path, keypoints_file: Path,
+                 pig_to_class: dict = None, transform=None, input_size=(224, 224)):
+        """
+        Args:
+            images_dir: Dossier contenant les images
+            reid_file: CSV Re-ID (image_path, bbox_x1, bbox_y1, bbox_x2, bbox_y2, pig_id)
+            weights_file: CSV poids (image_path, bbox_x1, bbox_y1, bbox_x2, bbox_y2, weight_kg)
+            keypoints_file: CSV points clés (image_path, bbox_*, kp{i}_x, kp{i}_y, kp{i}_v
+                            avec x, y relatifs à la bbox) - optionnel
+            pig_to_class: Mapping pig_id -> classe (celui du train pour la validation)
+            transform: Transformations à appliquer
+        """
+        self.images_dir = Path(images_dir)
+        frames = [pd.read_csv(path) for path in (reid_file, weights_file, keypoints_file) if Path(path).exists()]
+        if not frames:
+            raise FileNotFoundError(f"Aucune annotation trouvée ({reid_file}, {weights_file}, {keypoints_file})")
+        self.annotations = pd.concat(frames, ignore_index=True, sort=False)
+        self.transform = transform or transforms.Compose([
+            transforms.Resize(tuple(input_size)),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+        ])
+
+        if pig_to_class is None:
+            unique_pigs = self.annotations['pig_id'].dropna().unique() if 'pig_id' in self.annotations else []
+            pig_to_class = {pig_id: idx for idx, pig_id in enumerate(unique_pigs)}
+        self.pig_to_class = pig_to_class
+        self.num_classes = len(pig_to_class)
+
+        self.keypoint_columns = [f"kp{i}_{axis}" for i in range(NUM_KEYPOINTS) for axis in ('x', 'y', 'v')]
+
+    def __len__(self):
+        return len(self.annotations)
+
+    def __getitem__(self, idx):
+        row = self.annotations.iloc[idx]
+
+        # Charger l'image et extraire la région du porc
+        image = Image.open(self.images_dir / row['image_path']).convert('RGB')
+        x1, y1, x2, y2 = int(row['bbox_x1']), int(row['bbox_y1']), int(row['bbox_x2']), int(row['bbox_y2'])
+        pig_roi = self.transform(image.crop((x1, y1, x2, y2)))
+
+        # Étiquettes absentes: -1 (classe) ou NaN (poids, points clés)
+        pig_id = row.get('pig_id')
+        class_idx = self.pig_to_class.get(pig_id, -1) if pd.notna(pig_id) else -1
+        weight = float(row['weight_kg']) if 'weight_kg' in row and pd.notna(row['weight_kg']) else float('nan')
+        keypoints = np.array([float(row[c]) if c in row and pd.notna(row[c]) else np.nan
+                              for c in self.keypoint_columns], dtype=np.float32)
+
+        return (pig_roi, torch.tensor(class_idx, dtype=torch.long),
+                torch.tensor(weight, dtype=torch.float32), torch.from_numpy(keypoints))
+
+
+def multitask_loss(outputs, classifier, labels, weights, keypoints, loss_weights):
+    """
+    Somme pondérée des pertes disponibles pour le batch
+
+    Returns:
+        (perte totale, dict des pertes par tâche)
+    """
+    device = outputs['reid'].device
+    total = torch.zeros((), device=device)
+    parts = {}
+
+    has_class = labels >= 0
+    if has_class.any():
+        logits = classifier(outputs['reid'][has_class])
+        parts['reid'] = nn.functional.cross_entropy(logits, labels[has_class])
+
+    has_weight = ~torch.isnan(weights)
+    if has_weight.any():
+        parts['weight'] = nn.functional.mse_loss(outputs['weight'][has_weight], weights[has_weight])
+
+    has_keypoints = ~torch.isnan(keypoints).any(dim=1)
+    if has_keypoints.any():
+        predicted = outputs['keypoints'][has_keypoints].view(-1, NUM_KEYPOINTS, 3)
+        target = keypoints[has_keypoints].view(-1, NUM_KEYPOINTS, 3)
+        visible = target[..., 2:3] > 0
+        coords = ((predicted[..., :2] - target[..., :2]) ** 2 * visible).sum() / visible.sum().clamp(min=1)
+        visibility = nn.functional.binary_cross_entropy_with_logits(predicted[..., 2], (target[..., 2] > 0).float())
+        parts['keypoints'] = coords + visibility
+
+    for name, loss in parts.items():
+        total = total + loss_weights.get(name, 1.0) * loss
+    return total, {name: loss.item() for name, loss in parts.items()}
+
+
+def train_multihead_model(config_path: str = "config/config.yaml"):
+    """
+    Entraîne le modèle multi-tête
+
+    Le backbone et les têtes sont initialisés depuis les modèles séparés
+    existants (s'ils sont entraînés), puis affinés conjointement : d'abord
+    les têtes seules (backbone gelé), puis l'ensemble.
+
+    Args:
+        config_path: Chemin vers le fichier de configuration
+    """
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+
+    training_config = config['training']['multihead']
+    paths_config = config['paths']
+    models_config = config['models']
+    input_size = models_config['multihead'].get('input_size', [224, 224])
+    feature_dim = models_config['reid'].get('feature_dim', 512)
+    loss_weights = training_config.get('loss_weights', {})
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    print(f"Utilisation de: {device}")
+
+    annotations_dir = Path(paths_config['annotations_dir'])
+    train_dataset = MultiTaskDataset(
+        images_dir=paths_config['images_dir'],
+        reid_file=annotations_dir / 'train_reid.csv',
+        weights_file=annotations_dir / 'train_weights.csv',
+        keypoints_file=annotations_dir / 'train_keypoints.csv',
+        # Pas de flip horizontal: il inverserait les points clés gauche/droite
+        transform=transforms.Compose([
+            transforms.Resize(tuple(input_size)),
+            transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+        ]),
+        input_size=input_size
+    )
+    val_dataset = MultiTaskDataset(
+        images_dir=paths_config['images_dir'],
+        reid_file=annotations_dir / 'val_reid.csv',
+        weights_file=annotations_dir / 'val_weights.csv',
+        keypoints_file=annotations_dir / 'val_keypoints.csv',
+        pig_to_class=train_dataset.pig_to_class,
+        input_size=input_size
+    )
+
+    train_loader = DataLoader(train_dataset, batch_size=training_config['batch_size'], shuffle=True)
+    val_loader = DataLoader(val_dataset, batch_size=training_config['batch_size'], shuffle=False)
+
+    # Modèle initialisé depuis les checkpoints séparés
+    model = MultiHeadPigNet(feature_dim=feature_dim, num_keypoints=NUM_KEYPOINTS, pretrained=True)
+    loaded = model.load_separate_checkpoints(
+        reid_path=models_config['reid']['path'],
+        weight_path=models_config['weight_estimation']['path'],
+        keypoints_path=models_config.get('keypoints', {}).get('path', 'models/weight/keypoints_detector.pt')
+    )
+    print(f"Initialisation depuis: {', '.join(loaded) if loaded else 'ImageNet'}")
+    model = model.to(device)
+    classifier = nn.Linear(feature_dim, max(train_dataset.num_classes, 1)).to(device)
+
+    optimizer = optim.Adam(list(model.parameters()) + list(classifier.parameters()),
+                           lr=training_config['learning_rate'])
+    scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=5)
+
+    best_val_loss = float('inf')
+    model_path = Path(models_config['multihead']['path'])
+    model_path.parent.mkdir(parents=True, exist_ok=True)
+    head_only_epochs = training_config.get('head_only_epochs', 0)
+
+    for epoch in range(training_config['epochs']):
+        # Backbone gelé pendant les premières epochs
+        for param in model.backbone.parameters():
+            param.requires_grad = epoch >= head_only_epochs
+
+        model.train()
+        classifier.train()
+        train_loss = 0.0
+
+        for images, labels, weights, keypoints in tqdm(train_loader, desc=f"Epoch {epoch+1}/{training_config['epochs']} [Train]"):
+            images, labels = images.to(device), labels.to(device)
+            weights, keypoints = weights.to(device), keypoints.to(device)
+
+            optimizer.zero_grad()
+            loss, _ = multitask_loss(model(images), classifier, labels, weights, keypoints, loss_weights)
+            loss.backward()
+            optimizer.step()
+            train_loss += loss.item()
+
+        train_loss /= len(train_loader)
+
+        # Validation
+        model.eval()
+        classifier.eval()
+        val_loss = 0.0
+        val_parts = {}
+
+        with torch.no_grad():
+            for images, labels, weights, keypoints in tqdm(val_loader, desc=f"Epoch {epoch+1}/{training_config['epochs']} [Val]"):
+                images, labels = images.to(device), labels.to(device)
+                weights, keypoints = weights.to(device), keypoints.to(device)
+
+                loss, parts = multitask_loss(model(images), classifier, labels, weights, keypoints, loss_weights)
+                val_loss += loss.item()
+                for name, value in parts.items():
+                    val_parts[name] = val_parts.get(name, 0.0) + value / len(val_loader)
+
+        val_loss /= len(val_loader)
+        scheduler.step(val_loss)
+
+        details = ', '.join(f"{name}: {value:.4f}" for name, value in val_parts.items())
+        print(f"Epoch {epoch+1}: Train Loss: {train_loss:.4f}, Val Loss: {val_loss:.4f} ({details})")
+
+        if val_loss < best_val_loss:
+            best_val_loss = val_loss
+            torch.save({
+                'model_state_dict': model.state_dict(),
+                'classifier_state_dict': classifier.state_dict(),
+                'optimizer_state_dict': optimizer.state_dict(),
+                'epoch': epoch,
+                'val_loss': val_loss,
+                'val_losses': val_parts,
+                'feature_dim': feature_dim,
+                'num_keypoints': NUM_KEYPOINTS,
+                'input_size': list(input_size),
+                'pig_to_class': train_dataset.pig_to_class
+            }, model_path)
+            print(f"Meilleur modèle sauvegardé (Val Loss: {val_loss:.4f})")
+
+    print(f"Entraînement terminé! Modèle sauvegardé dans: {model_path}")
+
+
+if __name__ == "__main__":
+    train_multihead_model()
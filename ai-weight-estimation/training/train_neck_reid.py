@@ -0,0 +1,185 @@
+"""
+Script d'entraînement de la tête Re-ID « neck »
+Apprend la projection des features du détecteur YOLOv8 (ROI-align dans chaque
+boîte) vers un embedding Re-ID, à partir des annotations Re-ID existantes
+"""
+
+import sys
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from pathlib import Path
+import yaml
+import numpy as np
+import cv2
+import pandas as pd
+from tqdm import tqdm
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from inference.detector import PigDetector
+from inference.neck_reid import NeckEmbeddingHead
+
+
+def extract_pooled_features(detector: PigDetector, head: NeckEmbeddingHead, images_dir: str,
+                            annotations_file: Path, pig_to_class: dict = None):
+    """
+    ROI-align des features du neck pour chaque annotation
+
+    Le détecteur est gelé et le ROI-align n'a pas de paramètres : les régions
+    poolées sont calculées une seule fois (un forward du détecteur par image),
+    seules la réduction et la projection sont ensuite entraînées.
+
+    Args:
+        annotations_file: CSV avec colonnes image_path, bbox_x1, bbox_y1, bbox_x2, bbox_y2, pig_id
+        pig_to_class: Mapping pig_id -> classe (celui du train pour la validation)
+
+    Returns:
+        (régions poolées [(N, C_l, *pool_size)], classes (N,), pig_to_class)
+    """
+    annotations = pd.read_csv(annotations_file)
+    if pig_to_class is None:
+        pig_to_class = {pig_id: idx for idx, pig_id in enumerate(annotations['pig_id'].unique())}
+    annotations = annotations[annotations['pig_id'].isin(pig_to_class)]
+
+    pooled_levels, labels = [], []
+    for image_path, rows in tqdm(annotations.groupby('image_path'), desc=f"Features {annotations_file.name}"):
+        image = cv2.imread(str(Path(images_dir) / image_path))
+        if image is None:
+            continue
+        _, features = detector.detect_with_features([image])
+        bboxes = rows[['bbox_x1', 'bbox_y1', 'bbox_x2', 'bbox_y2']].to_numpy()
+        rois = NeckEmbeddingHead.letterbox_rois(bboxes, features[0]['letterbox']).to(features[0]['maps'][0].device)
+        with torch.no_grad():
+            pooled_levels.append([level.cpu() for level in head.pool(features[0]['maps'], rois)])
+        labels.extend(pig_to_class[pig_id] for pig_id in rows['pig_id'])
+
+    pooled = [torch.cat([levels[l] for levels in pooled_levels]) for l in range(len(head.strides))]
+    return pooled, torch.tensor(labels, dtype=torch.long), pig_to_class
+
+
+def identification_accuracy(head: NeckEmbeddingHead, gallery_pooled, gallery_labels, query_pooled,
+                            query_labels) -> float:
+    """Précision top-1 par plus proche centroïde (même protocole que la galerie Re-ID)"""
+    with torch.no_grad():
+        gallery = head.forward_pooled(gallery_pooled)
+        queries = head.forward_pooled(query_pooled)
+
+    classes = gallery_labels.unique()
+    centroids = torch.stack([gallery[gallery_labels == c].mean(0) for c in classes])
+    centroids = nn.functional.normalize(centroids, p=2, dim=1)
+    predicted = classes[(queries @ centroids.T).argmax(dim=1)]
+    return (predicted == query_labels).float().mean().item() * 100
+
+
+def train_neck_reid_model(config_path: str = "config/config.yaml",
+                          model_config_path: str = "config/model_config.yaml"):
+    """
+    Entraîne la tête Re-ID neck
+
+    Args:
+        config_path: Configuration d'entraînement (chemins, hyperparamètres)
+        model_config_path: Configuration des modèles (détecteur, Re-ID neck)
+    """
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    with open(model_config_path, 'r') as f:
+        model_config = yaml.safe_load(f)
+
+    training_config = config['training']['neck_reid']
+    paths_config = config['paths']
+    reid_config = model_config['models']['reid']
+    neck_config = reid_config.get('neck', {})
+
+    detector = PigDetector(config_path=model_config_path)
+    if detector.model is None:
+        raise RuntimeError("La Re-ID neck nécessite le backend de détection torch (ultralytics)")
+    device = next(detector.model.model.parameters()).device
+    print(f"Utilisation de: {device}")
+
+    # Canaux et strides des entrées de la tête Detect
+    _, probe = detector.detect_with_features([np.zeros((64, 64, 3), dtype=np.uint8)])
+    in_channels = [level.shape[1] for level in probe[0]['maps']]
+    strides = probe[0]['strides']
+    print(f"Neck: canaux {in_channels}, strides {strides}")
+
+    head = NeckEmbeddingHead(
+        in_channels, strides,
+        feature_dim=reid_config.get('feature_dim', 512),
+        reduced_channels=neck_config.get('reduced_channels', 128),
+        pool_size=neck_config.get('pool_size', [4, 4])
+    ).to(device)
+
+    annotations_dir = Path(paths_config['annotations_dir'])
+    train_pooled, train_labels, pig_to_class = extract_pooled_features(
+        detector, head, paths_config['images_dir'], annotations_dir / 'train_reid.csv')
+    val_pooled, val_labels, _ = extract_pooled_features(
+        detector, head, paths_config['images_dir'], annotations_dir / 'val_reid.csv', pig_to_class)
+
+    # Classifieur cosinus: les embeddings sont normalisés, l'échelle rend les logits exploitables
+    classifier = nn.Linear(head.feature_dim, len(pig_to_class), bias=False).to(device)
+    scale = training_config.get('logit_scale', 16.0)
+
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(list(head.parameters()) + list(classifier.parameters()),
+                           lr=training_config['learning_rate'])
+    scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='max', factor=0.5, patience=5)
+
+    best_val_acc = -1.0
+    model_path = Path(neck_config.get('path', 'models/reid/neck_reid_head.pt'))
+    model_path.parent.mkdir(parents=True, exist_ok=True)
+    batch_size = training_config['batch_size']
+
+    for epoch in range(training_config['epochs']):
+        head.train()
+        train_loss = 0.0
+        order = torch.randperm(len(train_labels))
+
+        for start in range(0, len(order), batch_size):
+            index = order[start:start + batch_size]
+            if len(index) < 2:  # BatchNorm1d
+                continue
+            pooled = [level[index].to(device) for level in train_pooled]
+            labels = train_labels[index].to(device)
+
+            optimizer.zero_grad()
+            embeddings = head.forward_pooled(pooled)
+            logits = scale * embeddings @ nn.functional.normalize(classifier.weight, dim=1).T
+            loss = criterion(logits, labels)
+            loss.backward()
+            optimizer.step()
+            train_loss += loss.item() * len(index)
+
+        train_loss /= len(train_labels)
+
+        # Validation: identification des vues de validation contre la galerie du train
+        head.eval()
+        val_acc = identification_accuracy(
+            head, [level.to(device) for level in train_pooled], train_labels.to(device),
+            [level.to(device) for level in val_pooled], val_labels.to(device))
+        scheduler.step(val_acc)
+
+        print(f"Epoch {epoch+1}/{training_config['epochs']}: Train Loss: {train_loss:.4f}, Val Top-1: {val_acc:.2f}%")
+
+        if val_acc > best_val_acc:
+            best_val_acc = val_acc
+            torch.save({
+                'model_state_dict': head.state_dict(),
+                'in_channels': in_channels,
+                'strides': strides,
+                'feature_dim': head.feature_dim,
+                'reduced_channels': head.reduced_channels,
+                'pool_size': list(head.pool_size),
+                'detector_path': model_config['models']['detection'].get('path'),
+                'epoch': epoch,
+                'val_top1': val_acc,
+                'pig_to_class': pig_to_class
+            }, model_path)
+            print(f"Meilleure tête sauvegardée (Val Top-1: {val_acc:.2f}%)")
+
+    print(f"Entraînement terminé! Tête sauvegardée dans: {model_path}")
+    print("💡 Comparaison avec PigReID: python scripts/benchmark_neck_reid.py")
+
+
+if __name__ == "__main__":
+    train_neck_reid_model()